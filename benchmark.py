@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+'''
+Benchmarks for ProtoDUNE-VD geometry construction
+
+Builds geometries in-process and reports the wall time of each build
+phase together with the size of the GDML output.
+
+    python benchmark.py crp-array protodune_vd.cfg --sizes 4x2 8x4 16x8
+    python benchmark.py cathode-frame protodune_vd.cfg
+    python benchmark.py pd-layout protodune_vd.cfg --sizes 2x2 20x20 200x200
+    python benchmark.py membrane-mesh protodune_vd.cfg
+    python benchmark.py thick-profile protodune_vd.cfg --tolerance 0.1 0.05
+    python benchmark.py slim-profile protodune_vd.cfg
+'''
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import gegede.export.gdml
+
+import gdmlext
+from validate import build_geometry
+
+
+def write_gdml(geom, path, timings=None):
+    """Export geom to a GDML file, recording the 'gdml' phase time (s).
+
+    Returns:
+        Size of the written file in bytes
+    """
+    start = time.perf_counter()
+    gegede.export.gdml.output(gdmlext.convert(geom), path)
+    if timings is not None:
+        timings['gdml'] = time.perf_counter() - start
+    return os.path.getsize(path)
+
+
+def parse_size(text):
+    """Parse an array size 'NXxNZ' into (nCRM_x, nCRM_z)."""
+    nx, nz = [int(n) for n in text.lower().split('x')]
+    if nx < 2 or nz < 2 or nx % 2 or nz % 2:
+        raise argparse.ArgumentTypeError(f"CRM array size must be even, got {text}")
+    return nx, nz
+
+
+def bench_crp_array(config_files, sizes, wires=False, tpc_only=False, layout_sizes=()):
+    """Time full builds and the bare CRM layout for growing CRM arrays."""
+    import gegede.main
+    from world import eval_parameters
+    from tpcs import crm_layout
+
+    # Reference TPC and cryostat parameters to scale from
+    section = gegede.main.parse_config(config_files)
+    section = section[next(iter(section))]
+    tpc = eval_parameters(section['tpc_parameters'])
+    cryo = eval_parameters(section['cryostat_parameters'])
+    widthCRP = tpc['widthPCBActive'] + 2*tpc['borderCRP']
+    lengthCRP = 2*tpc['lengthPCBActive'] + 2*tpc['borderCRP'] + tpc['gapCRU']
+
+    print(f"{'array':>8} {'CRMs':>6} {'configure':>10} {'construct':>10} {'gdml':>8} {'size MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for nx, nz in sizes:
+            world_params = {
+                'tpc_parameters': {'nCRM_x': nx, 'nCRM_z': nz, 'wires_on': wires},
+                'cryostat_parameters': {
+                    'Argon_y': cryo['Argon_y'] + (nx - tpc['nCRM_x'])//2 * widthCRP,
+                    'Argon_z': cryo['Argon_z'] + (nz - tpc['nCRM_z'])//2 * lengthCRP},
+            }
+            if tpc_only:
+                world_params.update({'cathode_switch': False, 'fieldcage_switch': False,
+                                     'arapucamesh_switch': False})
+            timings = {}
+            _, geom = build_geometry(config_files, world_params=world_params, timings=timings)
+            size = write_gdml(geom, os.path.join(tmp, f"crp_{nx}x{nz}.gdml"), timings)
+            print(f"{nx:>3}x{nz:<4} {2*nx*nz:>6} {timings['configure']:>10.2f} "
+                  f"{timings['construct']:>10.2f} {timings['gdml']:>8.2f} {size/1e6:>9.2f}")
+
+    if layout_sizes:
+        print(f"\n{'array':>12} {'CRMs':>9} {'layout ms':>10}")
+    for nx, nz in layout_sizes:
+        start = time.perf_counter()
+        crm_layout(nx, nz, 0.0, 0.0, 0.0, 0.0, widthCRP.to('cm').magnitude,
+                   lengthCRP.to('cm').magnitude, tpc['borderCRP'].to('cm').magnitude,
+                   tpc['gapCRU'].to('cm').magnitude)
+        elapsed = time.perf_counter() - start
+        print(f"{nx:>5}x{nz:<6} {2*nx*nz:>9} {1e3*elapsed:>10.2f}")
+
+
+def best_time(func, repeat):
+    """Smallest wall time (s) of repeat calls of func, and its last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_cathode_frame(config_files, npoints=1000000, repeat=3, seed=1):
+    """Point location throughput of the boolean and bar cathode frames."""
+    from navigation import VoxelLocator, bounding_box, count_nodes, flat_daughters, inside
+
+    rng = np.random.default_rng(seed)
+    pts, results = None, {}
+    for mode in ('boolean', 'bars'):
+        _, geom = build_geometry(config_files, {'cathode': {'frame_mode': mode}})
+        frame = geom.store.structure['cathode_volume_TCO']
+        if mode == 'boolean':
+            lo, hi = bounding_box(geom, frame.shape)
+            pts = lo + (hi - lo) * rng.random((npoints, 3))
+            elapsed, g10 = best_time(lambda: inside(geom, frame.shape, pts), repeat)
+            detail = f"one solid of {count_nodes(geom, frame.shape)} nodes"
+        else:
+            locator = VoxelLocator(geom, flat_daughters(geom, frame))
+            elapsed, found = best_time(lambda: locator.locate(pts), repeat)
+            g10 = found >= 0
+            detail = (f"{len(locator.daughters)} bars, {int(np.prod(locator.nvox))} voxels, "
+                      f"<= {locator.candidates.shape[1]} candidates per voxel")
+        results[mode] = g10
+        print(f"{mode:>8}: {npoints/elapsed/1e6:8.2f} M points/s, "
+              f"G10 fraction {g10.mean():.4f} ({detail})")
+
+    agree = np.mean(results['boolean'] == results['bars'])
+    print(f"agreement: {agree:.6f}")
+    return agree == 1.0
+
+
+def bench_membrane_mesh(config_files, npoints=1000000, repeat=3, seed=1):
+    """Point location throughput in the membrane X-ARAPUCA mesh module for
+    the union, daughters and assembly frame constructions."""
+    from navigation import VoxelLocator, bounding_box, flat_daughters
+
+    rng = np.random.default_rng(seed)
+    pts, results = None, {}
+    for mode in ('union', 'daughters', 'assembly'):
+        _, geom = build_geometry(config_files, {'xarapuca': {'membrane_mesh_mode': mode}})
+        mesh = geom.store.structure['volArapucaMesh']
+        if pts is None:
+            lo, hi = bounding_box(geom, mesh.shape)
+            pts = lo + (hi - lo) * rng.random((npoints, 3))
+        locator = VoxelLocator(geom, flat_daughters(geom, mesh))
+        elapsed, found = best_time(lambda: locator.locate(pts), repeat)
+        results[mode] = found >= 0
+        print(f"{mode:>9}: {npoints/elapsed/1e6:8.2f} M points/s, steel fraction "
+              f"{results[mode].mean():.5f} ({len(locator.daughters)} solids)")
+
+    agree = all(np.array_equal(results['union'], results[mode]) for mode in results)
+    print(f"agreement: {'yes' if agree else 'no'}")
+    return agree
+
+
+def bench_thick_profile(config_files, tolerances=(0.1,), npoints=1000000, repeat=3, seed=1):
+    """Inside test throughput of the Boolean and extruded thick field shaper
+    profiles, with the section tracing time at each tolerance (mm)."""
+    from gegede import Quantity as Q
+    from navigation import bounding_box, count_nodes, inside
+
+    rng = np.random.default_rng(seed)
+    pts, reference = None, None
+    print(f"{'profile':>14} {'build s':>8} {'nodes':>6} {'M points/s':>11} {'agreement':>10}")
+    for mode, tol in [('boolean', None)] + [('extruded', t) for t in tolerances]:
+        params = {'thick_profile_mode': mode}
+        if tol is not None:
+            params['profile_tolerance'] = Q(tol, 'mm')
+        timings = {}
+        _, geom = build_geometry(config_files, world_params={'fieldcage_parameters': params},
+                                 timings=timings)
+        shape = geom.store.structure['volFieldShaper'].shape
+        if pts is None:
+            lo, hi = bounding_box(geom, shape)
+            pts = lo + (hi - lo) * rng.random((npoints, 3))
+        elapsed, found = best_time(lambda: inside(geom, shape, pts), repeat)
+        if reference is None:
+            reference = found
+        label = mode if tol is None else f"{mode} {tol}mm"
+        print(f"{label:>14} {timings['construct']:>8.2f} {count_nodes(geom, shape):>6} "
+              f"{npoints/elapsed/1e6:>11.2f} {np.mean(found == reference):>10.6f}")
+
+
+def bench_slim_profile(config_files, npoints=1000000, repeat=3, seed=1):
+    """Inside test throughput of the detailed and simple slim field shapers,
+    with the aluminium mass held in each."""
+    from navigation import bounding_box, count_nodes, inside
+
+    rng = np.random.default_rng(seed)
+    pts, solid = None, {}
+    for mode in ('detailed', 'simple'):
+        world, geom = build_geometry(config_files,
+                                     world_params={'fieldcage_parameters': {'slim_profile_mode': mode}})
+        vol = geom.store.structure['volFieldShaperSlim']
+        if pts is None:
+            lo, hi = bounding_box(geom, vol.shape)
+            pts = lo + (hi - lo) * rng.random((npoints, 3))
+        elapsed, found = best_time(lambda: inside(geom, vol.shape, pts), repeat)
+        solid[mode] = found
+        builder = world.get_builder('detenclosure').get_builder('cryostat').get_builder('fieldcage')
+        spec = builder.effective_materials.get(vol.material)
+        aluminium = (spec['components'][0][1] if spec else None)
+        print(f"{mode:>9}: {count_nodes(geom, vol.shape):>3} nodes, {npoints/elapsed/1e6:6.2f} M points/s, "
+              f"{vol.material}" + (f", {aluminium:.1f} cm3 of aluminium" if spec else ""))
+
+    missed = np.mean(solid['detailed'] & ~solid['simple'])
+    print(f"detailed points outside the simple shaper: {missed:.2e}")
+    return missed == 0
+
+
+def bench_pd_layout(config_files, sizes, repeat=3):
+    """Time the cathode X-ARAPUCA layout evaluation for growing module grids."""
+    from gegede import Quantity as Q
+
+    world, _ = build_geometry(config_files)
+    builder = world.get_builder('detenclosure').get_builder('cryostat').get_builder('xarapuca')
+    print(f"{'modules':>10} {'PDs':>9} {'layout ms':>10}")
+    for ny, nz in sizes:
+        elapsed, pds = best_time(
+            lambda: builder.cathode_layout(ny, nz, Q('0cm'), Q('0cm'), Q('0cm')), repeat)
+        print(f"{ny:>4}x{nz:<5} {len(pds):>9} {1e3*elapsed:>10.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('crp-array', help='build time and GDML size against the CRM array size')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--sizes', nargs='+', type=parse_size, default=[(4, 2), (8, 4), (16, 8)],
+                   help='CRM array sizes as NXxNZ (per side)')
+    p.add_argument('--layout-sizes', nargs='*', type=parse_size, default=[(100, 100), (1000, 1000)],
+                   help='array sizes for the layout-only timing')
+    p.add_argument('--wires', action='store_true', help='build with wires on')
+    p.add_argument('--tpc-only', action='store_true',
+                   help='switch off the cathode, field cage and photon detectors')
+
+    p = sub.add_parser('cathode-frame',
+                       help='point location throughput of the boolean and bar cathode frames')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--points', type=int, default=1000000, help='number of random points')
+    p.add_argument('--repeat', type=int, default=3, help='timing repetitions')
+
+    p = sub.add_parser('membrane-mesh',
+                       help='point location throughput of the membrane mesh frame modes')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--points', type=int, default=1000000, help='number of random points')
+    p.add_argument('--repeat', type=int, default=3, help='timing repetitions')
+
+    p = sub.add_parser('thick-profile',
+                       help='inside test throughput of the Boolean and extruded thick profiles')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--tolerance', nargs='+', type=float, default=[0.1],
+                   help='profile tracing tolerances in mm')
+    p.add_argument('--points', type=int, default=1000000, help='number of random points')
+    p.add_argument('--repeat', type=int, default=3, help='timing repetitions')
+
+    p = sub.add_parser('slim-profile',
+                       help='mass, envelope and throughput of the detailed and simple slim shapers')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--points', type=int, default=1000000, help='number of random points')
+    p.add_argument('--repeat', type=int, default=3, help='timing repetitions')
+
+    p = sub.add_parser('pd-layout', help='cathode X-ARAPUCA layout time against the module grid')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--sizes', nargs='+', type=parse_size, default=[(2, 2), (20, 20), (200, 200)],
+                   help='cathode module grids as NYxNZ')
+    p.add_argument('--repeat', type=int, default=3, help='timing repetitions')
+
+    args = parser.parse_args(argv)
+    if args.command == 'crp-array':
+        bench_crp_array(args.config, args.sizes, args.wires, args.tpc_only, args.layout_sizes)
+        return 0
+    if args.command == 'cathode-frame':
+        return 0 if bench_cathode_frame(args.config, args.points, args.repeat) else 1
+    if args.command == 'membrane-mesh':
+        return 0 if bench_membrane_mesh(args.config, args.points, args.repeat) else 1
+    if args.command == 'thick-profile':
+        bench_thick_profile(args.config, args.tolerance, args.points, args.repeat)
+        return 0
+    if args.command == 'slim-profile':
+        return 0 if bench_slim_profile(args.config, args.points, args.repeat) else 1
+    if args.command == 'pd-layout':
+        bench_pd_layout(args.config, args.sizes, args.repeat)
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,20 @@ Cathode builder for ProtoDUNE-VD geometry
 '''
 
 import gegede.builder
+import gegede.construct
 from gegede import Quantity as Q
+import numpy as np
+
+from columnar import write_columns
+from gdmlext import register_replica
+from navigation import solid_volume
+from transforms import find_transform
+
+# One cathode void slot: module indices along y and z, void index in the
+# module, hosted X-ARAPUCA (-1 for a mesh) and void centre in cm
+VOID_DTYPE = np.dtype([
+    ('iy', np.int16), ('iz', np.int16), ('void', np.int16), ('arapuca', np.int16),
+    ('x', np.float64), ('y', np.float64), ('z', np.float64)])
 
 class CathodeBuilder(gegede.builder.Builder):
     '''Build the cathode structure including mesh'''
@@ -98,51 +111,79 @@ class CathodeBuilder(gegede.builder.Builder):
         if self.print_construct:
             print('Construct Cathode <- Cryostat <- ProtoDUNE-VD <- World')
             
-        # Create base cathode box 
-        cathode_box = geom.shapes.Box(
-            self.name + "_box",
-            dx=self.params['heightCathode']/2,
-            dy=self.params['widthCathode']/2,     
-            dz=self.params['lengthCathode']/2) 
-
-        # Create void box for subtraction
-        void_box = geom.shapes.Box(
-            self.name + "_void",
-            dx=self.params['heightCathode']/2 + Q('0.5cm'),
-            dy=self.params['widthCathodeVoid']/2,
-            dz=self.params['lengthCathodeVoid']/2)
-
-        # Create cathode frame by subtracting all voids
-        shape = cathode_box
-        for i, (void_y, void_z) in enumerate(self.params['void_positions']):
-            shape = geom.shapes.Boolean(
-                self.name + f"_shape{i+1}",
-                type='subtraction',
-                first=shape,
-                second=void_box,
-                pos=geom.structure.Position(
-                    self.name + f"_void_pos{i+1}",
-                    x=Q('0cm'),
-                    y=void_y,
-                    z=void_z))
-
-        # Create main cathode volume with G10 material  
-        cathode_vol_1 = geom.structure.Volume(
-            self.name+"_volume_TCO", 
-            material="G10",
-            shape=shape)
-        
-        cathode_vol_2 = geom.structure.Volume(
-            self.name+"_volume_nonTCO", 
-            material="G10",
-            shape=shape)
+        frame_mode = self.params.get('frame_mode', 'boolean')
+        if frame_mode == 'bars':
+            # Assemblies of non-overlapping G10 bars, no boolean solid
+            cathode_vol_1 = self.construct_frame_bars(geom, self.name+"_volume_TCO")
+            cathode_vol_2 = self.construct_frame_bars(geom, self.name+"_volume_nonTCO")
+        elif frame_mode == 'boolean':
+            # Create base cathode box 
+            cathode_box = geom.shapes.Box(
+                self.name + "_box",
+                dx=self.params['heightCathode']/2,
+                dy=self.params['widthCathode']/2,     
+                dz=self.params['lengthCathode']/2) 
+
+            # Create void box for subtraction
+            void_box = geom.shapes.Box(
+                self.name + "_void",
+                dx=self.params['heightCathode']/2 + Q('0.5cm'),
+                dy=self.params['widthCathodeVoid']/2,
+                dz=self.params['lengthCathodeVoid']/2)
+
+            # Create cathode frame by subtracting all voids
+            shape = cathode_box
+            for i, (void_y, void_z) in enumerate(self.params['void_positions']):
+                shape = geom.shapes.Boolean(
+                    self.name + f"_shape{i+1}",
+                    type='subtraction',
+                    first=shape,
+                    second=void_box,
+                    pos=geom.structure.Position(
+                        self.name + f"_void_pos{i+1}",
+                        x=Q('0cm'),
+                        y=void_y,
+                        z=void_z))
+
+            # Create main cathode volume with G10 material  
+            cathode_vol_1 = geom.structure.Volume(
+                self.name+"_volume_TCO", 
+                material="G10",
+                shape=shape)
         
-
+            cathode_vol_2 = geom.structure.Volume(
+                self.name+"_volume_nonTCO", 
+                material="G10",
+                shape=shape)
+        else:
+            raise ValueError(f"Unknown cathode frame_mode: {frame_mode}")
 
         # Add main volume to builder
         self.add_volume(cathode_vol_1)
         self.add_volume(cathode_vol_2)
 
+        # Build the mesh as one union solid, as a LAr mother holding the
+        # rods as separate (or replicated) daughters, or as one homogeneous
+        # slab whose mixture the world builder defines from
+        # self.effective_materials
+        mesh_mode = self.params.get('mesh_mode', 'union')
+        self.mesh_offset = Q('0cm')
+        self.effective_materials = {}
+        if mesh_mode in ('strips', 'replica'):
+            mesh_vol = self.construct_mesh_daughters(geom, mesh_mode == 'replica')
+        elif mesh_mode == 'homogeneous':
+            mesh_vol = self.construct_mesh_slab(geom)
+        elif mesh_mode == 'union':
+            mesh_vol = self.construct_mesh_union(geom)
+        else:
+            raise ValueError(f"Unknown cathode mesh_mode: {mesh_mode}")
+
+        # Store mesh volume and add to builder
+        self.mesh_vol = mesh_vol
+        self.add_volume(mesh_vol)
+
+    def construct_mesh_union(self, geom):
+        """Cathode mesh as one G10 union solid of all rods."""
         # Create mesh rod shapes
         mesh_rod_vertical = geom.shapes.Box(
             self.name+"_mesh_rod_vertical",
@@ -152,7 +193,7 @@ class CathodeBuilder(gegede.builder.Builder):
 
         # Build complete mesh starting with first vertical rod
         mesh_shape = mesh_rod_vertical
-            
+        
         # Add remaining vertical rods
         for i in range(1, self.params['CathodeMeshInnerStructureNumberOfStrips_vertical']):
             pos_y = i*self.params['CathodeMeshInnerStructureSeparation'] 
@@ -192,14 +233,292 @@ class CathodeBuilder(gegede.builder.Builder):
             )
 
         # Create volume for complete mesh
-        mesh_vol = geom.structure.Volume(
+        return geom.structure.Volume(
             self.name+"_mesh_vol",
             material="G10", 
             shape=mesh_shape)
 
-        # Store mesh volume and add to builder
-        self.mesh_vol = mesh_vol
-        self.add_volume(mesh_vol)
+    def mesh_layout(self):
+        """Rods of the cathode mesh in the frame of the union mesh solid.
+
+        Returns:
+            Dictionary of plain floats in cm: rod half sizes 't' (x) and 'w',
+            vertical rod y centres 'yv' and half length 'lv', horizontal rod
+            y centre 'yh', half length 'lh' and z centres 'zh', and the
+            bounding box 'ylo', 'yhi', 'zhalf' of all rods
+        """
+        def cm(q):
+            return float(q.to('cm').magnitude)
+
+        sep = cm(self.params['CathodeMeshInnerStructureSeparation'])
+        half_width = cm(self.params['mesh_width'])/2
+        half_length = cm(self.params['mesh_length'])/2
+        nv = self.params['CathodeMeshInnerStructureNumberOfStrips_vertical']
+        nh = self.params['CathodeMeshInnerStructureNumberOfStrips_horizontal']
+        w = cm(self.params['CathodeMeshInnerStructureWidth'])
+        yv = [i*sep for i in range(nv)]
+        zh = [-half_length + (i + 1)*sep for i in range(nh)]
+        yh = half_width - sep
+        return {
+            't': cm(self.params['CathodeMeshInnerStructureThickness']),
+            'w': w,
+            'sep': sep,
+            'yv': yv,
+            'lv': half_length,
+            'yh': yh,
+            'lh': half_width,
+            'zh': zh,
+            'ylo': min(yv[0] - w, yh - half_width),
+            'yhi': max(yv[-1] + w, yh + half_width),
+            'zhalf': max([half_length] + [abs(z) + w for z in zh]),
+        }
+
+    def construct_mesh_slab(self, geom):
+        """Cathode mesh as one slab of a G10/LAr mixture.
+
+        The slab spans the bounding box of the rods and is offset like the
+        mother of construct_mesh_daughters(). The G10 volume is taken from
+        the strip counts, cross section and lengths, less the crossings of
+        the vertical and horizontal strips, which the union solid counts once.
+        The detailed G10 volume is measured on the union solid, built in a
+        scratch geometry.
+        """
+        m = self.mesh_layout()
+        t, w = m['t'], m['w']
+        ylo, yhi, zhalf = m['ylo'], m['yhi'], m['zhalf']
+        self.mesh_offset = Q(0.5*(ylo + yhi), 'cm')
+
+        section = 2*t * 2*w
+        nominal = section * (len(m['yv'])*2*m['lv'] + len(m['zh'])*2*m['lh'])
+        crossings = 0.0
+        for y in m['yv']:
+            dy = min(y + w, m['yh'] + m['lh']) - max(y - w, m['yh'] - m['lh'])
+            for z in m['zh']:
+                dz = min(z + w, m['lv']) - max(z - w, -m['lv'])
+                crossings += 2*t * max(dy, 0.0) * max(dz, 0.0)
+
+        scratch = gegede.construct.Geometry()
+        detailed, error = solid_volume(scratch, self.construct_mesh_union(scratch).shape)
+
+        material = "CathodeMeshMixture"
+        self.effective_materials[material] = {
+            'volume': 2*t * (yhi - ylo) * 2*zhalf,
+            'fill': 'LAr',
+            'components': [('G10', nominal - crossings)],
+            'detailed': [('G10', detailed)],
+            'detailed_error': [('G10', error)],
+        }
+        return geom.structure.Volume(
+            self.name + "_mesh_vol", material=material,
+            shape=geom.shapes.Box(self.name + "_mesh_slab", dx=Q(t, 'cm'),
+                                  dy=Q(0.5*(yhi - ylo), 'cm'), dz=Q(zhalf, 'cm')))
+
+    def construct_mesh_daughters(self, geom, replica=False):
+        """Cathode mesh as a LAr mother with G10 rod daughters.
+
+        Horizontal rods are cut into segments between the vertical rods so no
+        daughters overlap. With replica=True the vertical rods and the
+        segments next to them form one cell replicated along y at the rod
+        separation; the segments beyond the first and last cell are placed
+        directly. The mother is offset from the union solid frame by
+        self.mesh_offset along y, which place_in_volume() compensates.
+        """
+        m = self.mesh_layout()
+        t, w, sep = m['t'], m['w'], m['sep']
+        yv = m['yv']
+        ylo, yhi, zhalf = m['ylo'], m['yhi'], m['zhalf']
+        yc = 0.5*(ylo + yhi)
+        self.mesh_offset = Q(yc, 'cm')
+
+        segment_vols = {}
+
+        def make_box(name, dy, dz):
+            return geom.shapes.Box(self.name + name, dx=Q(t, 'cm'), dy=Q(dy, 'cm'), dz=Q(dz, 'cm'))
+
+        def segment_vol(dy):
+            key = round(dy, 9)
+            if key not in segment_vols:
+                k = len(segment_vols)
+                segment_vols[key] = geom.structure.Volume(
+                    self.name + f"_mesh_segment_vol{k}", material="G10",
+                    shape=make_box(f"_mesh_segment{k}", dy, w))
+            return segment_vols[key]
+
+        def place(mother, name, vol, y, z):
+            p = geom.structure.Placement(
+                f"{self.name}_{name}_place", volume=vol,
+                pos=geom.structure.Position(
+                    f"{self.name}_{name}_pos", x=Q('0cm'), y=Q(y, 'cm'), z=Q(z, 'cm')))
+            mother.placements.append(p.name)
+
+        def place_segments(mother, prefix, lo, hi, rods, yshift):
+            """Horizontal rod segments within [lo, hi] around the given rods."""
+            edges = [lo] + [e for y in rods for e in (y - w, y + w)] + [hi]
+            n = 0
+            for a, b in zip(edges[::2], edges[1::2]):
+                if b - a <= 1e-9:
+                    continue
+                vol = segment_vol(0.5*(b - a))
+                for k, z in enumerate(m['zh']):
+                    place(mother, f"{prefix}{n}_{k}", vol, 0.5*(a + b) - yshift, z)
+                n += 1
+
+        rod_vertical = geom.structure.Volume(
+            self.name + "_mesh_rod_vertical_vol", material="G10",
+            shape=make_box("_mesh_rod_vertical", w, m['lv']))
+        mesh_vol = geom.structure.Volume(
+            self.name + "_mesh_vol", material="LAr",
+            shape=make_box("_mesh_mother", 0.5*(yhi - ylo), zhalf))
+        hlo, hhi = m['yh'] - m['lh'], m['yh'] + m['lh']
+
+        if not replica:
+            for i, y in enumerate(yv):
+                place(mesh_vol, f"mesh_vrod{i}", rod_vertical, y - yc, 0.0)
+            place_segments(mesh_vol, "mesh_hseg", hlo, hhi, yv, yc)
+            return mesh_vol
+
+        # One cell per vertical rod, replicated along y at the rod separation
+        clo, chi = yv[0] - 0.5*sep, yv[-1] + 0.5*sep
+        if clo < hlo or chi > hhi or any(abs(b - a - sep) > 1e-9 for a, b in zip(yv, yv[1:])):
+            raise ValueError("Cathode mesh rods do not form a regular replica")
+        cell_vol = geom.structure.Volume(
+            self.name + "_mesh_cell_vol", material="LAr",
+            shape=make_box("_mesh_cell", 0.5*sep, zhalf))
+        place(cell_vol, "mesh_cell_vrod", rod_vertical, 0.0, 0.0)
+        place_segments(cell_vol, "mesh_cell_hseg", -0.5*sep, 0.5*sep, [0.0], 0.0)
+
+        grid_vol = geom.structure.Volume(
+            self.name + "_mesh_grid_vol", material="LAr",
+            shape=make_box("_mesh_grid", 0.5*(chi - clo), zhalf))
+        cell_place = geom.structure.Placement(self.name + "_mesh_grid_cell_place", volume=cell_vol)
+        grid_vol.placements.append(cell_place.name)
+        register_replica(geom, cell_place, 'replica', 'y', len(yv), sep)
+        place(mesh_vol, "mesh_grid", grid_vol, 0.5*(clo + chi) - yc, 0.0)
+
+        # Segments outside the replicated cells
+        place_segments(mesh_vol, "mesh_lo_hseg", hlo, clo, [], yc)
+        place_segments(mesh_vol, "mesh_hi_hseg", chi, hhi, [], yc)
+        return mesh_vol
+
+    def frame_bars(self):
+        """Split the cathode frame into non-overlapping bars.
+
+        Long bars run along z over the full cathode length between the void
+        columns; short bars fill the frame between the long ones.
+
+        Returns:
+            List of (y, z, dy, dz) bar centres and half sizes in cm
+        """
+        def cm(q):
+            return float(q.to('cm').magnitude)
+
+        def solid_intervals(half, centres, void_half):
+            voids = sorted({round(c, 9) for c in centres})
+            edges = [-half] + [e for c in voids for e in (c - void_half, c + void_half)] + [half]
+            return [(a, b) for a, b in zip(edges[::2], edges[1::2]) if b - a > 1e-9], \
+                [(c - void_half, c + void_half) for c in voids]
+
+        half_y, half_z = cm(self.params['widthCathode'])/2, cm(self.params['lengthCathode'])/2
+        ybars, yvoids = solid_intervals(half_y, [cm(y) for y, z in self.params['void_positions']],
+                                        cm(self.params['widthCathodeVoid'])/2)
+        zbars, _ = solid_intervals(half_z, [cm(z) for y, z in self.params['void_positions']],
+                                   cm(self.params['lengthCathodeVoid'])/2)
+
+        bars = [((a + b)/2, 0.0, (b - a)/2, half_z) for a, b in ybars]
+        bars += [((a + b)/2, (c + d)/2, (b - a)/2, (d - c)/2)
+                 for a, b in yvoids for c, d in zbars]
+        return bars
+
+    def construct_frame_bars(self, geom, name):
+        """Cathode frame as an assembly of G10 bar volumes.
+
+        Bar volumes of the same size are shared between the frames.
+        """
+        if not hasattr(self, 'frame_bar_volumes'):
+            self.frame_bar_volumes = {}
+
+        frame = geom.structure.Volume(name)
+        for i, (y, z, dy, dz) in enumerate(self.frame_bars()):
+            key = (round(dy, 9), round(dz, 9))
+            if key not in self.frame_bar_volumes:
+                k = len(self.frame_bar_volumes)
+                bar = geom.shapes.Box(
+                    self.name + f"_bar{k}",
+                    dx=self.params['heightCathode']/2,
+                    dy=Q(dy, 'cm'),
+                    dz=Q(dz, 'cm'))
+                self.frame_bar_volumes[key] = geom.structure.Volume(
+                    self.name + f"_volume_bar{k}",
+                    material="G10",
+                    shape=bar)
+            place = geom.structure.Placement(
+                f"{name}_bar_place{i}",
+                volume=self.frame_bar_volumes[key],
+                pos=geom.structure.Position(
+                    f"{name}_bar_pos{i}",
+                    x=Q('0cm'),
+                    y=Q(y, 'cm'),
+                    z=Q(z, 'cm')))
+            frame.placements.append(place.name)
+        return frame
+
+    def void_occupancy(self, n_y, n_z, cathode_x, base_y, base_z, arapucas):
+        """Index the X-ARAPUCA hosted by each void of each cathode module.
+
+        A void hosts the X-ARAPUCA centred within 10 cm (y, from the void
+        centre shifted by one mesh separation) and 1 cm (z) of it.
+
+        Args:
+            n_y, n_z: Number of cathode modules along y and z
+            cathode_x, base_y, base_z: Centre of the first module
+            arapucas: X-ARAPUCA layout of pdlayout.PD_DTYPE with one copy per
+                module (copy = i*n_z + j), or None
+
+        Returns:
+            Structured array of VOID_DTYPE, one row per (module, void) slot in
+            placement order, with arapuca = -1 for voids holding a mesh
+        """
+        def cm(q):
+            return float(q.to('cm').magnitude)
+
+        voids = np.array([[cm(y), cm(z)] for y, z in self.params['void_positions']])
+        sep = cm(self.params['CathodeMeshInnerStructureSeparation'])
+        nvoid = len(voids)
+        table = np.zeros(n_y*n_z*nvoid, dtype=VOID_DTYPE)
+        for i in range(n_y):
+            for j in range(n_z):
+                rows = table[(i*n_z + j)*nvoid:(i*n_z + j + 1)*nvoid]
+                rows['iy'], rows['iz'], rows['void'] = i, j, np.arange(nvoid)
+                rows['x'] = cm(cathode_x)
+                rows['y'] = cm(base_y + i*self.params['widthCathode']) + voids[:, 0]
+                rows['z'] = cm(base_z + j*self.params['lengthCathode']) + voids[:, 1]
+                rows['arapuca'] = -1
+                pds = arapucas[arapucas['copy'] == i*n_z + j] if arapucas is not None else []
+                if not len(pds):
+                    continue
+                match = ((np.abs(rows['y'][:, None] + sep - pds['y']) < 10.0)
+                         & (np.abs(rows['z'][:, None] - pds['z']) < 1.0))
+                rows['arapuca'] = np.where(match.any(axis=1), pds['slot'][match.argmax(axis=1)], -1)
+        return table
+
+    def export_void_occupancy(self, geom, top, path):
+        """Write the void occupancy index with global void centres to path."""
+        store = geom.store.structure
+        mother = find_transform(store, top, self.cathode_mother)
+        if mother is None:
+            raise ValueError(f"{self.cathode_mother} is not placed below the top volume")
+        rot, pos = mother
+        table = self.occupancy
+        centres = np.stack([table['x'], table['y'], table['z']], axis=1) @ rot.T + pos
+        columns = {name: table[name] for name in ('iy', 'iz', 'void', 'arapuca')}
+        for k, axis in enumerate('xyz'):
+            columns[axis] = centres[:, k]
+        top_name = top if isinstance(top, str) else top.name
+        write_columns(path, columns, meta={'frame': top_name, 'units': 'cm',
+                                           'nvoids': len(table),
+                                           'narapucas': int((table['arapuca'] >= 0).sum())})
+        if self.print_construct:
+            print(f"Wrote cathode void occupancy of {len(table)} voids to {path}")
 
     def place_in_volume(self, geom, volume, argon_dim, params, xarapuca_builder=None):
         '''Place cathode modules and associated X-ARAPUCAs in the given volume
@@ -242,6 +561,17 @@ class CathodeBuilder(gegede.builder.Builder):
             double_arapuca_window = xarapuca_builder.get_volume('volXARAPUCADoubleWindow')
             double_arapuca_mesh = xarapuca_builder.get_volume('volCathodeArapucaMesh')
 
+        # X-ARAPUCA positions of every cathode module and the X-ARAPUCA
+        # hosted by each void, computed once for the whole array
+        arapucas = None
+        if xarapuca_builder and double_arapuca_wall:
+            arapucas = xarapuca_builder.cathode_layout(n_crm_x//2, n_crm_z//2,
+                                                       cathode_x, base_y, base_z)
+        self.cathode_mother = volume.name
+        self.occupancy = self.void_occupancy(n_crm_x//2, n_crm_z//2, cathode_x,
+                                             base_y, base_z, arapucas)
+        nvoid = len(self.params['void_positions'])
+
         # Place cathodes and meshes in 2x2 grid
         for i in range(n_crm_x//2):  # y direction
             for j in range(n_crm_z//2):  # z direction
@@ -274,14 +604,13 @@ class CathodeBuilder(gegede.builder.Builder):
                 # Place X-ARAPUCAs associated with this cathode module
                 if xarapuca_builder and double_arapuca_wall:
                     
-                    # Calculate X-ARAPUCA positions relative to this cathode module
-                    arapuca_positions = xarapuca_builder.calculate_cathode_positions(i,
-                        module_x, module_y, module_z
-                    )
+                    # X-ARAPUCAs of this cathode module
+                    module_pds = arapucas[arapucas['copy'] == i*(n_crm_z//2) + j]
                     
                     # # Place each X-ARAPUCA with rotation
-                    for idx, (x, y, z) in enumerate(arapuca_positions):
-                        
+                    for pd in module_pds:
+                        idx = int(pd['slot'])
+                        x, y, z = (Q(float(pd[a]), 'cm') for a in 'xyz')
 
                         # Include rotation in placement
                         arapuca_place = geom.structure.Placement(
@@ -291,7 +620,7 @@ class CathodeBuilder(gegede.builder.Builder):
                                 f"pos_cathode_{i}_{j}_xarapuca_{idx}",
                                 x=x, y=y, z=z
                             ),
-                            rot='rPlus90AboutXPlus90AboutZ'    # Add rotation here
+                            rot=str(pd['rot'])
                         )
                         volume.placements.append(arapuca_place.name)
 
@@ -303,7 +632,7 @@ class CathodeBuilder(gegede.builder.Builder):
                                 f"pos_cathode_{i}_{j}_xwindow_{idx}",
                                 x=x, y=y, z=z
                             ),
-                            rot='rPlus90AboutXPlus90AboutZ'    # Add rotation here
+                            rot=str(pd['rot'])
                         )
                         volume.placements.append(window_place.name)
 
@@ -311,20 +640,17 @@ class CathodeBuilder(gegede.builder.Builder):
 
                 # Place mesh in each void position
                 for void_idx, (void_y, void_z) in enumerate(self.params['void_positions']):
-                    flag_construct = True
-
                     # skip the mesh if there is a X-ARAPUCA in the same position
-                    for idx, (x, y, z) in enumerate(arapuca_positions):
-                        if (abs(base_y + i*self.params['widthCathode'] + void_y + self.params['CathodeMeshInnerStructureSeparation'] - y)<Q('10cm') and abs(base_z + j*self.params['lengthCathode'] + void_z - z)<Q('1cm')):
-                            flag_construct = False
-                            break
+                    idx = int(self.occupancy['arapuca'][(i*(n_crm_z//2) + j)*nvoid + void_idx])
+                    flag_construct = idx < 0
 
                     if (flag_construct):
                         mesh_pos = geom.structure.Position(
                             f"{self.name}_mesh_pos_{i}_{j}_{void_idx}",
                             x=cathode_x,
                             y=base_y + i*self.params['widthCathode'] + void_y - \
-                            self.params['mesh_width']/2 + self.params['CathodeMeshInnerStructureSeparation'],
+                            self.params['mesh_width']/2 + self.params['CathodeMeshInnerStructureSeparation'] + \
+                            self.mesh_offset,
                             z=base_z + j*self.params['lengthCathode'] + void_z
                         )
                         
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+'''
+Compact columnar binary tables for ProtoDUNE-VD geometry exports
+
+A file holds a fixed magic string, a JSON header and a set of named
+columns, each stored as raw little-endian array data aligned to 64 bytes.
+Columns may be plain or structured NumPy dtypes of any shape, so readers
+can memory-map the file and get array views without parsing or copying.
+'''
+
+import json
+import os
+
+import numpy as np
+
+MAGIC = b'PDVDCOL1'
+ALIGN = 64
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+def write_columns(path, columns, meta=None):
+    """Write named arrays to path as a columnar binary file.
+
+    The file is written to a temporary name and moved into place, so a
+    concurrent reader never sees a partial table.
+
+    Args:
+        path: Output file name
+        columns: Mapping of column name to array
+        meta: Optional JSON-serialisable dictionary stored in the header
+    """
+    arrays = [(name, np.ascontiguousarray(col)) for name, col in columns.items()]
+
+    # Column offsets are relative to the start of the data block
+    entries, offset = [], 0
+    for name, arr in arrays:
+        entries.append({'name': name,
+                        'descr': np.lib.format.dtype_to_descr(arr.dtype.newbyteorder('<')),
+                        'shape': list(arr.shape),
+                        'offset': offset})
+        offset += arr.nbytes + _pad(arr.nbytes)
+
+    header = json.dumps({'meta': meta or {}, 'columns': entries}).encode()
+    header += b' ' * _pad(len(MAGIC) + 8 + len(header))
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, arr in arrays:
+            f.write(arr.astype(arr.dtype.newbyteorder('<'), copy=False).tobytes())
+            f.write(b'\0' * _pad(arr.nbytes))
+    os.replace(tmp, path)
+
+
+def read_columns(path, mmap=True):
+    """Read a columnar binary file written by write_columns().
+
+    Args:
+        path: Input file name
+        mmap: Memory-map the file instead of reading it into memory
+
+    Returns:
+        Tuple of (columns, meta) where columns maps names to read-only arrays
+    """
+    if mmap:
+        buf = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        with open(path, 'rb') as f:
+            buf = np.frombuffer(f.read(), dtype=np.uint8)
+
+    if bytes(buf[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a columnar geometry table")
+    hlen = int(buf[len(MAGIC):len(MAGIC) + 8].view('<u8')[0])
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(buf[start:start + hlen]).decode())
+    data = start + hlen
+
+    columns = {}
+    for entry in header['columns']:
+        dtype = np.lib.format.descr_to_dtype(entry['descr'])
+        shape = tuple(entry['shape'])
+        count = int(np.prod(shape, dtype=np.int64))
+        arr = np.frombuffer(buf, dtype=dtype, count=count, offset=data + entry['offset'])
+        columns[entry['name']] = arr.reshape(shape)
+    return columns, header['meta']
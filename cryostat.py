@@ -5,6 +5,9 @@ Cryostat builder for ProtoDUNE-VD geometry
 
 import gegede.builder
 from gegede import Quantity as Q
+import numpy as np
+
+from navigation import bounding_box
 
 from fieldcage import FieldCageBuilder
 from cathode import CathodeBuilder
@@ -99,6 +102,95 @@ class CryostatBuilder(gegede.builder.Builder):
                                   print_construct=print_construct,  
                                   **kwds)
 
+    def lateral_frame_center(self):
+        """Centre (x, y, z) of the lateral X-ARAPUCA frame in the argon volume."""
+        frame_center_x = (self.cryo['Argon_x']/2 - self.cryo['HeightGaseousAr'] - 
+                        self.cryo['Upper_xLArBuffer'] - 
+                        (self.tpc['driftTPCActive'] + self.tpc['ReadoutPlane'])) # -0.5*self.cathode['heightCathode']
+        frame_center_y = (-self.cathode['widthCathode'] - self.xarapuca['CathodeFrameToFC'] -   self.xarapuca['FCToArapucaSpaceLat'] + self.xarapuca['ArapucaOut_y']/2)
+        frame_center_z = (-0.5*self.cryo['Argon_z'] + self.cryo['zLArBuffer'] + 0.5*self.cathode['lengthCathode'])
+        return frame_center_x, frame_center_y, frame_center_z
+
+    def gas_intrusions(self, geom, xarapuca_builder, lateral_frame):
+        """Lateral X-ARAPUCAs that reach into the gaseous argon.
+
+        Each X-ARAPUCA of the layout is bounded by the sphere around its
+        wall; those whose sphere meets the gas box are kept.
+
+        Returns:
+            List of (slot, shape, (x, y, z), rotation, contained) in the
+            gas frame, contained telling whether the whole X-ARAPUCA with
+            its mesh lies inside the gas
+        """
+        pds, _ = xarapuca_builder.lateral_layout(*lateral_frame)
+        wall = geom.store.shapes[xarapuca_builder.get_volume('volXARAPUCAWall').shape]
+        lo, hi = bounding_box(geom, wall)
+        radius = np.linalg.norm(np.maximum(np.abs(lo), np.abs(hi)))
+        reach = radius + (self.xarapuca['Distance_Mesh_Window'] +
+                          self.xarapuca['MeshRodOuterRadius'] + Q('1cm')).to('cm').magnitude
+
+        half = np.array([self.cryo['HeightGaseousAr'].to('cm').magnitude,
+                         self.cryo['Argon_y'].to('cm').magnitude,
+                         self.cryo['Argon_z'].to('cm').magnitude])/2
+        gas_x = (self.cryo['Argon_x']/2 - self.cryo['HeightGaseousAr']/2).to('cm').magnitude
+        intrusions = []
+        for pd in pds:
+            centre = np.array([pd['x'] - gas_x, pd['y'], pd['z']])
+            outside = np.maximum(np.abs(centre) - half, 0)
+            if np.linalg.norm(outside) >= radius:
+                continue
+            contained = bool(np.all(np.abs(centre) + reach <= half))
+            intrusions.append((int(pd['slot']), wall, tuple(Q(float(c), 'cm') for c in centre),
+                               str(pd['rot']), contained))
+        return intrusions
+
+    def gas_cutout(self, geom, gas_shape, intrusions, mode='boolean'):
+        """Remove intruding volumes from the gaseous argon.
+
+        With mode 'boolean' every intrusion is clipped to the gas box in
+        the gas frame and the clipped pieces are merged by a balanced tree
+        of unions, subtracted from the box once, so the solid depth grows
+        with log2 of the number of intrusions. With mode 'daughters' the
+        gas stays a box and the X-ARAPUCAs are placed inside it; they must
+        then lie entirely in the gas.
+
+        Returns:
+            Tuple of (gas shape, slots of the X-ARAPUCAs to place in the gas)
+        """
+        if not intrusions:
+            return gas_shape, []
+        if mode == 'daughters':
+            partial = [slot for slot, _, _, _, contained in intrusions if not contained]
+            if partial:
+                raise ValueError(f"Lateral X-ARAPUCAs {partial} cross the gas boundary, "
+                                 "use gas_cutout_mode 'boolean'")
+            return gas_shape, [slot for slot, _, _, _, _ in intrusions]
+        if mode != 'boolean':
+            raise ValueError(f"Unknown gas_cutout_mode: {mode}")
+
+        pieces = []
+        for slot, shape, (x, y, z), rot, _ in intrusions:
+            pieces.append(geom.shapes.Boolean(
+                self.name + f'_gasAr_cut{slot}',
+                type='intersection',
+                first=gas_shape,
+                second=shape,
+                pos=geom.structure.Position(self.name + f'_gasAr_cut{slot}_pos', x=x, y=y, z=z),
+                rot=rot))
+        level = 0
+        while len(pieces) > 1:
+            merged = []
+            for k in range(0, len(pieces) - 1, 2):
+                merged.append(geom.shapes.Boolean(
+                    self.name + f'_gasAr_cuts{level}_{k//2}',
+                    type='union', first=pieces[k], second=pieces[k + 1]))
+            if len(pieces) % 2:
+                merged.append(pieces[-1])
+            pieces = merged
+            level += 1
+        return geom.shapes.Boolean(self.name + '_gasAr_final', type='subtraction',
+                                   first=gas_shape, second=pieces[0]), []
+
     def construct(self, geom):
         if self.print_construct:
             print('Construct Cryostat <- ProtoDUNE-VD <- World')
@@ -122,54 +214,13 @@ class CryostatBuilder(gegede.builder.Builder):
                                     dy=self.cryo['Argon_y']/2.0,
                                     dz=self.cryo['Argon_z']/2.0)
 
-        # Get X-ARAPUCA builder and its volume
+        # Cut the lateral X-ARAPUCAs reaching into the gas out of it
         xarapuca_builder = self.get_builder('xarapuca')
-        arapuca_vol = xarapuca_builder.get_volume('volXARAPUCAWall')  
-        arapuca_shape = arapuca_vol.shape
-
-        # Calculate X-ARAPUCA subtraction positions from gas argon
-        # First X-ARAPUCA position
-        arapuca_pos1 = geom.structure.Position(
-            "gasAr_arapuca_pos1",
-            x = -0.5*self.cryo['HeightGaseousAr'] - 
-                self.cryo['Upper_xLArBuffer'] - 
-                self.xarapuca['FirstFrameVertDist'] - 
-                self.tpc['ReadoutPlane'],
-            y = -self.cathode['widthCathode'] - 
-                self.xarapuca['CathodeFrameToFC'] - 
-                self.xarapuca['FCToArapucaSpaceLat'],
-            z = -0.5*self.cryo['Argon_z'] + 
-                self.cryo['zLArBuffer'] + 
-                0.5*self.cathode['lengthCathode']
-        )
-
-        # Create first subtraction 
-        gas_ar_sub1 = geom.shapes.Boolean(
-            self.name + '_gasAr_sub1',
-            type='subtraction',
-            first=gas_ar_shape_full,
-            second=arapuca_shape,
-            pos=arapuca_pos1
-        )
-
-        # Second X-ARAPUCA position (mirrored in Y)
-        arapuca_pos2 = geom.structure.Position(
-            "gasAr_arapuca_pos2", 
-            x = arapuca_pos1.x,
-            y = self.cathode['widthCathode'] + 
-                self.xarapuca['CathodeFrameToFC'] + 
-                self.xarapuca['FCToArapucaSpaceLat'],
-            z = arapuca_pos1.z
-        )
-
-        # Create final gas argon shape with both subtractions
-        gas_ar_shape_final = geom.shapes.Boolean(
-            self.name + '_gasAr_final',
-            type='subtraction',
-            first=gas_ar_sub1,
-            second=arapuca_shape,
-            pos=arapuca_pos2
-        )
+        lateral_frame = self.lateral_frame_center()
+        gas_mode = self.cryo.get('gas_cutout_mode', 'boolean')
+        gas_ar_shape_final, gas_pds = self.gas_cutout(
+            geom, gas_ar_shape_full, self.gas_intrusions(geom, xarapuca_builder, lateral_frame),
+            gas_mode)
 
         # Create the steel shell by subtracting argon volume from cryostat
         steel_shape = geom.shapes.Boolean(self.name + '_steel_shape',
@@ -248,11 +299,7 @@ class CryostatBuilder(gegede.builder.Builder):
 
         # Place lateral X-ARAPUCAs
         if xarapuca_builder:
-            frame_center_x = (self.cryo['Argon_x']/2 - self.cryo['HeightGaseousAr'] - 
-                            self.cryo['Upper_xLArBuffer'] - 
-                            (self.tpc['driftTPCActive'] + self.tpc['ReadoutPlane'])) # -0.5*self.cathode['heightCathode']
-            frame_center_y = (-self.cathode['widthCathode'] - self.xarapuca['CathodeFrameToFC'] -   self.xarapuca['FCToArapucaSpaceLat'] + self.xarapuca['ArapucaOut_y']/2)
-            frame_center_z = (-0.5*self.cryo['Argon_z'] + self.cryo['zLArBuffer'] + 0.5*self.cathode['lengthCathode'])
+            frame_center_x, frame_center_y, frame_center_z = lateral_frame
             
             # Pass arapucamesh_switch to builder
             xarapuca_builder.arapucamesh_switch = self.arapucamesh_switch
@@ -263,7 +310,8 @@ class CryostatBuilder(gegede.builder.Builder):
                 argon_vol,
                 frame_center_x,
                 frame_center_y, 
-                frame_center_z
+                frame_center_z,
+                gas=(gas_ar_vol, gas_ar_pos.x, gas_pds) if gas_pds else None
             )
 
         #print(self.fieldcage)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+'''
+Electrostatic drift field map for ProtoDUNE-VD
+
+Solves the Laplace equation for the potential in the liquid argon volume
+on a regular grid of nodes spanning the argon box. The boundaries come
+from the built geometry: the cryostat walls and both anode planes are
+grounded, the cathode plane is at the high voltage and every field shaper
+ring holds the potential of its drift position, falling linearly from the
+cathode to the anodes. Anode and cathode planes span the field cage
+aperture. The solver uses red-black successive over-relaxation, optionally
+accelerated by multigrid V-cycles, and the field E = -grad V is written
+with the potential as a memory-mappable columnar table of (nx, ny, nz)
+float32 arrays in the cryostat frame. Volts and cm throughout.
+
+    python efield.py protodune_vd.cfg --grid 65 65 65 --multigrid -o efield.col
+'''
+
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from columnar import read_columns, write_columns
+
+# Nominal drift field in V/cm
+NOMINAL_FIELD = 500.0
+
+
+def _cm(q):
+    return float(q.to('cm').magnitude)
+
+
+def field_cage_layout(world):
+    """Electrode positions of the drift volumes in the cryostat frame.
+
+    Returns:
+        dict with the argon half sizes 'half', the drift positions 'anodes'
+        (top, bottom) and 'cathode', the field cage aperture half sizes
+        'aperture' (y, z) and the drift positions of all field shapers
+        'shapers'
+    """
+    cryostat = world.get_builder('detenclosure').get_builder('cryostat')
+    cryo, tpc, cathode = cryostat.cryo, cryostat.tpc, cryostat.cathode
+    fc = cryostat.get_builder('fieldcage')
+
+    top = cryo['Argon_x']/2 - cryo['HeightGaseousAr'] - cryo['Upper_xLArBuffer']
+    centre = top - tpc['ReadoutPlane'] - tpc['driftTPCActive'] - cathode['heightCathode']/2
+    bottom = centre - cathode['heightCathode']/2 - tpc['driftTPCActive'] - tpc['ReadoutPlane']
+    shapers = np.concatenate([x for _, _, x in fc.shaper_positions(cryo['Cryostat_x']/2)])
+    return {
+        'frame': cryostat.name + '_volume',
+        'half': np.array([_cm(cryo[k])/2 for k in ('Argon_x', 'Argon_y', 'Argon_z')]),
+        'anodes': (_cm(top), _cm(bottom)),
+        'cathode': _cm(centre),
+        'aperture': (_cm(fc.base_width)/2, _cm(fc.base_length)/2),
+        'shapers': np.sort(shapers),
+    }
+
+
+def grid_axes(half, shape):
+    """Node coordinates along x, y and z, boundary nodes included."""
+    return [np.linspace(-h, h, n) for h, n in zip(half, shape)]
+
+
+def boundary_conditions(layout, shape, hv):
+    """Fixed nodes and their potentials.
+
+    Nodes are fixed on the outer faces (0 V), on the anode and cathode
+    planes within the aperture and on the field shaper rings: the nodes of
+    a drift layer within half a spacing of a shaper and within half a
+    spacing of the aperture outline. With a coarse drift spacing the
+    shaper rings merge into a wall of linearly graded potential.
+
+    Returns:
+        Tuple of (fixed, value, spacing) with fixed and value (nx, ny, nz)
+    """
+    x, y, z = grid_axes(layout['half'], shape)
+    h = np.array([a[1] - a[0] for a in (x, y, z)])
+    fixed = np.zeros(shape, dtype=bool)
+    value = np.zeros(shape)
+    fixed[[0, -1], :, :] = fixed[:, [0, -1], :] = fixed[:, :, [0, -1]] = True
+
+    ay, az = layout['aperture']
+    yy, zz = np.meshgrid(y, z, indexing='ij')
+    inner = (np.abs(yy) <= ay) & (np.abs(zz) <= az)
+    ring = inner & ((np.abs(np.abs(yy) - ay) <= h[1]/2) | (np.abs(np.abs(zz) - az) <= h[2]/2))
+
+    def layer(pos):
+        return int(np.argmin(np.abs(x - pos)))
+
+    # Shaper potentials fall linearly from the cathode to either anode
+    top, bottom = layout['anodes']
+    drift = [bottom, layout['cathode'], top]
+    shapers = layout['shapers']
+    potential = np.interp(shapers, drift, [0.0, hv, 0.0])
+    near = np.abs(x[:, None] - shapers[None, :]) <= h[0]/2
+    for i in np.flatnonzero(near.any(axis=1)):
+        fixed[i][ring] = True
+        value[i][ring] = potential[near[i]].mean()
+
+    for pos, v in ((top, 0.0), (bottom, 0.0), (layout['cathode'], hv)):
+        i = layer(pos)
+        fixed[i][inner] = True
+        value[i][inner] = v
+    return fixed, value, h
+
+
+def laplacian(u, h):
+    """Discrete Laplacian of u on the interior nodes, zero on the faces."""
+    w = 1.0/h**2
+    lap = np.zeros_like(u)
+    c = u[1:-1, 1:-1, 1:-1]
+    lap[1:-1, 1:-1, 1:-1] = (w[0]*(u[2:, 1:-1, 1:-1] + u[:-2, 1:-1, 1:-1] - 2*c)
+                             + w[1]*(u[1:-1, 2:, 1:-1] + u[1:-1, :-2, 1:-1] - 2*c)
+                             + w[2]*(u[1:-1, 1:-1, 2:] + u[1:-1, 1:-1, :-2] - 2*c))
+    return lap
+
+
+def red_black(shape):
+    """Interior masks of the two colours of a checkerboard ordering."""
+    i, j, k = np.indices([n - 2 for n in shape])
+    red = (i + j + k) % 2 == 0
+    return red, ~red
+
+
+def smooth(u, f, free, h, omega=1.0, sweeps=1, colours=None):
+    """Red-black over-relaxed Gauss-Seidel sweeps of lap(u) = f, in place.
+
+    free holds the interior masks of the free nodes of each colour.
+    """
+    w = 1.0/h**2
+    diag = 2*w.sum()
+    c = u[1:-1, 1:-1, 1:-1]
+    for _ in range(sweeps):
+        for mask in free:
+            nb = (w[0]*(u[2:, 1:-1, 1:-1] + u[:-2, 1:-1, 1:-1])
+                  + w[1]*(u[1:-1, 2:, 1:-1] + u[1:-1, :-2, 1:-1])
+                  + w[2]*(u[1:-1, 1:-1, 2:] + u[1:-1, 1:-1, :-2]))
+            target = (nb - f[1:-1, 1:-1, 1:-1]) / diag
+            c[mask] += omega*(target[mask] - c[mask])
+    return u
+
+
+def residual(u, f, fixed, h):
+    r = f - laplacian(u, h)
+    r[fixed] = 0.0
+    return r
+
+
+def _weigh(a, axis):
+    """[1/4, 1/2, 1/4] average along axis, keeping the end values."""
+    out = a.copy()
+    lo = [slice(None)]*3
+    mid, left, right = list(lo), list(lo), list(lo)
+    mid[axis], left[axis], right[axis] = slice(1, -1), slice(None, -2), slice(2, None)
+    out[tuple(mid)] = 0.5*a[tuple(mid)] + 0.25*(a[tuple(left)] + a[tuple(right)])
+    return out
+
+
+def restrict(r):
+    """Full weighting of a fine grid array onto the even nodes."""
+    for axis in range(3):
+        r = _weigh(r, axis)
+    return r[::2, ::2, ::2].copy()
+
+
+def prolong(e, shape):
+    """Trilinear interpolation of a coarse correction onto the fine grid."""
+    out = e
+    for axis, n in enumerate(shape):
+        fine = list(out.shape)
+        fine[axis] = n
+        grown = np.zeros(fine)
+        even, odd = [slice(None)]*3, [slice(None)]*3
+        even[axis], odd[axis] = slice(0, None, 2), slice(1, None, 2)
+        grown[tuple(even)] = out
+        left, right = [slice(None)]*3, [slice(None)]*3
+        left[axis], right[axis] = slice(None, -1), slice(1, None)
+        grown[tuple(odd)] = 0.5*(out[tuple(left)] + out[tuple(right)])
+        out = grown
+    return out
+
+
+def coarse_fixed(fixed):
+    """Coarse nodes whose fine neighbourhood holds a fixed node."""
+    grown = fixed.copy()
+    for axis in range(3):
+        for shift in (1, -1):
+            grown |= np.roll(fixed, shift, axis=axis)
+    return grown[::2, ::2, ::2]
+
+
+class Multigrid:
+    """Hierarchy of vertex-centred grids for V-cycles of lap(u) = f.
+
+    Grids are halved while every dimension is odd and at least 5 nodes.
+    """
+
+    def __init__(self, fixed, h, pre=2, post=2):
+        self.levels = []
+        while True:
+            red, black = red_black(fixed.shape)
+            free = ~fixed[1:-1, 1:-1, 1:-1]
+            self.levels.append((fixed, h, (red & free, black & free)))
+            if any(n % 2 == 0 or n < 5 for n in fixed.shape):
+                break
+            fixed, h = coarse_fixed(fixed), 2*h
+        self.pre, self.post = pre, post
+
+    def cycle(self, u, f, level=0):
+        fixed, h, free = self.levels[level]
+        if level == len(self.levels) - 1:
+            return smooth(u, f, free, h, sweeps=50)
+        smooth(u, f, free, h, sweeps=self.pre)
+        rc = restrict(residual(u, f, fixed, h))
+        ec = self.cycle(np.zeros_like(rc), rc, level + 1)
+        e = prolong(ec, u.shape)
+        e[fixed] = 0.0
+        u += e
+        return smooth(u, f, free, h, sweeps=self.post)
+
+
+def solve(fixed, value, h, multigrid=False, tol=1e-6, max_iter=20000, omega=None, verbose=False):
+    """Potential with the fixed nodes at their values and lap(V) = 0 elsewhere.
+
+    Iterates until the largest residual, as a potential change relative to
+    the largest fixed potential, falls below tol.
+
+    Returns:
+        Tuple of (V, iterations, final relative residual)
+    """
+    u = np.where(fixed, value, 0.0)
+    f = np.zeros_like(u)
+    scale = max(np.abs(value).max(), 1e-300) * 2*np.sum(1.0/h**2)
+    red, black = red_black(fixed.shape)
+    free = ~fixed[1:-1, 1:-1, 1:-1]
+    free = (red & free, black & free)
+    if multigrid:
+        mg = Multigrid(fixed, h)
+    elif omega is None:
+        # Optimal over-relaxation of the Laplace problem on the longest axis
+        omega = 2/(1 + math.sin(math.pi/max(fixed.shape)))
+
+    res = math.inf
+    for it in range(1, max_iter + 1):
+        if multigrid:
+            mg.cycle(u, f)
+        else:
+            smooth(u, f, free, h, omega)
+        if multigrid or it % 10 == 0:
+            res = np.abs(residual(u, f, fixed, h)).max() / scale
+            if verbose:
+                print(f"iteration {it}: residual {res:.3e}")
+            if res < tol:
+                break
+    return u, it, res
+
+
+def electric_field(u, h):
+    """Field components -grad V (V/cm) on the nodes."""
+    return [-g for g in np.gradient(u, *h)]
+
+
+def write_efield(path, u, h, half, meta=None):
+    ex, ey, ez = electric_field(u, h)
+    meta = dict(meta or {})
+    meta.update({'units': 'cm, V, V/cm', 'shape': list(u.shape),
+                 'lo': [float(-a) for a in half], 'hi': [float(a) for a in half]})
+    write_columns(path, {'potential': u.astype(np.float32), 'Ex': ex.astype(np.float32),
+                         'Ey': ey.astype(np.float32), 'Ez': ez.astype(np.float32)}, meta=meta)
+
+
+def load_efield(path):
+    """Memory-map a field map written by write_efield().
+
+    Returns:
+        Tuple of (columns, meta); columns are read-only (nx, ny, nz) views
+        of potential, Ex, Ey and Ez on the nodes from meta['lo'] to meta['hi']
+    """
+    return read_columns(path, mmap=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', nargs='+', help='configuration file(s)')
+    parser.add_argument('--grid', nargs=3, type=int, default=[65, 65, 65], metavar=('NX', 'NY', 'NZ'),
+                        help='grid nodes along x (drift), y and z; odd sizes coarsen best')
+    parser.add_argument('--field', type=float, default=NOMINAL_FIELD,
+                        help=f'nominal drift field in V/cm setting the cathode voltage (default {NOMINAL_FIELD})')
+    parser.add_argument('--hv', type=float, default=None, help='cathode voltage in V, overrides --field')
+    parser.add_argument('--multigrid', action='store_true', help='solve with multigrid V-cycles')
+    parser.add_argument('--tol', type=float, default=1e-6, help='relative residual to stop at')
+    parser.add_argument('--max-iter', type=int, default=20000, help='iteration limit')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the residual history')
+    parser.add_argument('-o', '--output', default='efield.col', help='output file')
+    args = parser.parse_args(argv)
+
+    from validate import build_geometry
+
+    world, _ = build_geometry(args.config)
+    layout = field_cage_layout(world)
+    hv = args.hv if args.hv is not None else -args.field*(layout['anodes'][0] - layout['cathode'])
+    fixed, value, h = boundary_conditions(layout, tuple(args.grid), hv)
+    print(f"{np.prod(args.grid)} nodes, {fixed.sum()} fixed, spacing "
+          f"{' x '.join(f'{a:.2f}' for a in h)} cm, cathode at {hv:.0f} V")
+
+    start = time.perf_counter()
+    u, iterations, res = solve(fixed, value, h, args.multigrid, args.tol, args.max_iter,
+                               verbose=args.verbose)
+    elapsed = time.perf_counter() - start
+    method = 'multigrid' if args.multigrid else 'SOR'
+    print(f"{method}: {iterations} iterations, residual {res:.2e}, {elapsed:.2f} s")
+    if res >= args.tol:
+        print(f"Warning: not converged to {args.tol}")
+
+    write_efield(args.output, u, h, layout['half'],
+                 meta={'frame': layout['frame'], 'cathode_voltage': hv, 'method': method,
+                       'residual': float(res)})
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
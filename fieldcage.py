@@ -3,8 +3,18 @@
 Field Cage builder for ProtoDUNE-VD geometry
 '''
 
+import math
+
 import gegede.builder
+import gegede.construct
 from gegede import Quantity as Q
+import numpy as np
+
+from navigation import solid_volume
+from tessellate import cached_section, outline_distance, signed_area
+
+# Field shaper profiles
+SHAPER_KINDS = ('slim', 'thick')
 
 class FieldCageBuilder(gegede.builder.Builder):
     '''
@@ -35,6 +45,17 @@ class FieldCageBuilder(gegede.builder.Builder):
             self.base_length = fieldcage_parameters.get('FieldShaperBaseLength')
             self.base_width = fieldcage_parameters.get('FieldShaperBaseWidth')
             self.first_shaper_to_roof = fieldcage_parameters.get('FirstFieldShaper_to_MembraneRoof')
+            self.ranges = fieldcage_parameters.get(
+                'FieldShaperRanges', [(0, 36, 'slim'), (36, 78, 'thick'), (78, 114, 'slim')])
+
+            # Thick profile as Boolean tree or extrusions of its traced section
+            self.thick_profile_mode = fieldcage_parameters.get('thick_profile_mode', 'boolean')
+            self.profile_tolerance = fieldcage_parameters.get('profile_tolerance', Q('0.1mm'))
+            self.profile_cache_dir = fieldcage_parameters.get('profile_cache_dir', None)
+            self.section = None
+
+            # Slim shaper as detailed profile or mass-equivalent rectangle
+            self.slim_profile_mode = fieldcage_parameters.get('slim_profile_mode', 'detailed')
 
             # Calculate derived dimensions
             self.length = self.base_length - 2*self.tor_rad
@@ -157,15 +178,52 @@ class FieldCageBuilder(gegede.builder.Builder):
         
         return final_profile
 
+    def create_extruded_profile(self, geom, is_long=False):
+        """Field cage profile extruded from the traced cross-section of the
+        Boolean profile, within profile_tolerance of it"""
+        if self.section is None:
+            # Trace in a scratch geometry so the Boolean tree is not exported
+            scratch = gegede.construct.Geometry()
+            profile = self.create_profile(scratch, self.create_profile_components(scratch), "Short")
+            self.section = cached_section(scratch, profile, self.profile_tolerance.to('cm').magnitude,
+                                          self.profile_cache_dir)
+
+        prefix = "Long" if is_long else "Short"
+        half = 0.5*(self.width if is_long else self.length)
+        # Outlines first, then holes, which are made longer to cut cleanly
+        polys = sorted(self.section, key=lambda p: signed_area(p) > 0)
+        result = None
+        for k, poly in enumerate(polys):
+            hole = signed_area(poly) > 0
+            dz = half + Q('0.1mm') if hole else half
+            piece = geom.shapes.ExtrudedMany(
+                f"{prefix}FCProfile" if len(polys) == 1 else f"{prefix}FCSection{k}",
+                polygon=[(Q(float(u), 'cm'), Q(float(v), 'cm')) for u, v in poly],
+                zsections=[dict(z=-dz, offset=(Q('0mm'), Q('0mm')), scale=1.0),
+                           dict(z=dz, offset=(Q('0mm'), Q('0mm')), scale=1.0)])
+            if result is None:
+                result = piece
+                continue
+            result = geom.shapes.Boolean(
+                f"{prefix}FCProfile" if k == len(polys) - 1 else f"{prefix}FCSectionBool{k}",
+                type='subtraction' if hole else 'union', first=result, second=piece)
+        return result
+
     def construct_thick_profile(self, geom, fc_corner):
         """Construct the thick field cage profile"""
-        # Create short and long components
-        short_components = self.create_profile_components(geom, is_long=False)
-        long_components = self.create_profile_components(geom, is_long=True)
-        
-        # Create short and long profiles
-        short_profile = self.create_profile(geom, short_components, "Short")
-        long_profile = self.create_profile(geom, long_components, "Long")
+        if self.thick_profile_mode == 'extruded':
+            short_profile = self.create_extruded_profile(geom, is_long=False)
+            long_profile = self.create_extruded_profile(geom, is_long=True)
+        elif self.thick_profile_mode == 'boolean':
+            # Create short and long components
+            short_components = self.create_profile_components(geom, is_long=False)
+            long_components = self.create_profile_components(geom, is_long=True)
+
+            # Create short and long profiles
+            short_profile = self.create_profile(geom, short_components, "Short")
+            long_profile = self.create_profile(geom, long_components, "Long")
+        else:
+            raise ValueError(f"Unknown thick_profile_mode: {self.thick_profile_mode}")
         
         # Define complete field cage assembly parameters
         fc_assembly_params = [
@@ -235,7 +293,7 @@ class FieldCageBuilder(gegede.builder.Builder):
         
         return result
     
-    def construct_slim_profile(self, geom, fc_slim_corner):
+    def construct_slim_profile(self, geom, fc_slim_corner, mode=None):
         """Construct the slim field cage profile through extrusions and Boolean operations"""
         
         # Create the extruded profile for long field cage
@@ -324,6 +382,12 @@ class FieldCageBuilder(gegede.builder.Builder):
             (Q('3.571767039mm'), Q('-1.831707049mm'))
         )
 
+        mode = mode or self.slim_profile_mode
+        if mode == 'simple':
+            long_vertices = self.simplify_slim_profile(long_vertices)
+        elif mode != 'detailed':
+            raise ValueError(f"Unknown slim_profile_mode: {mode}")
+
         zsections=[
             dict(z=-0.5*self.width, offset=(Q('0mm'), Q('0mm')), scale = 1.0),
             dict(z=0.5*self.width, offset=(Q('0mm'), Q('0mm')), scale = 1.0),
@@ -438,6 +502,58 @@ class FieldCageBuilder(gegede.builder.Builder):
 
         return result
 
+    def simplify_slim_profile(self, vertices):
+        """Replace the slim profile by its bounding rectangle and publish the
+        aluminium/LAr mixture keeping the mass of the detailed shaper.
+
+        The corners become solid tori of the same outer radius, so the
+        simple shaper has the envelope of the detailed one. The aluminium
+        volume of the mixture comes from the profile area; the detailed
+        shaper solid, built in a scratch geometry, is measured against it.
+
+        Returns:
+            Rectangle vertices, clockwise
+        """
+        poly = np.array([[u.to('cm').magnitude, v.to('cm').magnitude] for u, v in vertices])
+        (u0, v0), (u1, v1) = poly.min(axis=0), poly.max(axis=0)
+
+        # Two long and two short sides and four quarter tori
+        perimeter = 2*(self.width + self.length).to('cm').magnitude
+        tor = self.tor_rad.to('cm').magnitude
+        rmin = self.slim_inner_radius.to('cm').magnitude
+        rmax = self.slim_outer_radius.to('cm').magnitude
+        corners = math.pi**2*tor*(rmax**2 - rmin**2)*2
+        aluminium = abs(signed_area(poly))*perimeter + corners
+        simple = (u1 - u0)*(v1 - v0)*perimeter + math.pi**2*tor*rmax**2*2
+
+        scratch = gegede.construct.Geometry()
+        # Defined by the world builder in the real geometry
+        scratch.structure.Rotation('rPlus90AboutX', x='90deg', y='0deg', z='0deg')
+        corner = scratch.shapes.Torus("FieldShaperSlimCorner", rmin=self.slim_inner_radius,
+                                      rmax=self.slim_outer_radius, rtor=self.tor_rad,
+                                      startphi="0deg", deltaphi="90deg")
+        detailed, error = solid_volume(scratch, self.construct_slim_profile(scratch, corner, 'detailed'))
+
+        self.effective_materials["FieldShaperSlimMixture"] = {
+            'volume': simple,
+            'fill': 'LAr',
+            'components': [('ALUMINUM_Al', aluminium)],
+            'detailed': [('ALUMINUM_Al', detailed)],
+            'detailed_error': [('ALUMINUM_Al', error)],
+        }
+        rect = np.array([(u1, v0), (u0, v0), (u0, v1), (u1, v1)])
+
+        # Farthest point of the rectangle outline from the detailed outline
+        t = np.linspace(0, 1, 256, endpoint=False)[:, None]
+        edge = np.concatenate([p + t*(q - p) for p, q in zip(rect, np.roll(rect, -1, axis=0))])
+        envelope = outline_distance(edge, poly).max()
+        if self.print_construct:
+            print(f"Simple slim field shaper: {simple:.1f} cm3 holding {aluminium:.1f} cm3 of "
+                  f"aluminium (detailed solid {detailed:.1f} +- {error:.1f} cm3), section "
+                  f"{u1 - u0:.3f} x {v1 - v0:.3f} cm, largest distance to the detailed "
+                  f"outline {10*envelope:.2f} mm")
+        return tuple((Q(u, 'cm'), Q(v, 'cm')) for u, v in rect)
+
     def construct(self, geom):
         """Construct the Field Cage geometry"""
         if self.print_construct:
@@ -453,9 +569,13 @@ class FieldCageBuilder(gegede.builder.Builder):
             deltaphi="90deg"
         )
 
+        # Mixtures of simplified parts, defined by the world builder
+        self.effective_materials = {}
+        simple = self.slim_profile_mode == 'simple'
+
         fc_slim_corner = geom.shapes.Torus(
             "FieldShaperSlimCorner", 
-            rmin=self.slim_inner_radius,
+            rmin=Q('0cm') if simple else self.slim_inner_radius,
             rmax=self.slim_outer_radius,
             rtor=self.tor_rad,
             startphi="0deg",
@@ -478,53 +598,73 @@ class FieldCageBuilder(gegede.builder.Builder):
 
         fc_slim_vol = geom.structure.Volume(
             "volFieldShaperSlim",
-            material="ALUMINUM_Al", 
+            material="FieldShaperSlimMixture" if simple else "ALUMINUM_Al", 
             shape=fc_slim_shape
         )
 
         self.add_volume(fc_vol)
         self.add_volume(fc_slim_vol)
 
+    def shaper_ranges(self):
+        """Runs of identical field shapers as (first, stop, kind) index ranges.
+
+        The configured ranges must cover all shapers in order; ranges
+        beyond NFieldShapers are cut.
+        """
+        runs, first = [], 0
+        for start, stop, kind in self.ranges:
+            if kind not in SHAPER_KINDS:
+                raise ValueError(f"Unknown field shaper kind: {kind}")
+            if start != first or stop <= start:
+                raise ValueError(f"Field shaper ranges are not contiguous at {start}")
+            stop = min(stop, self.n_shapers)
+            if stop > start:
+                runs.append((start, stop, kind))
+            first = stop
+        if first != self.n_shapers:
+            raise ValueError(f"Field shaper ranges end at {first}, not at {self.n_shapers}")
+        return runs
+
+    def shaper_positions(self, offset_x):
+        """Drift positions of the field shapers.
+
+        Args:
+            offset_x: Position of the membrane roof along the drift
+
+        Returns:
+            List of (kind, first, x) per run, x the array of shaper
+            positions in cm
+        """
+        top = (offset_x - self.first_shaper_to_roof).to('cm').magnitude
+        sep = self.separation.to('cm').magnitude
+        return [(kind, first, top - sep*np.arange(first, stop))
+                for first, stop, kind in self.shaper_ranges()]
+
     def place_in_volume(self, geom, volume, offset_x):
         """Place field cage shapers in the given volume"""
         
-        # Get field cage volumes
-        fc_vol = self.get_volume('volFieldShaper')
-        fc_slim_vol = self.get_volume('volFieldShaperSlim')
+        # Volume, transverse position and rotation of each profile
+        profiles = {
+            'slim': (self.get_volume('volFieldShaperSlim'), Q('0cm'),
+                     0.5*self.length + self.tor_rad, "rPlus90AboutXPlus90AboutZ"),
+            'thick': (self.get_volume('volFieldShaper'), 0.5*self.width + self.tor_rad,
+                      Q('0cm'), "rIdentity"),
+        }
 
         # Place field cage shapers
-        for i in range(self.n_shapers):
-            # Calculate position
-            dist = i * self.separation
-            pos_x = offset_x - self.first_shaper_to_roof - dist
-            
-            if i < 36 or i > 77:  # Slim shapers at start and end
-                #Create placement for slim shaper
+        for kind, first, xs in self.shaper_positions(offset_x):
+            vol, pos_y, pos_z, rot = profiles[kind]
+            for i, pos_x in enumerate(xs, first):
                 pos = geom.structure.Position(
                     f"posFieldShaper{i}",
-                    x=pos_x,
-                    y=Q('0cm'),
-                    z=0.5*self.length + self.tor_rad
+                    x=Q(float(pos_x), 'cm'),
+                    y=pos_y,
+                    z=pos_z
                 )
                 place = geom.structure.Placement(
                     f"placeFieldShaper{i}",
-                    volume=fc_slim_vol,
+                    volume=vol,
                     pos=pos,
-                    rot="rPlus90AboutXPlus90AboutZ"
-                )
-            else:  # Thick shapers in middle
-                # Create placement for thick shaper
-                pos = geom.structure.Position(
-                    f"posFieldShaper{i}",
-                    x=pos_x,
-                    y=0.5*self.width + self.tor_rad,
-                    z=Q('0cm')
+                    rot=rot
                 )
-                place = geom.structure.Placement(
-                    f"placeFieldShaper{i}", 
-                    volume=fc_vol,
-                    pos=pos,
-                    rot="rIdentity"
-                )
-            
-            volume.placements.append(place.name)
+                volume.placements.append(place.name)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+'''
+GDML export extensions for ProtoDUNE-VD geometry
+
+GeGeDe only knows plain placements. Builders can mark a Placement as a
+replica or division with register_replica(); when the GDML exporter
+writes the mother volume, the matching <physvol> is replaced by a
+<replicavol> or <divisionvol> node. The placement itself is kept in the
+store so the exporter still walks into the replicated cell volume.
+
+Registrations are kept per geometry. The exporter only substitutes them
+once install() has been called for that geometry, as the world builder
+does at the end of its construct for gegede-cli, or during convert().
+'''
+
+from lxml import etree
+import gegede.export.gdml as gdml
+
+AXES = {'x': 'kXAxis', 'y': 'kYAxis', 'z': 'kZAxis'}
+
+
+def replicas_of(geom):
+    """Replica registry of a geometry.
+
+    Returns:
+        dict of placement name -> (placement, kind, axis, number, width, offset)
+    """
+    if not hasattr(geom, 'replicas'):
+        geom.replicas = {}
+    return geom.replicas
+
+
+def register_replica(geom, place, kind, axis, number, width, offset=0.0):
+    """Export a placement as a replica or division of its mother volume.
+
+    The mother must contain nothing but this placement and be fully filled
+    by number cells of the given width (cm) along axis.
+
+    Args:
+        geom: Geometry the placement belongs to
+        place: Placement of the cell volume in the mother
+        kind: 'replica' or 'division'
+        axis: 'x', 'y' or 'z'
+        number: Number of cells
+        width: Cell width along axis in cm
+        offset: Offset of the first cell in cm
+    """
+    if kind not in ('replica', 'division'):
+        raise ValueError(f"Unknown replica kind: {kind}")
+    if axis not in AXES:
+        raise ValueError(f"Unknown replica axis: {axis}")
+    replicas_of(geom)[place.name] = (place, kind, axis, int(number), float(width), float(offset))
+
+
+def make_replica_node(place, kind, axis, number, width, offset):
+    """Build the <replicavol> or <divisionvol> node for a registered placement."""
+    if kind == 'division':
+        node = etree.Element('divisionvol', axis=AXES[axis], number=str(number),
+                             width=str(width), offset=str(offset), unit='cm')
+        node.append(etree.Element('volumeref', ref=place.volume))
+        return node
+
+    node = etree.Element('replicavol', number=str(number))
+    node.append(etree.Element('volumeref', ref=place.volume))
+    along = etree.SubElement(node, 'replicate_along_axis')
+    along.append(etree.Element('direction', **{axis: '1'}))
+    along.append(etree.Element('width', value=str(width), unit='cm'))
+    along.append(etree.Element('offset', value=str(offset), unit='cm'))
+    return node
+
+
+_make_volume_node = gdml.make_volume_node
+
+
+def make_volume_node(vol, store, replicas):
+    """GDML volume node with registered replica placements substituted."""
+    node = _make_volume_node(vol, store)
+    for pvol, placename in zip(node.findall('physvol'), vol.placements or []):
+        entry = replicas.get(placename)
+        if entry and entry[0] is store[placename]:
+            node.replace(pvol, make_replica_node(*entry))
+    return node
+
+
+def install(geom):
+    """Make the GeGeDe GDML exporter substitute the replicas of geom.
+
+    Replaces any earlier installation, so registrations of other
+    geometries are never exported.
+
+    Returns:
+        The volume node function that was installed before
+    """
+    previous = gdml.make_volume_node
+    replicas = replicas_of(geom)
+    if replicas:
+        gdml.make_volume_node = lambda vol, store: make_volume_node(vol, store, replicas)
+    else:
+        gdml.make_volume_node = _make_volume_node
+    return previous
+
+
+def convert(geom):
+    """gegede.export.gdml.convert() of geom with its replicas substituted."""
+    previous = install(geom)
+    try:
+        return gdml.convert(geom)
+    finally:
+        gdml.make_volume_node = previous
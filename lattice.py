@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+'''
+Square lattice placement for ProtoDUNE-VD geometry
+
+A lattice is an n x n grid of identical centre cells at a fixed pitch,
+centred on the mother, framed on its east (+x), south (+y), west (-x) and
+north (-y) sides by one row of edge cells each. Every edge has its own
+cell volume, width (its size across the edge) and rotation. All
+transforms are computed in one array pass, and rotations are shared
+through canonical names, one per set of angles. Lengths are plain floats
+in cm.
+
+    edges = {'E': (vol_top, 108.4, None), 'S': (vol_top, 108.4, (0, 0, -90)), ...}
+    place_lattice(geom, mother, 'TB', 5, 160.0, (vol_cent, None), edges)
+'''
+
+import numpy as np
+from gegede import Quantity as Q
+
+# Edge sides with the axis across them and their sign
+EDGES = {'E': (0, 1), 'S': (1, 1), 'W': (0, -1), 'N': (1, -1)}
+
+LATTICE_DTYPE = np.dtype([('cell', 'U4'), ('i', np.int32), ('j', np.int32),
+                          ('x', np.float64), ('y', np.float64)])
+
+
+def lattice_transforms(n, pitch, widths):
+    """Cell positions of a lattice, in placement order.
+
+    The n*n centre cells come first, row by row, then for each row the
+    edge cells in E, S, W, N order.
+
+    Args:
+        n: Centre cells per side
+        pitch: Centre cell pitch
+        widths: {edge: edge cell width} for the edges to fill
+
+    Returns:
+        Structured array of LATTICE_DTYPE; centre cells have cell 'Cent'
+        and edge cells i = j = row
+    """
+    base = (np.arange(n) - (n - 1)/2) * pitch
+    cent = np.zeros(n*n, dtype=LATTICE_DTYPE)
+    cent['cell'] = 'Cent'
+    cent['i'], cent['j'] = np.divmod(np.arange(n*n), n)
+    cent['x'], cent['y'] = base[cent['i']], base[cent['j']]
+
+    sides = [e for e in EDGES if e in widths]
+    edge = np.zeros((n, len(sides)), dtype=LATTICE_DTYPE)
+    edge['i'] = edge['j'] = np.arange(n)[:, None]
+    for k, side in enumerate(sides):
+        axis, sign = EDGES[side]
+        offset = sign*(n*pitch + widths[side])/2
+        edge['cell'][:, k] = side
+        edge['x'][:, k], edge['y'][:, k] = (offset, base) if axis == 0 else (base, offset)
+    return np.concatenate([cent, edge.ravel()])
+
+
+def lattice_extent(n, pitch, widths):
+    """Full (x, y) size of a lattice with its edge rows."""
+    return (n*pitch + widths.get('E', 0) + widths.get('W', 0),
+            n*pitch + widths.get('S', 0) + widths.get('N', 0))
+
+
+def canonical_rotation(geom, rot):
+    """Rotation name for None, a name or (x, y, z) angles in degrees.
+
+    Angles get one shared Rotation, named after them, per geometry.
+    """
+    if rot is None or isinstance(rot, str):
+        return rot
+    name = "rotLattice_" + "_".join(f"{a:g}".replace('-', 'm') for a in rot)
+    if name not in geom.store.structure:
+        geom.structure.Rotation(name, **{axis: f"{a:g}deg" for axis, a in zip('xyz', rot)})
+    return name
+
+
+def place_lattice(geom, mother, label, n, pitch, centre, edges):
+    """Place a lattice of cells in a mother volume.
+
+    Positions are named posUnit{label}Cent_{i}-{j} and posUnit{label}{edge}_{i},
+    placements likewise with volUnit.
+
+    Args:
+        mother: Mother volume
+        label: Name label of the lattice
+        n, pitch: Centre cells per side and their pitch
+        centre: (volume, rotation) of the centre cells
+        edges: {edge: (volume, width, rotation)}; rotations are None, a
+            name or (x, y, z) angles in degrees
+    """
+    cells = dict(edges, Cent=(centre[0], None, centre[1]))
+    rots = {cell: canonical_rotation(geom, rot) for cell, (_, _, rot) in cells.items()}
+    table = lattice_transforms(n, pitch, {e: w for e, (_, w, _) in edges.items()})
+
+    for cell, i, j, x, y in table.tolist():
+        suffix = f"Cent_{i}-{j}" if cell == 'Cent' else f"{cell}_{i}"
+        pos = geom.structure.Position(f"posUnit{label}{suffix}",
+                                      x=Q(x, 'cm'), y=Q(y, 'cm'), z=Q('0cm'))
+        place = geom.structure.Placement(f"volUnit{label}{suffix}",
+                                         volume=cells[cell][0], pos=pos, rot=rots[cell])
+        mother.placements.append(place.name)
+    return table
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+'''
+Optical detector map for ProtoDUNE-VD geometry
+
+Walks the placement tree down to every photon-sensitive volume (volume
+parameter SensDet = PhotonDetector), composes the placement transforms
+and writes one row per optical detector with its global centre, active
+surface normal and area as a columnar table next to the GDML. Subtrees
+without photon detectors, such as the wire planes, are not visited.
+All lengths are plain floats in cm.
+'''
+
+import math
+
+import numpy as np
+
+from columnar import read_columns, write_columns
+from gdmlext import replicas_of
+from transforms import placement_transform, replica_offsets
+
+# Photon detectors read out on both faces
+DOUBLE_SIDED = ('volXARAPUCADoubleWindow',)
+
+# Aperture outlines
+APERTURE_RECTANGLE = 0
+APERTURE_ELLIPSE = 1
+
+
+def _cm(q):
+    return float(q.to('cm').magnitude)
+
+
+def is_photon_detector(vol):
+    return ('SensDet', 'PhotonDetector') in (vol.params or [])
+
+
+def active_surface(shape):
+    """Active surface of a photon detector solid in its local frame.
+
+    Boxes are read out on a face normal to their thinnest axis, disks on
+    their face and spherical shells on their outer cap, all facing the
+    local axis. The aperture is the outline through which light reaches
+    the surface: the face rectangle, the disk, or the rim circle of the
+    cap, given by its centre and two half-axis vectors.
+
+    Returns:
+        Tuple of (centre, normal, area, flip, aperture) where flip tells
+        whether the normal sign is free and should be chosen to face the
+        mother centre, and aperture is (kind, centre, u, v) with kind
+        APERTURE_RECTANGLE or APERTURE_ELLIPSE
+    """
+    kind = type(shape).__name__
+    if kind == 'Box':
+        half = np.array([_cm(shape.dx), _cm(shape.dy), _cm(shape.dz)])
+        axis = int(np.argmin(half))
+        u, v = [half[k]*np.eye(3)[k] for k in range(3) if k != axis]
+        area = 4*np.prod(np.delete(half, axis))
+        return (np.zeros(3), np.eye(3)[axis], area, True,
+                (APERTURE_RECTANGLE, np.zeros(3), u, v))
+    if kind == 'Tubs':
+        dphi = float(shape.dphi.to('radian').magnitude)
+        rmax = _cm(shape.rmax)
+        area = 0.5*dphi*(rmax**2 - _cm(shape.rmin)**2)
+        centre = np.array([0.0, 0.0, _cm(shape.dz)])
+        return (centre, np.array([0.0, 0.0, 1.0]), area, False,
+                (APERTURE_ELLIPSE, centre, np.array([rmax, 0.0, 0.0]), np.array([0.0, rmax, 0.0])))
+    if kind == 'Sphere':
+        r = _cm(shape.rmax)
+        t1 = float(shape.stheta.to('radian').magnitude)
+        t2 = t1 + float(shape.dtheta.to('radian').magnitude)
+        dphi = float(shape.dphi.to('radian').magnitude)
+        area = dphi*r**2*(math.cos(t1) - math.cos(t2))
+        # Centroid of a spherical zone lies midway between its two heights
+        centre = np.array([0.0, 0.0, 0.5*r*(math.cos(t1) + math.cos(t2))])
+        rim = r*math.sin(t2)
+        return (centre, np.array([0.0, 0.0, 1.0]), area, False,
+                (APERTURE_ELLIPSE, np.array([0.0, 0.0, r*math.cos(t2)]),
+                 np.array([rim, 0.0, 0.0]), np.array([0.0, rim, 0.0])))
+    raise NotImplementedError(f"No active surface for {kind} photon detectors")
+
+
+def optical_channels(geom, top):
+    """Global position, normal and area of every photon detector below top.
+
+    Rows follow the placement order of the tree, the order in which the
+    GDML lists the physical volumes.
+
+    Args:
+        geom: Geometry object
+        top: Volume (or name) defining the global frame, normally the world
+
+    Returns:
+        dict of columns: opdet, volume (index into the returned names),
+        faces, x, y, z, nx, ny, nz, area (cm^2 per face), aperture (kind)
+        with centre ax, ay, az and half axes ux, uy, uz and vx, vy, vz; and
+        the list of photon detector volume names
+    """
+    store = geom.store.structure
+    replicas = replicas_of(geom)
+    if isinstance(top, str):
+        top = store[top]
+
+    # Volumes with a photon detector somewhere below them
+    hosts = {}
+
+    def has_pd(vol):
+        if vol.name not in hosts:
+            hosts[vol.name] = is_photon_detector(vol) or any(
+                has_pd(store[store[p].volume]) for p in vol.placements or [])
+        return hosts[vol.name]
+
+    names, rows = [], []
+
+    def visit(vol, rot, pos, mother_pos):
+        if is_photon_detector(vol):
+            centre, normal, area, flip, (kind, ac, u, v) = active_surface(geom.store.shapes[vol.shape])
+            centre, normal = rot @ centre + pos, rot @ normal
+            if flip and normal @ (mother_pos - centre) < 0:
+                normal = -normal
+            if vol.name not in names:
+                names.append(vol.name)
+            rows.append((names.index(vol.name), 2 if vol.name in DOUBLE_SIDED else 1,
+                         centre, normal, area, kind, rot @ ac + pos, rot @ u, rot @ v))
+        for placename in vol.placements or []:
+            place = store[placename]
+            daughter = store[place.volume]
+            if not has_pd(daughter):
+                continue
+            r, t = placement_transform(store, place)
+            shifts = replica_offsets(place, replicas)
+            for shift in ([np.zeros(3)] if shifts is None else shifts):
+                visit(daughter, rot @ r, rot @ (t + shift) + pos, pos)
+
+    visit(top, np.eye(3), np.zeros(3), np.zeros(3))
+
+    n = len(rows)
+    table = {'opdet': np.arange(n, dtype=np.int32),
+             'volume': np.array([r[0] for r in rows], dtype=np.int16),
+             'faces': np.array([r[1] for r in rows], dtype=np.int8)}
+    for prefix, col in (('', 2), ('n', 3)):
+        vec = np.array([r[col] for r in rows]).reshape(n, 3)
+        for k, axis in enumerate('xyz'):
+            table[prefix + axis] = vec[:, k]
+    table['area'] = np.array([r[4] for r in rows], dtype=float)
+    table['aperture'] = np.array([r[5] for r in rows], dtype=np.int8)
+    for prefix, col in (('a', 6), ('u', 7), ('v', 8)):
+        vec = np.array([r[col] for r in rows]).reshape(n, 3)
+        for k, axis in enumerate('xyz'):
+            table[prefix + axis] = vec[:, k]
+    return table, names
+
+
+def export_optical_map(geom, top, path):
+    """Write the optical detector map of all photon detectors below top."""
+    table, names = optical_channels(geom, top)
+    top_name = top if isinstance(top, str) else top.name
+    write_columns(path, table, meta={'frame': top_name, 'units': 'cm',
+                                     'volumes': names, 'nopdets': len(table['opdet'])})
+    return table
+
+
+def load_optical_map(path):
+    """Memory-map an optical detector map written by export_optical_map().
+
+    Returns:
+        Tuple of (columns, meta); meta['volumes'] names the volume column
+    """
+    return read_columns(path, mmap=True)
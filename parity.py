@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+'''
+Parity and performance checks against the Perl ProtoDUNE-VD generator
+
+The wire generation subroutines of the original Perl script (lineClip,
+gen_Wires, split_wires and flip_wires) are extracted from
+v0/generate_protodunevd_v4_refactored.pl and run with perl on the same
+parameters as the Python builder; the resulting U/V wire tables are
+compared field by field. The full Perl script needs the gdmlMaterials
+module, so placements are compared against Perl GDML files provided by
+the user. Both GDML files are read with streaming XML parsing.
+
+    python parity.py wires protodune_vd.cfg
+    python parity.py run protodune_vd.cfg --perl-gdml protodunevd_v4.gdml
+'''
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+from lxml import etree
+import gegede.export.gdml
+import gegede.main
+
+import gdmlext
+from tpcs import WIRE_DTYPE
+from transforms import rotation_matrix
+from validate import build_geometry, find_builder
+
+PERL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'v0', 'generate_protodunevd_v4_refactored.pl')
+PERL_SUBS = ('lineClip', 'gen_Wires', 'split_wires', 'flip_wires')
+
+# Same sequence as gen_TopCRP: wires of the first CRU, flipped for the
+# second CRU, both split at y = 0, then numbered across the four quadrants
+PERL_DRIVER = r'''
+use Math::Trig;
+
+%s
+
+my ($length, $width, $dia, $offx, $offy, @views) = @ARGV;
+while (@views) {
+    my ($view, $nch, $pitch, $angle) = splice(@views, 0, 4);
+    my @winfo1 = gen_Wires($length, $width, $nch, $pitch, $angle, $dia, $offx, $offy);
+    my @winfo2 = flip_wires(\@winfo1);
+    my ($winfo1a, $winfo1b) = split_wires(\@winfo1, $width, $angle);
+    my ($winfo2a, $winfo2b) = split_wires(\@winfo2, $width, $angle);
+    my @quads = ($winfo1a, $winfo1b, $winfo2a, $winfo2b);
+    my $count = 0;
+    foreach my $quad (0..3) {
+        foreach my $wire (@{$quads[$quad]}) {
+            $wire->[0] = $count++;
+            printf("W %%s %%d %%d %%.17g %%.17g %%.17g %%.17g %%.17g %%.17g %%.17g\n",
+                   $view, $quad, @$wire);
+        }
+    }
+}
+'''
+
+LENGTH_UNITS = {'mm': 0.1, 'cm': 1.0, 'm': 100.0}
+ANGLE_UNITS = {'deg': 1.0, 'degree': 1.0, 'rad': 180.0/np.pi, 'radian': 180.0/np.pi}
+
+
+def extract_perl_subs(script, names=PERL_SUBS):
+    """Return the source of the named subroutines of a Perl script.
+
+    A subroutine runs from its 'sub name' line to the first closing
+    brace in the first column.
+    """
+    with open(script) as f:
+        lines = f.readlines()
+    subs = []
+    for name in names:
+        start = next((i for i, line in enumerate(lines)
+                      if re.match(rf'sub\s+{name}\b', line)), None)
+        if start is None:
+            raise ValueError(f"No subroutine {name} in {script}")
+        end = next(i for i in range(start + 1, len(lines)) if lines[i].startswith('}'))
+        subs.append(''.join(lines[start:end + 1]))
+    return '\n'.join(subs)
+
+
+def perl_wire_configs(params, script=PERL_SCRIPT, perl='perl'):
+    """Run the Perl wire generation on TPC parameters.
+
+    Returns:
+        dict: {'U': [quad0, ..., quad3], 'V': [...]} of WIRE_DTYPE arrays,
+        with the Perl wire numbers running across the four quadrants; the
+        Perl tables have no CRU channels, cru_ch is -1
+    """
+    def cm(q):
+        return repr(float(q.to('cm').magnitude))
+
+    args = [cm(params['lengthPCBActive']), cm(params['widthPCBActive']),
+            cm(params['padWidth'])] + [cm(off) for off in params['offsetUVwire']]
+    for view, chans in [('U', 'Ind1'), ('V', 'Ind2')]:
+        args += [view, str(params['nChans'][chans]), cm(params['wirePitch'][view]),
+                 repr(float(params['wireAngle'][view].to('deg').magnitude))]
+
+    with tempfile.NamedTemporaryFile('w', suffix='.pl', delete=False) as f:
+        f.write(PERL_DRIVER % extract_perl_subs(script))
+    try:
+        out = subprocess.run([perl, f.name] + args, check=True,
+                             capture_output=True, text=True).stdout
+    finally:
+        os.unlink(f.name)
+
+    rows = defaultdict(list)
+    for line in out.splitlines():
+        if line.startswith('W '):
+            _, view, quad, *values = line.split()
+            rows[view, int(quad)].append(tuple([int(values[0])] + [float(v) for v in values[1:]]
+                                               + [-1]))
+    return {view: [np.array(rows[view, quad], dtype=WIRE_DTYPE) for quad in range(4)]
+            for view in ('U', 'V')}
+
+
+def compare_wire_configs(python, perl, tol=1e-9):
+    """Compare Python and Perl wire tables field by field.
+
+    The Perl script numbers wires across the four quadrants, so Python
+    wire numbers are offset by the wire count of the preceding quadrants.
+
+    Returns:
+        True if wire counts and numbers agree and no coordinate differs by more than tol (cm)
+    """
+    ok = True
+    fields = [f for f in WIRE_DTYPE.names if f not in ('ch', 'cru_ch')]
+    for view in ('U', 'V'):
+        first = 0
+        for quad, (py, pl) in enumerate(zip(python[view], perl[view])):
+            if len(py) != len(pl):
+                print(f"FAIL {view} quad {quad}: {len(py)} Python vs {len(pl)} Perl wires")
+                ok = False
+                first += len(py)
+                continue
+            dev = max([np.abs(py[f] - pl[f]).max() for f in fields]) if len(py) else 0.0
+            chok = np.array_equal(py['ch'] + first, pl['ch'])
+            good = dev <= tol and chok
+            ok &= good
+            print(f"{'OK  ' if good else 'FAIL'} {view} quad {quad}: {len(py)} wires, "
+                  f"max deviation {dev:.3g} cm{'' if chok else ', wire numbers differ'}")
+            first += len(py)
+    return ok
+
+
+def _number(text, scale=1.0):
+    """Numeric attribute value; the Perl GDML may hold plain arithmetic."""
+    if text is None:
+        return 0.0
+    try:
+        return float(text) * scale
+    except ValueError:
+        if not re.fullmatch(r'[\d\s.eE+\-*/()]+', text):
+            raise ValueError(f"Cannot evaluate GDML value {text!r}")
+        return float(eval(text, {'__builtins__': {}}, {})) * scale
+
+
+def _position(elem):
+    scale = LENGTH_UNITS[elem.get('unit', 'mm')]
+    return np.array([_number(elem.get(a), scale) for a in 'xyz'])
+
+
+def _rotation(elem):
+    scale = ANGLE_UNITS[elem.get('unit', 'rad')]
+    return rotation_matrix(*[_number(elem.get(a), scale) for a in 'xyz'])
+
+
+def _physvol(elem):
+    """(daughter, position, rotation) of a physvol; refs are kept as names."""
+    daughter, pos, rot = None, np.zeros(3), np.eye(3)
+    for child in elem:
+        if child.tag == 'volumeref':
+            daughter = child.get('ref')
+        elif child.tag == 'positionref':
+            pos = child.get('ref')
+        elif child.tag == 'position':
+            pos = _position(child)
+        elif child.tag == 'rotationref':
+            rot = child.get('ref')
+        elif child.tag == 'rotation':
+            rot = _rotation(child)
+    return daughter, pos, rot
+
+
+def normalize_name(name):
+    """Volume name key shared by both generators (case and underscores ignored)."""
+    return name.replace('_', '').lower()
+
+
+def read_placements(paths):
+    """Stream GDML file(s) and collect all physvol transforms.
+
+    Defines are shared between files, as for the Perl GDML fragments.
+
+    Returns:
+        dict: {(mother, daughter): [(R, t), ...]} with normalised volume
+        names, R the active rotation and t the translation in cm
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    positions, rotations, physvols = {}, {}, []
+    for path in paths:
+        mother_vols = []
+        for event, elem in etree.iterparse(path, events=('end',)):
+            if elem.tag == 'position' and elem.getparent().tag == 'define':
+                positions[elem.get('name')] = _position(elem)
+            elif elem.tag == 'rotation' and elem.getparent().tag == 'define':
+                rotations[elem.get('name')] = _rotation(elem)
+            elif elem.tag == 'physvol':
+                mother_vols.append(elem)
+            elif elem.tag in ('volume', 'assembly'):
+                mother = normalize_name(elem.get('name'))
+                for pvol in mother_vols:
+                    physvols.append((mother, _physvol(pvol)))
+                mother_vols = []
+                elem.clear()
+
+    placements = defaultdict(list)
+    for mother, (daughter, pos, rot) in physvols:
+        t = positions[pos] if isinstance(pos, str) else pos
+        r = rotations[rot] if isinstance(rot, str) else rot
+        placements[mother, normalize_name(daughter)].append((r, t))
+    return placements
+
+
+def compare_placements(python, perl, tol=1e-6):
+    """Compare placement transforms keyed by (mother, daughter) volume names.
+
+    Copies of the same daughter in a mother are matched after sorting by
+    translation.
+
+    Returns:
+        True if both sides place the same volumes with transforms agreeing within tol
+    """
+    def ordered(transforms):
+        keys = np.array([np.round(t, 6) for r, t in transforms])
+        order = np.lexsort(keys.T[::-1])
+        return [transforms[i] for i in order]
+
+    common = sorted(set(python) & set(perl))
+    only_py = sorted(set(python) - set(perl))
+    only_pl = sorted(set(perl) - set(python))
+    ok = not only_py and not only_pl
+    worst = 0.0
+    for key in common:
+        a, b = python[key], perl[key]
+        if len(a) != len(b):
+            print(f"FAIL {key[0]} -> {key[1]}: {len(a)} Python vs {len(b)} Perl copies")
+            ok = False
+            continue
+        dev = max(max(np.abs(ra - rb).max(), np.abs(ta - tb).max())
+                  for (ra, ta), (rb, tb) in zip(ordered(a), ordered(b)))
+        worst = max(worst, dev)
+        if dev > tol:
+            print(f"FAIL {key[0]} -> {key[1]}: max deviation {dev:.3g}")
+            ok = False
+    for side, keys in (('Python', only_py), ('Perl', only_pl)):
+        for mother, daughter in keys:
+            print(f"ONLY {side}: {mother} -> {daughter}")
+    print(f"{'OK' if ok else 'FAIL'}: {len(common)} common mother/daughter pairs, "
+          f"{len(only_py)} Python only, {len(only_pl)} Perl only, max deviation {worst:.3g}")
+    return ok
+
+
+def configure_tpcs(config_files):
+    """Configure the builder tree and return the TPC builder."""
+    cfg = gegede.main.parse_config(config_files)
+    wbuilder = gegede.main.make_builder(cfg, None)
+    gegede.main.configure_builder(cfg, wbuilder)
+    return find_builder(wbuilder, 'tpcs')
+
+
+def check_wires(tpcs, script=PERL_SCRIPT, tol=1e-9):
+    """Generate the wire tables with both generators, time and compare them."""
+    start = time.perf_counter()
+    python = tpcs.generate_wire_configs()
+    t_python = time.perf_counter() - start
+    start = time.perf_counter()
+    perl = perl_wire_configs(tpcs.params, script)
+    t_perl = time.perf_counter() - start
+    print(f"wire generation: Python {t_python:.3f} s, Perl {t_perl:.3f} s")
+    return compare_wire_configs(python, perl, tol)
+
+
+def run(config_files, perl_gdml=None, script=PERL_SCRIPT, wires=True, tol=1e-6,
+        output=None):
+    """Time a full build and check wires and placements against the Perl generator."""
+    timings = {}
+    wbuilder, geom = build_geometry(config_files, {'tpcs': {'wires_on': wires}},
+                                    timings=timings)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = output or os.path.join(tmp, 'python.gdml')
+        start = time.perf_counter()
+        gegede.export.gdml.output(gdmlext.convert(geom), path)
+        timings['gdml'] = time.perf_counter() - start
+        for phase in ('configure', 'construct', 'gdml'):
+            print(f"{phase:>10}: {timings[phase]:8.2f} s")
+        print(f"{'size':>10}: {os.path.getsize(path)/1e6:8.2f} MB")
+
+        ok = check_wires(find_builder(wbuilder, 'tpcs'), script)
+        if perl_gdml:
+            start = time.perf_counter()
+            python = read_placements(path)
+            perl = read_placements(perl_gdml)
+            print(f"placement parsing: {time.perf_counter() - start:.2f} s")
+            ok &= compare_placements(python, perl, tol)
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('wires', help='compare Python and Perl U/V wire tables')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--perl-script', default=PERL_SCRIPT, help='Perl generator script')
+    p.add_argument('--tol', type=float, default=1e-9, help='coordinate tolerance in cm')
+
+    p = sub.add_parser('run', help='timed build with wire and placement parity checks')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--perl-script', default=PERL_SCRIPT, help='Perl generator script')
+    p.add_argument('--perl-gdml', nargs='+', help='GDML file(s) written by the Perl generator')
+    p.add_argument('--no-wires', action='store_true', help='build without wires')
+    p.add_argument('--tol', type=float, default=1e-6, help='placement tolerance')
+    p.add_argument('-o', '--output', help='keep the Python GDML in this file')
+
+    args = parser.parse_args(argv)
+    if args.command == 'wires':
+        ok = check_wires(configure_tpcs(args.config), args.perl_script, args.tol)
+    else:
+        ok = run(args.config, args.perl_gdml, args.perl_script, not args.no_wires,
+                 args.tol, args.output)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
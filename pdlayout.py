@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+'''
+Photon detector layout tables for ProtoDUNE-VD geometry
+
+A layout table is a list of rows, one per photon detector slot, giving
+its type, rotation name and x, y, z position. Each coordinate is a
+linear combination of named parameters, written as a dictionary of
+{parameter: coefficient}; the key 'cm' adds a constant in cm. Parameters
+may be scalars or arrays with one value per copy of the layout (e.g. one
+per cathode module), so a whole detector is evaluated with a single
+matrix product. A row with a 'when' dictionary only applies to copies
+whose parameters take the given values and then replaces the earlier
+row of the same slot. All lengths are plain floats in cm.
+
+    rows = [{'slot': 0, 'type': 'double', 'rot': 'rIdentity',
+             'x': {'module_x': 1}, 'y': {'module_y': 1, 'GapPD': 1},
+             'z': {'module_z': 1, 'cm': 2.5}}]
+    pds = evaluate(rows, {'module_x': xs, 'module_y': ys, ...})
+'''
+
+import numpy as np
+
+# One placed photon detector: layout copy, slot and table row, type and
+# rotation name, and position in cm
+PD_DTYPE = np.dtype([
+    ('copy', np.int32), ('slot', np.int32), ('row', np.int32),
+    ('type', 'U32'), ('rot', 'U48'),
+    ('x', np.float64), ('y', np.float64), ('z', np.float64)])
+
+
+def _value(v):
+    """Parameter value as float(s), lengths in cm."""
+    if hasattr(v, 'to'):
+        return np.asarray(v.to('cm').magnitude, dtype=float)
+    return np.asarray(v, dtype=float)
+
+
+def flatten_parameters(params):
+    """Builder parameters as {name: value}, list entries named 'key[i]'."""
+    flat = {}
+    for key, value in params.items():
+        if isinstance(value, (list, tuple)):
+            for i, v in enumerate(value):
+                if hasattr(v, 'to') or isinstance(v, (int, float)):
+                    flat[f"{key}[{i}]"] = v
+        elif hasattr(value, 'to') or isinstance(value, (int, float, np.ndarray)):
+            flat[key] = value
+    return flat
+
+
+def coefficients(rows, names):
+    """Coefficient matrix of a table over the given parameter names.
+
+    Returns:
+        (P + 1, 3*R) array; row P holds the constants in cm
+    """
+    index = {name: k for k, name in enumerate(names)}
+    coef = np.zeros((len(names) + 1, 3*len(rows)))
+    for r, row in enumerate(rows):
+        for a, axis in enumerate('xyz'):
+            for name, c in row.get(axis, {}).items():
+                if name == 'cm':
+                    coef[-1, 3*r + a] += c
+                elif name in index:
+                    coef[index[name], 3*r + a] += c
+                else:
+                    raise KeyError(f"Unknown layout parameter '{name}' in slot {row['slot']}")
+    return coef
+
+
+def evaluate(rows, params):
+    """Place every slot of a layout table for all copies of the layout.
+
+    Args:
+        rows: Layout table rows
+        params: {name: value}; values are Quantities or numbers, scalars or
+            arrays of one value per copy
+
+    Returns:
+        Structured array of PD_DTYPE, copy-major and in slot order
+    """
+    names = sorted({name for row in rows for axis in 'xyz' for name in row.get(axis, {})
+                    if name != 'cm'} | {name for row in rows for name in row.get('when', {})})
+    values = {name: _value(params[name]) for name in names}
+    ncopy = max([v.size for v in values.values()] + [1])
+    p = np.ones((ncopy, len(names) + 1))
+    for k, name in enumerate(names):
+        p[:, k] = values[name]
+
+    # One product for all rows and copies: (copies, rows, xyz)
+    pos = (p @ coefficients(rows, names)).reshape(ncopy, len(rows), 3)
+
+    # Last applicable row of each slot
+    slots = sorted({row['slot'] for row in rows})
+    choice = np.full((ncopy, len(slots)), -1)
+    for r, row in enumerate(rows):
+        ok = np.ones(ncopy, dtype=bool)
+        for name, v in row.get('when', {}).items():
+            ok &= p[:, names.index(name)] == v
+        choice[ok, slots.index(row['slot'])] = r
+    if np.any(choice < 0):
+        raise ValueError("Layout table leaves photon detector slots empty")
+
+    out = np.zeros(choice.size, dtype=PD_DTYPE)
+    out['copy'] = np.repeat(np.arange(ncopy), len(slots))
+    out['slot'] = np.tile(slots, ncopy)
+    out['row'] = choice.ravel()
+    picked = pos[out['copy'], out['row']]
+    out['x'], out['y'], out['z'] = picked.T
+    out['type'] = [rows[r].get('type', '') for r in out['row']]
+    out['rot'] = [rows[r].get('rot', '') for r in out['row']]
+    return out
@@ -6,6 +6,42 @@ PMTs builder for ProtoDUNE-VD geometry
 import gegede.builder
 from gegede import Quantity as Q
 
+from pdlayout import evaluate, flatten_parameters
+
+
+def _pmt(slot, x, y, z):
+    return {'slot': slot, 'x': {x: 1}, 'y': y, 'z': {z: 1}}
+
+
+# PMT positions in the cryostat: vertical PMTs below the cathode at
+# pmt_pos_x, horizontal ones on the lateral walls
+_Y = ['pmt_y_positions[%d]' % i for i in range(5)]
+_Z = ['pmt_z_positions[%d]' % i for i in range(6)]
+PMT_LAYOUT = [
+    _pmt(0, 'pmt_pos_x', {_Y[4]: 1}, _Z[4]),
+    _pmt(1, 'pmt_pos_x', {_Y[4]: 1}, _Z[5]),
+    _pmt(2, 'pmt_pos_x', {_Y[0]: 1}, _Z[5]),
+    _pmt(3, 'pmt_pos_x', {_Y[0]: 1}, _Z[4]),
+    _pmt(4, 'pmt_pos_x', {_Y[1]: 1}, _Z[1]),
+    _pmt(5, 'pmt_pos_x', {_Y[2]: 1}, _Z[1]),
+    _pmt(6, 'pmt_pos_x', {_Y[3]: 1}, _Z[1]),
+    _pmt(7, 'pmt_pos_x', {_Y[1]: 1}, _Z[0]),
+    _pmt(8, 'pmt_pos_x', {_Y[2]: 1}, _Z[0]),
+    _pmt(9, 'pmt_pos_x', {_Y[3]: 1}, _Z[0]),
+    _pmt(10, 'horizontal_pmt_pos_top', {'horizontal_pmt_y': 1}, 'horizontal_pmt_z'),
+    _pmt(11, 'horizontal_pmt_pos_bot', {'horizontal_pmt_y': 1}, 'horizontal_pmt_z'),
+    _pmt(12, 'horizontal_pmt_pos_top', {'horizontal_pmt_y': -1}, 'horizontal_pmt_z'),
+    _pmt(13, 'horizontal_pmt_pos_bot', {'horizontal_pmt_y': -1}, 'horizontal_pmt_z'),
+    _pmt(14, 'pmt_pos_x', {_Y[1]: 1}, _Z[2]),
+    _pmt(15, 'pmt_pos_x', {_Y[2]: 1}, _Z[2]),
+    _pmt(16, 'pmt_pos_x', {_Y[3]: 1}, _Z[2]),
+    _pmt(17, 'pmt_pos_x', {_Y[1]: 1}, _Z[3]),
+    _pmt(18, 'pmt_pos_x', {_Y[2]: 1}, _Z[3]),
+    _pmt(19, 'pmt_pos_x', {_Y[3]: 1}, _Z[3]),
+]
+PMT_LAYOUT += [
+    dict(row, slot=row['slot'] + 10, z={'horizontal_pmt_z': -1}) for row in PMT_LAYOUT[10:14]]
+
 class PMTBuilder(gegede.builder.Builder):
     '''
     Build the PMTs for ProtoDUNE-VD.
@@ -33,58 +69,21 @@ class PMTBuilder(gegede.builder.Builder):
         self.print_construct = print_construct
 
     def generate_pmt_positions(self):
-        '''Generate the full list of PMT positions'''
-        self.pmt_positions = []
-        
-        # Helper to make position dictionary
-        def make_pos(x=None, y=None, z=None):
-            pos = {}
-            pos['x'] = x if x is not None else Q('0cm')
-            pos['y'] = y if y is not None else Q('0cm') 
-            pos['z'] = z if z is not None else Q('0cm')
-            return pos
-
-        y = self.params['pmt_y_positions']
-        z = self.params['pmt_z_positions']
-
-        # Vertical PMTs
-        self.pmt_positions.extend([
-            make_pos(y=y[4], z=z[4]),      # pos1 - y=-405.3, z=68.1
-            make_pos(y=y[4], z=z[5]),      # pos2 - y=-405.3, z=0
-            make_pos(y=y[0], z=z[5]),      # pos3 - y=405.3, z=0
-            make_pos(y=y[0], z=z[4]),      # pos4 - y=405.3, z=68.1
-            make_pos(y=y[1], z=z[1]),      # pos5 - y=170.0, z=204.0
-            make_pos(y=y[2], z=z[1]),      # pos6 - y=0, z=204.0
-            make_pos(y=y[3], z=z[1]),      # pos7 - y=-170.0, z=204.0
-            make_pos(y=y[1], z=z[0]),      # pos8 - y=170.0, z=306.0
-            make_pos(y=y[2], z=z[0]),      # pos9 - y=0, z=306.0
-            make_pos(y=y[3], z=z[0]),      # pos10 - y=-170.0, z=306.0
-        ])
-         # Horizontal PMTs 
-        htop = self.params['horizontal_pmt_pos_top']
-        hbot = self.params['horizontal_pmt_pos_bot']
-        hz = self.params['horizontal_pmt_z']
-        hy = self.params['horizontal_pmt_y']
-
-        self.pmt_positions.extend([
-            make_pos(x=htop, y=hy, z=hz),        # pos11 - x=-225.9, y=221.0, z=228.9
-            make_pos(x=hbot, y=hy, z=hz),        # pos12 - x=-301.7, y=221.0, z=228.9
-            make_pos(x=htop, y=-hy, z=hz),       # pos13 - x=-225.9, y=-221.0, z=228.9  
-            make_pos(x=hbot, y=-hy, z=hz),       # pos14 - x=-301.7, y=-221.0, z=228.9
-            make_pos(y=y[1], z=z[2]),      # pos15 - y=170.0, z=-204.0
-            make_pos(y=y[2], z=z[2]),      # pos16 - y=0, z=-204.0
-            make_pos(y=y[3], z=z[2]),      # pos17 - y=-170.0, z=-204.0
-            make_pos(y=y[1], z=z[3]),      # pos18 - y=170.0, z=-306.0
-            make_pos(y=y[2], z=z[3]),      # pos19 - y=0, z=-306.0
-            make_pos(y=y[3], z=z[3]),      # pos20 - y=-170.0, z=-306.0
-        ])
-
-        self.pmt_positions.extend([
-            make_pos(x=htop, y=hy, z=-hz),       # pos21 - x=-225.9, y=221.0, z=-228.9
-            make_pos(x=hbot, y=hy, z=-hz),       # pos22 - x=-301.7, y=221.0, z=-228.9
-            make_pos(x=htop, y=-hy, z=-hz),      # pos23 - x=-225.9, y=-221.0, z=-228.9
-            make_pos(x=hbot, y=-hy, z=-hz),      # pos24 - x=-301.7, y=-221.0, z=-228.9
-        ])
+        """Evaluate the PMT layout table, pmt_parameters 'layout' (default
+        PMT_LAYOUT). Rows without a type or rotation take them from the
+        pmt_TPB, pmt_left_rotated and pmt_right_rotated lists (1-based)."""
+        rows = []
+        for row in self.params.get('layout', PMT_LAYOUT):
+            k = row['slot'] + 1
+            if k in self.params['pmt_left_rotated']:
+                rot = 'rPlus180AboutX'
+            elif k in self.params['pmt_right_rotated']:
+                rot = 'rIdentity'
+            else:
+                rot = 'rMinus90AboutY'
+            kind = 'volPMT_coated' if k in self.params['pmt_TPB'] else 'volPMT_foil'
+            rows.append(dict({'type': kind, 'rot': rot}, **row))
+        self.pmt_positions = evaluate(rows, flatten_parameters(self.params))
 
     def construct(self, geom):
         if self.print_construct:
@@ -235,39 +234,12 @@ class PMTBuilder(gegede.builder.Builder):
     def place_pmts(self, geom, cryo_vol):
         '''Place PMTs in cryostat volume'''
         
-        # Loop through all PMT positions
-        for i in range(len(self.pmt_positions)):
-            k = i + 1
-            
-            # Determine rotation based on PMT location
-            if k in self.params['pmt_left_rotated']:
-                rot = 'rPlus180AboutX'
-            elif k in self.params['pmt_right_rotated']: 
-                rot = 'rIdentity'
-            else:
-                rot = 'rMinus90AboutY'
-
-
-            # Determine PMT type (coated vs foil)
-            pmt_type = 'volPMT_coated' if k in self.params['pmt_TPB'] else 'volPMT_foil'
-            pmt_vol = self.get_volume(pmt_type)
-
-            # Get PMT position
-            if k in self.params['pmt_left_rotated'] or k in self.params['pmt_right_rotated']:
-                pos = geom.structure.Position(f"posPMT{i}", **self.pmt_positions[i])
-            else:
-                pos_dict = self.pmt_positions[i]
-                pos_dict['x'] = self.params['pmt_pos_x']
-                pos = geom.structure.Position(f"posPMT{i}", **pos_dict)
-
-                
-            # Create and add placement
+        for pmt in self.pmt_positions:
+            i = int(pmt['slot'])
+            pos = geom.structure.Position(f"posPMT{i}",
+                                          **{a: Q(float(pmt[a]), 'cm') for a in 'xyz'})
             place = geom.structure.Placement(f"placePMT{i}",
-            volume=pmt_vol, 
-            pos=pos,
-            rot=rot)
-            
-
-            
-            
-            cryo_vol.placements.append(place.name)
\ No newline at end of file
+                volume=self.get_volume(str(pmt['type'])),
+                pos=pos,
+                rot=str(pmt['rot']))
+            cryo_vol.placements.append(place.name)
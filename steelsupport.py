@@ -6,6 +6,8 @@ Steel Builder for ProtoDUNE-VD geometry
 import gegede.builder
 from gegede import Quantity as Q
 
+from lattice import lattice_extent, place_lattice
+
 class SteelSupportBuilder(gegede.builder.Builder):
     '''Build the steel support structure for ProtoDUNE-VD'''
 
@@ -23,122 +25,50 @@ class SteelSupportBuilder(gegede.builder.Builder):
         if steel_parameters:
             self.params = steel_parameters.copy()
         
+    def construct_lattice(self, geom, label, box_name, vol_name, centre, edges):
+        """Construct a steel support wall as a lattice of unit volumes.
+
+        Args:
+            label: Name label of the wall (TB, US, LR)
+            centre: (unit volume name, rotation) of the central units
+            edges: {edge: (unit volume name, rotation)} of the E, S, W and
+                N edge units, rotations given as names or (x, y, z) angles
+        """
+        n = self.params.get('LatticeCount', 5)
+        pitch = self.params.get('LatticePitch', Q('160cm')).to('cm').magnitude
+        if pitch < self.unit_widths['volUnitCent'].to('cm').magnitude:
+            raise ValueError(f"Steel support lattice pitch {pitch} cm is smaller than its units")
+
+        cells = {edge: (self.get_volume(name), self.unit_widths[name].to('cm').magnitude, rot)
+                 for edge, (name, rot) in edges.items()}
+        size_x, size_y = lattice_extent(n, pitch, {e: w for e, (_, w, _) in cells.items()})
+        shape = geom.shapes.Box(box_name,
+                                dx=Q(size_x, 'cm')/2,
+                                dy=Q(size_y, 'cm')/2,
+                                dz=self.unit_height/2)
+        vol = geom.structure.Volume(vol_name, material="Air", shape=shape)
+
+        place_lattice(geom, vol, label, n, pitch,
+                      (self.get_volume(centre[0]), centre[1]), cells)
+
+        self.add_volume(vol)
+        return vol
+
     def construct_TB(self, geom):
         """Construct the top/bottom steel support structure"""
-        
-        # Create main TB volume 
-        tb_shape = geom.shapes.Box("boxCryoTop",
-                                dx=Q("1016.8cm")/2, 
-                                dy=Q("1016.8cm")/2,
-                                dz=Q("61.8cm")/2)
-        
-        tb_vol = geom.structure.Volume("volSteelSupport_TB",
-                                    material="Air",
-                                    shape=tb_shape)
-
-        # Place the center unit volumes (5x5 grid)
-        for i in range(5):  # x positions: -320, -160, 0, 160, 320
-            for j in range(5):  # y positions: -320, -160, 0, 160, 320
-                x = Q(f"{-320 + i*160}cm")
-                y = Q(f"{-320 + j*160}cm") 
-                z = Q("0cm")
-                
-                # Get central unit volume from earlier construction
-                cent_vol = self.get_volume("volUnitCent")
-                
-                pos = geom.structure.Position(
-                    f"posUnitTBCent_{i}-{j}",
-                    x=x, y=y, z=z)
-                    
-                place = geom.structure.Placement(
-                    f"volUnitTBCent_{i}-{j}",
-                    volume=cent_vol,
-                    pos=pos)
-                    
-                tb_vol.placements.append(place.name)
-
-        # Place the edge unit volumes (E, S, W, N) for each row
-        for i in range(5):  # x positions: -320 to 320 in steps of 160
-            x_base = Q(f"{-320 + i*160}cm")
-            y_base = Q(f"{-320}cm")  
-
-            # Get edge unit volume
-            top_vol = self.get_volume("volUnitTop")
-
-            # East edge (TBE)
-            pos_e = geom.structure.Position(
-                f"posUnitTBE_{i}",
-                x=Q("454.2cm"),
-                y=y_base + i*Q("160cm"),
-                z=Q("0cm"))
-            
-            place_e = geom.structure.Placement(
-                f"volUnitTBE_{i}",
-                volume=top_vol,
-                pos=pos_e)
-            tb_vol.placements.append(place_e.name)
-
-            # South edge (TBS)
-            pos_s = geom.structure.Position(
-                f"posUnitTBS_{i}",
-                x=x_base,
-                y=Q("454.2cm"),
-                z=Q("0cm"))
-            
-            rot_s = geom.structure.Rotation(
-                f"rotUnitTBS_{i}", 
-                x="0deg", y="0deg", z="-90deg")
-
-            place_s = geom.structure.Placement(
-                f"volUnitTBS_{i}",
-                volume=top_vol,
-                pos=pos_s,
-                rot=rot_s)
-            tb_vol.placements.append(place_s.name)
-
-            # West edge (TBW)
-            pos_w = geom.structure.Position(
-                f"posUnitTBW_{i}",
-                x=Q("-454.2cm"),
-                y=y_base + i*Q("160cm"),
-                z=Q("0cm"))
-            
-            rot_w = geom.structure.Rotation(
-                f"rotUnitTBW_{i}",
-                x="0deg", y="0deg", z="-180deg")
-
-            place_w = geom.structure.Placement(
-                f"volUnitTBW_{i}",
-                volume=top_vol,
-                pos=pos_w,
-                rot=rot_w)
-            tb_vol.placements.append(place_w.name)
-
-            # North edge (TBN)
-            pos_n = geom.structure.Position(
-                f"posUnitTBN_{i}",
-                x=x_base,
-                y=Q("-454.2cm"),
-                z=Q("0cm"))
-            
-            rot_n = geom.structure.Rotation(
-                f"rotUnitTBN_{i}",
-                x="0deg", y="0deg", z="-270deg")
-
-            place_n = geom.structure.Placement(
-                f"volUnitTBN_{i}",
-                volume=top_vol,
-                pos=pos_n,
-                rot=rot_n)
-            tb_vol.placements.append(place_n.name)
-
-
-        self.add_volume(tb_vol)
-        return tb_vol
+        return self.construct_lattice(geom, "TB", "boxCryoTop", "volSteelSupport_TB",
+                                      ("volUnitCent", None),
+                                      {'E': ("volUnitTop", None),
+                                       'S': ("volUnitTop", (0, 0, -90)),
+                                       'W': ("volUnitTop", (0, 0, -180)),
+                                       'N': ("volUnitTop", (0, 0, -270))})
 
     def construct_unit_volumes(self, geom):
         """Construct the central and top unit volumes that make up the steel support structure"""
         
+        # Unit sizes across the lattice edges and unit height
+        self.unit_widths = {}
+
         # Define parameters for central and top units
         unit_params = {
             'central': {
@@ -340,227 +270,29 @@ class SteelSupportBuilder(gegede.builder.Builder):
             vol = geom.structure.Volume(f"volUnit{params['name']}",
                 material="STEEL_STAINLESS_Fe7Cr2Ni",
                 shape=final_shape)
+            self.unit_widths[vol.name] = params['main_box']['dx']
+            self.unit_height = params['main_box']['dz']
 
             self.add_volume(vol)
 
     def construct_US(self, geom):
         """Construct the upstream steel support structure"""
-        # Create main US volume using same shape as TB
-        us_shape = geom.shapes.Box("boxCryoWallSm",
-                                dx=Q("1016.8cm")/2,
-                                dy=Q("1075.6cm")/2,
-                                dz=Q("61.8cm")/2)
-        
-        us_vol = geom.structure.Volume("volSteelSupport_US",
-                                    material="Air",
-                                    shape=us_shape)
-
-        # Place the center unit volumes (5x5 grid)
-        # Note: All central units have rPlus180AboutY rotation
-        for i in range(5):  # x positions: -320 to 320 in steps of 160
-            for j in range(5):  # y positions: -320 to 320 in steps of 160
-                x = Q(f"{-320 + i*160}cm")
-                y = Q(f"{-320 + j*160}cm") 
-                z = Q("0cm")
-                
-                # Get central unit volume
-                cent_vol = self.get_volume("volUnitCent")
-                
-                pos = geom.structure.Position(
-                    f"posUnitUSCent_{i}-{j}",
-                    x=x, y=y, z=z)
-                    
-                # Note the rPlus180AboutY rotation for all central units
-                place = geom.structure.Placement(
-                    f"volUnitUSCent_{i}-{j}",
-                    volume=cent_vol,
-                    pos=pos,
-                    rot="rPlus180AboutY")
-                    
-                us_vol.placements.append(place.name)
-
-        # Place the edge unit volumes (E, S, W, N) for each row
-        for i in range(5):  # x positions: -320 to 320 in steps of 160
-            x_base = Q(f"{-320 + i*160}cm")
-
-            # Get edge unit volumes
-            top_vol = self.get_volume("volUnitTop") 
-            wall_s_vol = self.get_volume("volUnitWallS")
-
-            # East edge (USE)
-            pos_e = geom.structure.Position(
-                f"posUnitUSE_{i}",
-                x=Q("454.2cm"),
-                y=x_base,
-                z=Q("0cm"))
-            
-            # Note rPlus180AboutX rotation
-            place_e = geom.structure.Placement(
-                f"volUnitUSE_{i}",
-                volume=top_vol,
-                pos=pos_e,
-                rot="rPlus180AboutX")
-            us_vol.placements.append(place_e.name)
-
-            # South edge (USS) 
-            pos_s = geom.structure.Position(
-                f"posUnitUSS_{i}", 
-                x=x_base,
-                y=Q("468.9cm"),
-                z=Q("0cm"))
-            
-            rot_s = geom.structure.Rotation(
-                f"rotUnitUSS_{i}",
-                x="0deg", y="180deg", z="-90deg")
-
-            place_s = geom.structure.Placement(
-                f"volUnitUSS_{i}",
-                volume=wall_s_vol,
-                pos=pos_s,
-                rot=rot_s)
-            us_vol.placements.append(place_s.name)
-
-            # West edge (USW)
-            pos_w = geom.structure.Position(
-                f"posUnitUSW_{i}",
-                x=Q("-454.2cm"),
-                y=x_base, 
-                z=Q("0cm"))
-
-            rot_w = geom.structure.Rotation(
-                f"rotUnitUSW_{i}",
-                x="180deg", y="0deg", z="-180deg")
-
-            place_w = geom.structure.Placement(
-                f"volUnitUSW_{i}",
-                volume=top_vol,
-                pos=pos_w,
-                rot=rot_w)
-            us_vol.placements.append(place_w.name)
-
-            # North edge (USN)
-            pos_n = geom.structure.Position(
-                f"posUnitUSN_{i}",
-                x=x_base,
-                y=Q("-468.9cm"),
-                z=Q("0cm"))
-            
-            rot_n = geom.structure.Rotation(
-                f"rotUnitUSN_{i}",
-                x="0deg", y="180deg", z="-270deg")
-
-            place_n = geom.structure.Placement(
-                f"volUnitUSN_{i}",
-                volume=wall_s_vol,
-                pos=pos_n,
-                rot=rot_n)
-            us_vol.placements.append(place_n.name)
-
-        self.add_volume(us_vol)
-        return us_vol
+        # All central units are turned by 180 deg about y
+        return self.construct_lattice(geom, "US", "boxCryoWallSm", "volSteelSupport_US",
+                                      ("volUnitCent", "rPlus180AboutY"),
+                                      {'E': ("volUnitTop", "rPlus180AboutX"),
+                                       'S': ("volUnitWallS", (0, 180, -90)),
+                                       'W': ("volUnitTop", (180, 0, -180)),
+                                       'N': ("volUnitWallS", (0, 180, -270))})
 
     def construct_LR(self, geom):
         """Construct the left/right steel support structure"""
-        
-        # Create main LR volume
-        lr_shape = geom.shapes.Box("boxCryoWallLg", 
-                                dx=Q("1140.4cm")/2,
-                                dy=Q("1075.6cm")/2,
-                                dz=Q("61.8cm")/2)
-
-        lr_vol = geom.structure.Volume("volSteelSupport_LR",
-                                    material="Air",
-                                    shape=lr_shape)
-
-        # Place the center unit volumes (5x5 grid)
-        for i in range(5):  # x positions: -320 to 320 in steps of 160
-            for j in range(5):  # y positions: -320 to 320 in steps of 160
-                x = Q(f"{-320 + i*160}cm")
-                y = Q(f"{-320 + j*160}cm")
-                z = Q("0cm")
-
-                # Place central unit 
-                cent_vol = self.get_volume("volUnitCent")
-                pos = geom.structure.Position(
-                    f"posUnitLRCent_{i}-{j}",
-                    x=x, y=y, z=z)
-
-                place = geom.structure.Placement(
-                    f"volUnitLRCent_{i}-{j}",
-                    volume=cent_vol,
-                    pos=pos)
-
-                lr_vol.placements.append(place.name)
-
-        # Get wall volumes
-        wall_L_vol = self.get_volume("volUnitWallL")
-        wall_S_vol = self.get_volume("volUnitWallS") 
-
-        # Place the edge unit volumes (E, S, W, N) for each row
-        for i in range(5):  # positions: -320 to 320 in steps of 160 
-            base = Q(f"{-320 + i*160}cm")
-
-            # East edge (LRE)
-            pos_e = geom.structure.Position(
-                f"posUnitLRE_{i}",
-                x=Q("485.1cm"), y=base, z=Q("0cm"))
-            
-            place_e = geom.structure.Placement(
-                f"volUnitLRE_{i}", 
-                volume=wall_L_vol,
-                pos=pos_e)
-            lr_vol.placements.append(place_e.name)
-
-            # South edge (LRS) 
-            pos_s = geom.structure.Position(
-                f"posUnitLRS_{i}",
-                x=base, y=Q("468.9cm"), z=Q("0cm"))
-                
-            rot_s = geom.structure.Rotation(
-                f"rotUnitLRS_{i}",
-                x="0deg", y="0deg", z="-90deg")
-                
-            place_s = geom.structure.Placement(
-                f"volUnitLRS_{i}",
-                volume=wall_S_vol, 
-                pos=pos_s,
-                rot=rot_s)
-            lr_vol.placements.append(place_s.name)
-
-            # West edge (LRW)
-            pos_w = geom.structure.Position(
-                f"posUnitLRW_{i}",
-                x=Q("-485.1cm"), y=base, z=Q("0cm"))
-                
-            rot_w = geom.structure.Rotation(
-                f"rotUnitLRW_{i}",
-                x="0deg", y="0deg", z="-180deg")
-                
-            place_w = geom.structure.Placement(
-                f"volUnitLRW_{i}",
-                volume=wall_L_vol,
-                pos=pos_w,
-                rot=rot_w)
-            lr_vol.placements.append(place_w.name)
-
-            # North edge (LRN)
-            pos_n = geom.structure.Position(
-                f"posUnitLRN_{i}",
-                x=base, y=Q("-468.9cm"), z=Q("0cm"))
-                
-            rot_n = geom.structure.Rotation(
-                f"rotUnitLRN_{i}",
-                x="0deg", y="0deg", z="-270deg")
-                
-            place_n = geom.structure.Placement(
-                f"volUnitLRN_{i}",
-                volume=wall_S_vol,
-                pos=pos_n,
-                rot=rot_n)
-            lr_vol.placements.append(place_n.name)
-
-        self.add_volume(lr_vol)
-        return lr_vol
+        return self.construct_lattice(geom, "LR", "boxCryoWallLg", "volSteelSupport_LR",
+                                      ("volUnitCent", None),
+                                      {'E': ("volUnitWallL", None),
+                                       'S': ("volUnitWallS", (0, 0, -90)),
+                                       'W': ("volUnitWallL", (0, 0, -180)),
+                                       'N': ("volUnitWallS", (0, 0, -270))})
 
 
     def construct(self, geom):
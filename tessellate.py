@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+'''
+Polygon tracing of constant cross-section solids for ProtoDUNE-VD geometry
+
+Turns a Boolean tree whose primitives all extend along z (Tubs, Boxes
+and unions of them) into outline polygons of its cross-section, to be
+extruded with ExtrudedMany. The section at z = 0 is rasterised with the
+inside test of navigation.py, its boundary traced with marching squares
+and each outline simplified with the Ramer-Douglas-Peucker algorithm.
+Outlines are returned clockwise, holes anticlockwise, as Geant4 expects
+for extruded solids. Traced sections can be cached on disk, keyed by a
+digest of the solid definition and the tolerance. All lengths are plain
+floats in cm.
+'''
+
+import hashlib
+import os
+
+import numpy as np
+
+from columnar import read_columns, write_columns
+from navigation import bounding_box, inside
+
+# Boundary segments of each marching squares case, as pairs of cell edges
+# (0 bottom, 1 right, 2 top, 3 left), oriented with the inside on the left.
+# Corner bits are 1 bottom left, 2 bottom right, 4 top right, 8 top left;
+# the saddles 5 and 10 keep their inside corners apart.
+SEGMENTS = {
+    1: ((0, 3),), 2: ((1, 0),), 3: ((1, 3),), 4: ((2, 1),),
+    5: ((0, 3), (2, 1)), 6: ((2, 0),), 7: ((2, 3),), 8: ((3, 2),),
+    9: ((0, 2),), 10: ((1, 0), (3, 2)), 11: ((1, 2),), 12: ((3, 1),),
+    13: ((0, 1),), 14: ((3, 0),),
+}
+
+# Edge midpoints in half-cell units from the bottom left cell corner
+MIDPOINTS = np.array([[1, 0], [2, 1], [1, 2], [0, 1]])
+
+
+def raster_section(geom, shape, pitch, z=0.0):
+    """Inside mask of the cross-section of a solid at height z.
+
+    Returns:
+        Tuple of (mask, origin) with mask[i, j] true when the pixel centred
+        at origin + (i, j)*pitch is inside; the mask has an empty border
+    """
+    lo, hi = bounding_box(geom, shape)
+    n = np.ceil((hi[:2] - lo[:2]) / pitch).astype(int) + 3
+    origin = lo[:2] - pitch
+    ix, iy = np.meshgrid(np.arange(n[0]), np.arange(n[1]), indexing='ij')
+    pts = np.stack([origin[0] + ix.ravel()*pitch, origin[1] + iy.ravel()*pitch,
+                    np.full(ix.size, z)], axis=1)
+    return inside(geom, shape, pts).reshape(n), origin
+
+
+def marching_squares(mask):
+    """Closed boundary loops of a mask with an empty border.
+
+    Returns:
+        List of (K, 2) vertex arrays in pixel units, the inside on the left
+    """
+    m = mask.astype(np.uint8)
+    case = m[:-1, :-1] | m[1:, :-1] << 1 | m[1:, 1:] << 2 | m[:-1, 1:] << 3
+
+    # Vertices in half-pixel integer units, so shared edge midpoints match
+    starts, ends = [], []
+    for c, segments in SEGMENTS.items():
+        cells = np.argwhere(case == c)
+        for a, b in segments:
+            starts.append(2*cells + MIDPOINTS[a])
+            ends.append(2*cells + MIDPOINTS[b])
+    if not starts:
+        return []
+    starts, ends = np.concatenate(starts), np.concatenate(ends)
+
+    following = {tuple(p): k for k, p in enumerate(starts)}
+    done = np.zeros(len(starts), dtype=bool)
+    loops = []
+    for first in range(len(starts)):
+        if done[first]:
+            continue
+        loop, k = [], first
+        while not done[k]:
+            done[k] = True
+            loop.append(k)
+            k = following[tuple(ends[k])]
+        loops.append(starts[loop] / 2.0)
+    return loops
+
+
+def simplify(points, epsilon):
+    """Ramer-Douglas-Peucker simplification of a closed polygon."""
+    n = len(points)
+    if n < 4:
+        return points
+    # Split the loop at its first vertex and the vertex farthest from it
+    far = int(np.argmax(np.linalg.norm(points - points[0], axis=1)))
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, far]] = True
+    closed = np.vstack([points, points[:1]])
+    stack = [(0, far), (far, n)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        p, q = closed[a], closed[b]
+        d = q - p
+        seg = closed[a + 1:b] - p
+        length = np.hypot(*d)
+        if length > 0:
+            dist = np.abs(d[0]*seg[:, 1] - d[1]*seg[:, 0]) / length
+        else:
+            dist = np.linalg.norm(seg, axis=1)
+        k = int(np.argmax(dist))
+        if dist[k] > epsilon:
+            keep[a + 1 + k] = True
+            stack += [(a, a + 1 + k), (a + 1 + k, b)]
+    return points[keep]
+
+
+def signed_area(poly):
+    x, y = poly[:, 0], poly[:, 1]
+    return 0.5*np.sum(x*np.roll(y, -1) - np.roll(x, -1)*y)
+
+
+def outline_distance(points, poly):
+    """Distance of (M, 2) points to the outline of a closed polygon."""
+    a = poly[None, :, :]
+    d = np.roll(poly, -1, axis=0)[None, :, :] - a
+    rel = points[:, None, :] - a
+    t = np.clip(np.sum(rel*d, axis=2) / np.maximum(np.sum(d*d, axis=2), 1e-300), 0, 1)
+    return np.min(np.linalg.norm(rel - t[:, :, None]*d, axis=2), axis=1)
+
+
+def trace_section(geom, shape, tolerance):
+    """Outline polygons of the z = 0 cross-section of a solid.
+
+    The section is rasterised with a pitch of the tolerance and outlines
+    are simplified to half of it.
+
+    Returns:
+        List of (K, 2) arrays in cm; outlines clockwise, holes anticlockwise
+    """
+    mask, origin = raster_section(geom, shape, tolerance)
+    polys = []
+    for loop in marching_squares(mask):
+        poly = simplify(origin + loop*tolerance, 0.5*tolerance)
+        if len(poly) >= 3:
+            # Marching squares runs anticlockwise around the inside
+            polys.append(poly[::-1])
+    return polys
+
+
+def shape_digest(geom, tolerance):
+    """Digest of all shapes and positions of a geometry and a tolerance."""
+    h = hashlib.sha1(repr(float(tolerance)).encode())
+    for coll in (geom.store.shapes, geom.store.structure):
+        for name in sorted(coll):
+            h.update(repr(coll[name]).encode())
+    return h.hexdigest()
+
+
+def cached_section(geom, shape, tolerance, cache_dir=None):
+    """trace_section() with its result kept in cache_dir, if given.
+
+    The cache key covers the whole of geom, which should hold nothing but
+    the traced solid.
+    """
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, f"section_{shape_digest(geom, tolerance)}.col")
+        if os.path.exists(path):
+            columns, _ = read_columns(path, mmap=False)
+            return np.split(columns['vertices'], columns['starts'][1:])
+
+    polys = trace_section(geom, shape, tolerance)
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        starts = np.cumsum([0] + [len(p) for p in polys[:-1]])
+        write_columns(path, {'vertices': np.concatenate(polys), 'starts': starts},
+                      meta={'units': 'cm', 'tolerance_cm': float(tolerance)})
+    return polys
@@ -5,191 +5,271 @@ TPC (Time Projection Chamber) builder for ProtoDUNE-VD geometry
 
 import gegede.builder
 from gegede import Quantity as Q
+import hashlib
+import json
 import math
+import os
+import numpy as np
 from collections import namedtuple
 
+from columnar import write_columns, read_columns
+from gdmlext import register_replica
+from transforms import find_transform, position_of, rotation_of
+
+
+# Record layout of one wire, same field order as the [ch, xc, yc, len, x1, y1, x2, y2]
+# wire lists of the original PERL generator, followed by the readout channel of
+# the wire in its CRU plane. All lengths are plain floats in cm.
+WIRE_DTYPE = np.dtype([
+    ('ch', np.int32),
+    ('xc', np.float64), ('yc', np.float64), ('len', np.float64),
+    ('x1', np.float64), ('y1', np.float64),
+    ('x2', np.float64), ('y2', np.float64),
+    ('cru_ch', np.int32)])
+
+# Bump when the wire generation or the cache layout changes
+WIRE_CACHE_VERSION = 2
+
 
 def line_clip(x0, y0, nx, ny, rcl, rcw):
-    tol = 1.0E-4
-    endpts = []
-    
-    if abs(nx) < tol:
-        return [x0, 0, x0, rcw]
-    if abs(ny) < tol:
-        return [0, y0, rcl, y0]
-        
-    # Left border
-    y = y0 - x0 * ny/nx
-    if 0 <= y <= rcw:
-        endpts.extend([0, y])
-        
-    # Right border
-    y = y0 + (rcl-x0) * ny/nx
-    if 0 <= y <= rcw:
-        endpts.extend([rcl, y])
-        if len(endpts) == 4:
-            return endpts
-            
-    # Bottom border
-    x = x0 - y0 * nx/ny
-    if 0 <= x <= rcl:
-        endpts.extend([x, 0])
-        if len(endpts) == 4:
-            return endpts
-            
-    # Top border
-    x = x0 + (rcw-y0)* nx/ny
-    if 0 <= x <= rcl:
-        endpts.extend([x, rcw])
-        
-    # print(endpts)
-    return endpts
+    """Clip a batch of parallel lines against the (0,0)-(rcl,rcw) rectangle.
 
+    Candidate crossings are tested in the left, right, bottom, top order of
+    the original PERL lineClip() and the first two valid ones are kept.
 
-def split_wires(wires, width, theta_deg):
-    """Split wires at y=0 line into two halves.
-    
     Args:
-        wires: List of wire info
-        width: Width to split at
-        theta_deg: Wire angle in degrees
-        
+        x0, y0: Arrays of reference points on each line
+        nx, ny: Common direction of the lines
+        rcl, rcw: Rectangle length and width
+
     Returns:
-        Tuple of (lower_wires, upper_wires)
+        Tuple of (endpts, ok) with endpts of shape (N, 4) as [x1, y1, x2, y2]
+        and ok flagging lines that produced two endpoints
     """
-    def make_wire(ich, endpts, wire_len=None):
-        """Helper to create a wire with calculated center and length"""
-        wcn = [(endpts[0] + endpts[2])/2, (endpts[1] + endpts[3])/2]
-        if wire_len is None:
-            dx, dy = endpts[0] - endpts[2], endpts[1] - endpts[3]
-            wire_len = (dx*dx + dy*dy)**0.5
-        return [ich] + wcn + [wire_len] + endpts
-
-    theta = math.radians(theta_deg)
-    nx, ny = math.cos(theta), math.sin(theta)
-    winfo1, winfo2 = [], []  # Lower and upper halves
-    ich1 = ich2 = 0
-    
-    for wire in wires:
-        endpts = wire[4:8]
-        y1, y2 = min(endpts[1], endpts[3]), max(endpts[1], endpts[3])
-        
-        if y2 < 0:  # Wire fully in lower half
-            winfo1.append(make_wire(ich1, endpts, wire[3]))
-            ich1 += 1
-        elif y1 > 0:  # Wire fully in upper half
-            winfo2.append(make_wire(ich2, endpts, wire[3]))
-            ich2 += 1
-        else:  # Wire crosses y=0
-            x = wire[1] + (-wire[2]) * nx/ny  # Intersection point
-            
-            # Split endpoints at intersection
-            endpts1 = endpts[:2] + [x, 0] if endpts[1] < 0 else [x, 0] + endpts[2:]
-            endpts2 = [x, 0] + endpts[2:] if endpts[1] < 0 else endpts[:2] + [x, 0]
-            
-            winfo1.append(make_wire(ich1, endpts1))
-            winfo2.append(make_wire(ich2, endpts2))
-            ich1 += 1
-            ich2 += 1
-
-    # Adjust y positions
-    for winfo, y_offset in [(winfo1, -0.25), (winfo2, 0.25)]:
-        for w in winfo:
-            w[5] -= y_offset * width  # y1
-            w[7] -= y_offset * width  # y2
-            w[2] = 0.5 * (w[5] + w[7])  # ycenter
-            
-    return winfo1, winfo2
+    tol = 1.0E-4
+    x0 = np.asarray(x0, dtype=float)
+    y0 = np.asarray(y0, dtype=float)
+    n = len(x0)
 
-def flip_wires(wires):
-    """Flip wire configuration 180 degrees for second CRU.
-    
-    Args:
-        wires: Input wire configurations
-        
-    Returns:
-        list: Flipped wire configurations with negated x,y coordinates
+    if abs(nx) < tol:
+        endpts = np.stack([x0, np.zeros(n), x0, np.full(n, rcw)], axis=1)
+        return endpts, np.ones(n, dtype=bool)
+    if abs(ny) < tol:
+        endpts = np.stack([np.zeros(n), y0, np.full(n, rcl), y0], axis=1)
+        return endpts, np.ones(n, dtype=bool)
+
+    # Candidate crossings with left, right, bottom and top borders
+    cx = np.stack([np.zeros(n), np.full(n, rcl),
+                   x0 - y0 * nx/ny, x0 + (rcw - y0) * nx/ny], axis=1)
+    cy = np.stack([y0 - x0 * ny/nx, y0 + (rcl - x0) * ny/nx,
+                   np.zeros(n), np.full(n, rcw)], axis=1)
+    valid = np.stack([(0 <= cy[:, 0]) & (cy[:, 0] <= rcw),
+                      (0 <= cy[:, 1]) & (cy[:, 1] <= rcw),
+                      (0 <= cx[:, 2]) & (cx[:, 2] <= rcl),
+                      (0 <= cx[:, 3]) & (cx[:, 3] <= rcl)], axis=1)
+
+    # First two valid candidates in border order
+    order = np.argsort(~valid, axis=1, kind='stable')[:, :2]
+    rows = np.arange(n)[:, None]
+    px, py = cx[rows, order], cy[rows, order]
+    endpts = np.stack([px[:, 0], py[:, 0], px[:, 1], py[:, 1]], axis=1)
+    return endpts, valid.sum(axis=1) >= 2
+
+
+def make_wire_array(ch, endpts, wire_len=None, cru_ch=None):
+    """Build a WIRE_DTYPE array from wire numbers and (N, 4) endpoints.
+
+    Centers are taken from the endpoints; lengths are computed unless given.
+    The CRU channels default to the wire numbers.
     """
-    return [
-        [wire[0],                    # Keep channel number
-         -0.5*(wire[4] + wire[6]),  # Flip x center
-         -0.5*(wire[5] + wire[7]),  # Flip y center
-         wire[3],                    # Keep wire length
-         -wire[4], -wire[5],        # Flip endpoint 1
-         -wire[6], -wire[7]]        # Flip endpoint 2
-        for wire in wires
-    ]
+    endpts = np.asarray(endpts, dtype=float).reshape(-1, 4)
+    wires = np.empty(len(endpts), dtype=WIRE_DTYPE)
+    wires['ch'] = ch
+    wires['cru_ch'] = ch if cru_ch is None else cru_ch
+    wires['x1'], wires['y1'] = endpts[:, 0], endpts[:, 1]
+    wires['x2'], wires['y2'] = endpts[:, 2], endpts[:, 3]
+    wires['xc'] = (endpts[:, 0] + endpts[:, 2])/2
+    wires['yc'] = (endpts[:, 1] + endpts[:, 3])/2
+    if wire_len is None:
+        dx = endpts[:, 0] - endpts[:, 2]
+        dy = endpts[:, 1] - endpts[:, 3]
+        wire_len = (dx*dx + dy*dy)**0.5
+    wires['len'] = wire_len
+    return wires
+
 
 def generate_wires(length, width, nch, pitch, theta_deg, dia, w1offx, w1offy):
+    """Generate all wires of a single CRU plane without splitting.
+
+    Matches the original PERL gen_Wires(), computed in one batched pass;
+    lengths are plain floats in cm.
+
+    Returns:
+        WIRE_DTYPE array, one record per wire that crosses the PCB
     """
-    Generate wire positions for a single CRU plane without splitting.
-    This matches the original PERL gen_wires() function.
-    """
-    # Convert angle to radians
     theta = math.radians(theta_deg)
-    
-    # Wire and pitch direction unit vectors
     dirw = [math.cos(theta), math.sin(theta)]
     dirp = [math.cos(theta - math.pi/2), math.sin(theta - math.pi/2)]
-    
-    # Alpha is angle for pitch calculations
-    alpha = theta if theta <= math.pi/2 else math.pi - theta
-    
-    # Calculate wire spacing
-    # dX = pitch / math.sin(alpha)
-    # dY = pitch / math.sin(math.pi/2 - alpha)
-    
-    # Starting point adjusted for direction
+
     orig = [w1offx, w1offy]
     if dirp[0] < 0:
         orig[0] = length - w1offx
     if dirp[1] < 0:
         orig[1] = width - w1offy
-        
-    # Generate wires
-    winfo = []
-    offset = 0  # Starting point determined by offsets
-    
-    for ch in range(nch):
-        # Reference point for this wire
-        wcn = [orig[0] + offset * dirp[0],
-            orig[1] + offset * dirp[1]]
-            
-        # Get endpoints from line clipping
-        endpts = line_clip(wcn[0], wcn[1], dirw[0], dirw[1], length, width)
-        
-        if len(endpts) != 4:
-            print(f"Could not find endpoints for wire {ch}")
-            offset += pitch
-            continue
-            
-        # Recenter coordinates
-        endpts[0] -= length/2
-        endpts[2] -= length/2
-        endpts[1] -= width/2 
-        endpts[3] -= width/2
-        
-        # Calculate wire center
-        wcn[0] = (endpts[0] + endpts[2])/2
-        wcn[1] = (endpts[1] + endpts[3])/2
-        
-        # Calculate wire length
-        dx = endpts[0] - endpts[2]
-        dy = endpts[1] - endpts[3]
 
-        wlen = (dx**2 + dy**2)**(0.5)
+    ch = np.arange(nch)
+    offset = ch * pitch
+    endpts, ok = line_clip(orig[0] + offset * dirp[0],
+                           orig[1] + offset * dirp[1],
+                           dirw[0], dirw[1], length, width)
+    for bad in ch[~ok]:
+        print(f"Could not find endpoints for wire {bad}")
 
-        # Store wire info
-        wire = [ch, wcn[0], wcn[1], wlen] + endpts
+    # Recenter coordinates on the PCB center
+    endpts = endpts[ok] - [length/2, width/2, length/2, width/2]
+    return make_wire_array(ch[ok], endpts)
 
-        # print(ch, wcn[0], wcn[1])
 
-        winfo.append(wire)
-        
-        offset += pitch
-    
-    return winfo
+def flip_wires(wires):
+    """Flip the wires of one CRU by 180 deg for the second CRU (negate all x,y)."""
+    flipped = wires.copy()
+    for field in ('x1', 'y1', 'x2', 'y2'):
+        flipped[field] = -wires[field]
+    flipped['xc'] = -0.5*(wires['x1'] + wires['x2'])
+    flipped['yc'] = -0.5*(wires['y1'] + wires['y2'])
+    return flipped
+
 
+def split_wires(wires, width, theta_deg):
+    """Split wires at y=0 into the two CRM halves of a CRU.
+
+    Wires crossing y=0 are cut in two; each half is renumbered from 0 and
+    shifted into its half-CRU frame. Both parts of a cut wire keep its CRU
+    channel in cru_ch.
+
+    Returns:
+        Tuple of (lower_wires, upper_wires) WIRE_DTYPE arrays
+    """
+    theta = math.radians(theta_deg)
+    nx, ny = math.cos(theta), math.sin(theta)
+
+    endpts = np.stack([wires['x1'], wires['y1'], wires['x2'], wires['y2']], axis=1)
+    ylo = np.minimum(wires['y1'], wires['y2'])
+    yhi = np.maximum(wires['y1'], wires['y2'])
+    lower = yhi < 0
+    upper = ylo > 0
+    cross = ~(lower | upper)
+
+    # Cut crossing wires at their y=0 intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xcut = wires['xc'] + (-wires['yc']) * nx/ny
+    first_low = wires['y1'] < 0
+    cut = np.stack([xcut, np.zeros(len(wires))], axis=1)
+    lowpart = np.where(first_low[:, None],
+                       np.concatenate([endpts[:, :2], cut], axis=1),
+                       np.concatenate([cut, endpts[:, 2:]], axis=1))
+    uppart = np.where(first_low[:, None],
+                      np.concatenate([cut, endpts[:, 2:]], axis=1),
+                      np.concatenate([endpts[:, :2], cut], axis=1))
+
+    halves = []
+    for keep, part, y_offset in [(lower, lowpart, -0.25), (upper, uppart, 0.25)]:
+        sel = keep | cross
+        pts = np.where(cross[:, None], part, endpts)[sel]
+        wlen = np.where(cross, np.nan, wires['len'])[sel]
+        half = make_wire_array(np.arange(sel.sum()), pts, cru_ch=wires['cru_ch'][sel])
+        half['len'] = np.where(np.isnan(wlen), half['len'], wlen)
+        # Shift into the half-CRU frame
+        half['y1'] -= y_offset * width
+        half['y2'] -= y_offset * width
+        half['yc'] = 0.5 * (half['y1'] + half['y2'])
+        halves.append(half)
+
+    return halves[0], halves[1]
+
+
+def wire_cache_key(params):
+    """Canonical hash of the TPC parameters that determine the U/V wire tables.
+
+    Args:
+        params: TPC parameter dictionary
+
+    Returns:
+        Tuple of (hex digest, canonical parameter dictionary)
+    """
+    def cm(q):
+        return float(q.to('cm').magnitude)
+
+    key = {
+        'version': WIRE_CACHE_VERSION,
+        'wirePitch': {v: cm(params['wirePitch'][v]) for v in ('U', 'V')},
+        'wireAngle': {v: float(params['wireAngle'][v].to('deg').magnitude) for v in ('U', 'V')},
+        'nChans': {c: int(params['nChans'][c]) for c in ('Ind1', 'Ind2')},
+        'offsetUVwire': [cm(off) for off in params['offsetUVwire']],
+        'lengthPCBActive': cm(params['lengthPCBActive']),
+        'widthPCBActive': cm(params['widthPCBActive']),
+        'padWidth': cm(params['padWidth']),
+    }
+    text = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest(), key
+
+
+# One row per CRM of an nCRM_x by nCRM_z array, in placement order
+CRM_LAYOUT_DTYPE = np.dtype([
+    ('idx', np.int32), ('row', np.int32), ('col', np.int32),
+    ('quad', np.int32), ('crp', np.int32),
+    ('y', np.float64), ('z', np.float64)])
+
+
+def crm_layout(nCRM_x, nCRM_z, argon_y, argon_z, yLArBuffer, zLArBuffer,
+               widthCRP, lengthCRP, borderCRP, gapCRU):
+    """Centres of all CRMs of an nCRM_x by nCRM_z array (lengths in cm).
+
+    Each CRP holds 2x2 CRMs; the quadrant is 2*(row % 2) + col % 2, rows
+    running along z and columns along y. CRMs are pulled towards the CRP
+    centre by half the CRP border, and apart along z by a quarter of the
+    CRU gap.
+
+    Returns:
+        Structured array of CRM_LAYOUT_DTYPE with nCRM_x*nCRM_z rows
+    """
+    idx = np.arange(nCRM_x*nCRM_z)
+    row, col = np.divmod(idx, nCRM_x)
+    sy = np.where(col % 2, 1.0, -1.0)
+    sz = np.where(row % 2, 1.0, -1.0)
+
+    layout = np.empty(len(idx), dtype=CRM_LAYOUT_DTYPE)
+    layout['idx'] = idx
+    layout['row'] = row
+    layout['col'] = col
+    layout['quad'] = 2*(row % 2) + col % 2
+    layout['crp'] = (row//2)*(nCRM_x//2) + col//2
+    layout['y'] = (-0.5*argon_y + yLArBuffer + 0.5*widthCRP + (col//2)*widthCRP
+                   + sy*(widthCRP/4 - borderCRP/2))
+    layout['z'] = (-0.5*argon_z + zLArBuffer + 0.5*lengthCRP + (row//2)*lengthCRP
+                   + sz*(lengthCRP/4 - borderCRP/2 + gapCRU/4))
+    return layout
+
+
+PLANES = ('U', 'V', 'Z')
+
+
+def write_channel_map(path, table, meta=None):
+    """Write a channel map table (dict of equal-length columns) to path."""
+    meta = dict(meta or {})
+    meta.setdefault('units', 'cm')
+    meta.setdefault('planes', list(PLANES))
+    meta.setdefault('sides', ['top', 'bottom'])
+    write_columns(path, table, meta=meta)
+
+
+def load_channel_map(path):
+    """Memory-map a channel map written by write_channel_map().
+
+    Returns:
+        Tuple of (columns, meta); columns maps names to read-only arrays
+    """
+    return read_columns(path, mmap=True)
 
 
 class TPCBuilder(gegede.builder.Builder):
@@ -202,6 +282,7 @@ class TPCBuilder(gegede.builder.Builder):
         # Initialize parameters as None
         self.params = None
         self.wire_planes = {'U': None, 'V': None}
+        self.wire_buckets = None
 
         # Add the subbuilders
         for name, builder in self.builders.items():
@@ -279,64 +360,42 @@ class TPCBuilder(gegede.builder.Builder):
 
         # If wires are enabled
         if hasattr(self, 'wire_configs'):
-            # Create wire shapes and volumes for U plane
-            if 'U' in self.wire_configs:
-                for wire in self.wire_configs['U'][quad]:
-                    # print(quad, wire[0],wire[3], wire[2])
-                    wid = wire[0]
-                    wlen = wire[3]
-                    wire_shape = geom.shapes.Tubs(
-                        f"CRMWireU{wid}_{quad}",
-                        rmax=self.params['padWidth']/2,
-                        dz=wlen/2.,
-                        sphi="0deg",
-                        dphi="360deg")
-                    wire_vol = geom.structure.Volume(
-                        f"volTPCWireU{wid}_{quad}",
-                        material="Copper_Beryllium_alloy25",
-                        shape=wire_shape)
-                    # Place wire in U plane
-                    pos = geom.structure.Position(
-                        f"posWireU{wid}_{quad}",
-                        x=Q("0cm"),
-                        y=wire[2],  # ycenter
-                        z=wire[1])  # xcenter
-                    rot = "rUWireAboutX"
-                    place = geom.structure.Placement(
-                        f"placeWireU{wid}_{quad}",
-                        volume=wire_vol,
-                        pos=pos,
-                        rot=rot)
-                    vols['plane_U'].placements.append(place.name)
-
-            # Create wire shapes and volumes for V plane  
-            if 'V' in self.wire_configs:
-                for wire in self.wire_configs['V'][quad]:
-                    wid = wire[0]
-                    wlen = wire[3]
-                    wire_shape = geom.shapes.Tubs(
-                        f"CRMWireV{wid}_{quad}",
-                        rmax=self.params['padWidth']/2,
-                        dz=wlen/2.,
-                        sphi="0deg",
-                        dphi="360deg")
-                    wire_vol = geom.structure.Volume(
-                        f"volTPCWireV{wid}_{quad}",
-                        material="Copper_Beryllium_alloy25",
-                        shape=wire_shape)
-                    # Place wire in V plane
+            # Create and place U/V wires, reading the wire table columns in bulk
+            for view in ('U', 'V'):
+                if view not in self.wire_configs:
+                    continue
+                wires = self.wire_configs[view][quad]
+                buckets = (self.wire_buckets[view][quad].tolist()
+                           if self.wire_buckets is not None else [None]*len(wires))
+                plane_vol = vols[f'plane_{view}']
+                rot = f"r{view}WireAboutX"
+                for wid, xc, yc, wlen, bucket in zip(wires['ch'].tolist(), wires['xc'].tolist(),
+                                                     wires['yc'].tolist(), wires['len'].tolist(),
+                                                     buckets):
+                    if bucket is not None:
+                        wire_vol = self.shared_wire_volume(geom, bucket)
+                    else:
+                        wire_shape = geom.shapes.Tubs(
+                            f"CRMWire{view}{wid}_{quad}",
+                            rmax=self.params['padWidth']/2,
+                            dz=Q(wlen, 'cm')/2.,
+                            sphi="0deg",
+                            dphi="360deg")
+                        wire_vol = geom.structure.Volume(
+                            f"volTPCWire{view}{wid}_{quad}",
+                            material="Copper_Beryllium_alloy25",
+                            shape=wire_shape)
                     pos = geom.structure.Position(
-                        f"posWireV{wid}_{quad}",
+                        f"posWire{view}{wid}_{quad}",
                         x=Q("0cm"),
-                        y=wire[2],  # ycenter 
-                        z=wire[1])  # xcenter
-                    rot = "rVWireAboutX"
+                        y=Q(yc, 'cm'),
+                        z=Q(xc, 'cm'))
                     place = geom.structure.Placement(
-                        f"placeWireV{wid}_{quad}",
+                        f"placeWire{view}{wid}_{quad}",
                         volume=wire_vol,
                         pos=pos,
                         rot=rot)
-                    vols['plane_V'].placements.append(place.name)
+                    plane_vol.placements.append(place.name)
 
             # Create and place Z wires
             nch = self.params['nChans']['Col']//2
@@ -358,25 +417,30 @@ class TPCBuilder(gegede.builder.Builder):
                 material="Copper_Beryllium_alloy25", 
                 shape=wire_shape_z)
 
-            # Place Z wires
-            for i in range(nch):
-                zpos = zoffset + (i + 0.5) * self.params['wirePitch']['Z'] - 0.5 * self.params['lengthPCBActive']
-                if abs(0.5 * self.params['lengthPCBActive'] - abs(zpos)) < 0:
-                    raise ValueError(f"Cannot place wire {i} in view Z, plane too small")
+            # Place Z wires, explicitly or as one replica/division along z
+            zmode = self.params.get('wireZ_mode', 'placement')
+            if zmode in ('replica', 'division'):
+                self.place_wires_z_replica(geom, vols['plane_Z'], wire_vol_z,
+                                           quad, nch, zoffset, dims['plane'], zmode)
+            else:
+                for i in range(nch):
+                    zpos = zoffset + (i + 0.5) * self.params['wirePitch']['Z'] - 0.5 * self.params['lengthPCBActive']
+                    if abs(0.5 * self.params['lengthPCBActive'] - abs(zpos)) < 0:
+                        raise ValueError(f"Cannot place wire {i} in view Z, plane too small")
                     
-                wid = i + quad * nch
-                pos = geom.structure.Position(
-                    f"posWireZ{wid}_{quad}",
-                    x=Q("0cm"),
-                    y=Q("0cm"),
-                    z=zpos)
-                rot = "rPlus90AboutX"
-                place = geom.structure.Placement(
-                    f"placeWireZ{wid}_{quad}",
-                    volume=wire_vol_z,
-                    pos=pos,
-                    rot=rot)
-                vols['plane_Z'].placements.append(place.name)
+                    wid = i + quad * nch
+                    pos = geom.structure.Position(
+                        f"posWireZ{wid}_{quad}",
+                        x=Q("0cm"),
+                        y=Q("0cm"),
+                        z=zpos)
+                    rot = "rPlus90AboutX"
+                    place = geom.structure.Placement(
+                        f"placeWireZ{wid}_{quad}",
+                        volume=wire_vol_z,
+                        pos=pos,
+                        rot=rot)
+                    vols['plane_Z'].placements.append(place.name)
 
 
         # Define placements
@@ -399,6 +463,277 @@ class TPCBuilder(gegede.builder.Builder):
 
         return vols['tpc']
 
+    def place_wires_z_replica(self, geom, plane_vol, wire_vol, quad, nch, zoffset, plane_dims, kind):
+        """Place the Z wires of one quadrant as a GDML replica or division.
+
+        The wires fill a LAr grid box of nch cells of one pitch each, placed in
+        the Z plane where the explicit placements would be. Each cell holds one
+        wire at its center.
+        """
+        pitch = self.params['wirePitch']['Z']
+
+        cell_shape = geom.shapes.Box(
+            f"CRMWireZCell{quad}",
+            dx=plane_dims[0]/2, dy=plane_dims[1]/2, dz=pitch/2)
+        cell_vol = geom.structure.Volume(
+            f"volTPCWireZCell{quad}", material="LAr", shape=cell_shape)
+        wire_pos = geom.structure.Position(
+            f"posWireZCell{quad}", x=Q("0cm"), y=Q("0cm"), z=Q("0cm"))
+        wire_place = geom.structure.Placement(
+            f"placeWireZCell{quad}", volume=wire_vol, pos=wire_pos, rot="rPlus90AboutX")
+        cell_vol.placements.append(wire_place.name)
+
+        grid_shape = geom.shapes.Box(
+            f"CRMWireZGrid{quad}",
+            dx=plane_dims[0]/2, dy=plane_dims[1]/2, dz=nch*pitch/2)
+        grid_vol = geom.structure.Volume(
+            f"volTPCWireZGrid{quad}", material="LAr", shape=grid_shape)
+        cell_place = geom.structure.Placement(
+            f"placeWireZGridCell{quad}", volume=cell_vol)
+        grid_vol.placements.append(cell_place.name)
+        register_replica(geom, cell_place, kind, 'z', nch, pitch.to('cm').magnitude)
+
+        grid_pos = geom.structure.Position(
+            f"posWireZGrid{quad}",
+            x=Q("0cm"), y=Q("0cm"),
+            z=zoffset + 0.5*nch*pitch - 0.5*self.params['lengthPCBActive'])
+        grid_place = geom.structure.Placement(
+            f"placeWireZGrid{quad}", volume=grid_vol, pos=grid_pos)
+        plane_vol.placements.append(grid_place.name)
+
+    def crm_wire_geometry(self, quad):
+        """Wire end points of one CRM volume in its own (volTPC) frame.
+
+        Wire numbers are those of the GDML wire names. Channels number the
+        wires of a plane across the CRU: the two parts of a U/V wire cut at
+        the CRM boundary share one, each Z strip has its own.
+
+        Returns:
+            Tuple of (plane, wire, channel, p1, p2) arrays with p1, p2 of
+            shape (N, 3) in cm
+        """
+        if not hasattr(self, 'wire_configs'):
+            self.wire_configs = self.generate_wire_configs()
+
+        pad = self.params['padWidth'].to('cm').magnitude
+        tpc_x = (self.params['driftTPCActive'] + self.params['ReadoutPlane']).to('cm').magnitude
+        length = self.params['lengthPCBActive'].to('cm').magnitude
+        width = self.params['widthPCBActive'].to('cm').magnitude
+
+        plane, wire, channel, p1, p2 = [], [], [], [], []
+        for iplane, view in enumerate(PLANES):
+            xplane = 0.5*tpc_x - (2.5 - iplane)*pad
+            if view == 'Z':
+                # Same layout as the Z wire placements in construct_crm()
+                nch = self.params['nChans']['Col']//2
+                pitch = self.params['wirePitch']['Z'].to('cm').magnitude
+                zdelta = max(length - pitch*nch, 0)
+                zoffset = zdelta if quad <= 1 else 0
+                zpos = zoffset + (np.arange(nch) + 0.5)*pitch - 0.5*length
+                ends = [np.stack([np.full(nch, xplane), np.full(nch, sign*width/4), zpos], axis=1)
+                        for sign in (-1, 1)]
+                ids = np.arange(nch) + quad*nch
+                chans = np.arange(nch) + (quad % 2)*nch
+            else:
+                wires = self.wire_configs[view][quad]
+                ends = [np.stack([np.full(len(wires), xplane), wires[f'y{k}'], wires[f'x{k}']], axis=1)
+                        for k in (1, 2)]
+                ids, chans = wires['ch'], wires['cru_ch']
+            plane.append(np.full(len(ids), iplane))
+            wire.append(ids)
+            channel.append(chans)
+            p1.append(ends[0])
+            p2.append(ends[1])
+        return (np.concatenate(plane), np.concatenate(wire), np.concatenate(channel),
+                np.concatenate(p1), np.concatenate(p2))
+
+    def channel_map(self, geom, top):
+        """Global channel-to-wire geometry of every placed CRM.
+
+        One row per placed wire segment, ordered by side (top, bottom), CRM
+        index, plane and wire; the segment column numbers them sequentially
+        in that order. The readout channel of a segment is given by side,
+        cru, plane and channel, see crm_wire_geometry(). Wires always come
+        from the CRM's own quadrant, placed with the rotation of the
+        four-copy layout, so the map does not depend on crm_symmetry.
+
+        Args:
+            geom: Geometry object
+            top: Volume (or name) defining the global frame, normally the world
+
+        Returns:
+            dict of columns: segment, side, crm, crp, cru, quad, plane, channel,
+            wire, x1, y1, z1, x2, y2, z2, xc, yc, zc, len
+        """
+        store = geom.store.structure
+        mother = find_transform(store, top, self.tpc_mother)
+        if mother is None:
+            raise ValueError(f"{self.tpc_mother} is not placed below the top volume")
+        mrot, mpos = mother
+
+        local = {}
+        parts = {name: [] for name in ('side', 'crm', 'crp', 'cru', 'quad', 'plane', 'channel',
+                                       'wire', 'p1', 'p2')}
+        for side, idx, crp, quad, quad_rot, placename in sorted(self.tpc_placements):
+            if quad not in local:
+                local[quad] = self.crm_wire_geometry(quad)
+            plane, wire, channel, p1, p2 = local[quad]
+            rot = rotation_of(store, quad_rot)
+            pos = position_of(store, store[placename].pos)
+            rot, pos = mrot @ rot, mrot @ pos + mpos
+            n = len(wire)
+            parts['side'].append(np.full(n, side))
+            parts['crm'].append(np.full(n, idx))
+            parts['crp'].append(np.full(n, crp))
+            parts['cru'].append(np.full(n, 2*crp + quad//2))
+            parts['quad'].append(np.full(n, quad))
+            parts['plane'].append(plane)
+            parts['channel'].append(channel)
+            parts['wire'].append(wire)
+            parts['p1'].append(p1 @ rot.T + pos)
+            parts['p2'].append(p2 @ rot.T + pos)
+
+        cols = {name: np.concatenate(val) for name, val in parts.items()}
+        p1, p2 = cols.pop('p1'), cols.pop('p2')
+        table = {'segment': np.arange(len(p1), dtype=np.int32)}
+        for name, dtype in [('side', np.int8), ('crm', np.int16), ('crp', np.int16),
+                            ('cru', np.int16), ('quad', np.int8), ('plane', np.int8),
+                            ('channel', np.int32), ('wire', np.int32)]:
+            table[name] = cols[name].astype(dtype)
+        for i, axis in enumerate('xyz'):
+            table[f'{axis}1'] = p1[:, i]
+            table[f'{axis}2'] = p2[:, i]
+        for i, axis in enumerate('xyz'):
+            table[f'{axis}c'] = 0.5*(p1[:, i] + p2[:, i])
+        table['len'] = np.linalg.norm(p2 - p1, axis=1)
+        return table
+
+    def export_channel_map(self, geom, top, path):
+        """Write the global channel map of all placed CRMs to path."""
+        table = self.channel_map(geom, top)
+        top_name = top if isinstance(top, str) else top.name
+        keys = np.stack([table[name] for name in ('side', 'cru', 'plane', 'channel')])
+        nchannels = np.unique(keys, axis=1).shape[1]
+        write_channel_map(path, table, meta={'frame': top_name,
+                                             'ncrm': len(self.tpc_placements),
+                                             'nchannels': nchannels,
+                                             'nsegments': len(table['segment'])})
+        if self.print_construct:
+            print(f"Wrote channel map with {nchannels} channels on "
+                  f"{len(table['segment'])} wire segments to {path}")
+
+    def generate_wire_configs(self):
+        """Generate the U/V wire tables of the four CRM quadrants.
+
+        Returns:
+            dict: {'U': [quad0, ..., quad3], 'V': [...]} of WIRE_DTYPE arrays
+        """
+        length = self.params['lengthPCBActive'].to('cm').magnitude
+        width = self.params['widthPCBActive'].to('cm').magnitude
+        dia = self.params['padWidth'].to('cm').magnitude
+        offx, offy = [off.to('cm').magnitude for off in self.params['offsetUVwire']]
+
+        wire_configs = {}
+        for view, chans in [('U', 'Ind1'), ('V', 'Ind2')]:
+            theta = self.params['wireAngle'][view].to('deg').magnitude
+            winfo1 = generate_wires(
+                length, width,
+                self.params['nChans'][chans],
+                self.params['wirePitch'][view].to('cm').magnitude,
+                theta, dia, offx, offy)
+
+            # Flipped wires for second CRU
+            winfo2 = flip_wires(winfo1)
+
+            # Split wires for each quadrant
+            winfo1a, winfo1b = split_wires(winfo1, width, theta)
+            winfo2a, winfo2b = split_wires(winfo2, width, theta)
+
+            # Store wire configurations for CRM construction
+            wire_configs[view] = [winfo1a, winfo1b, winfo2a, winfo2b]
+
+        return wire_configs
+
+    def wire_cache_file(self, cache_dir):
+        """Cache file name for the current wire parameters."""
+        key, _ = wire_cache_key(self.params)
+        return os.path.join(cache_dir, f"wires_{key}.col"), key
+
+    def read_wire_cache(self, cache_dir):
+        """Load memory-mapped wire tables from the cache, or None on a miss."""
+        path, key = self.wire_cache_file(cache_dir)
+        if not os.path.exists(path):
+            return None
+        try:
+            columns, meta = read_columns(path)
+        except (OSError, ValueError) as err:
+            print(f"Warning: ignoring unreadable wire cache {path}: {err}")
+            return None
+        if meta.get('key') != key:
+            return None
+
+        if self.print_construct:
+            print(f"Loaded wire tables from {path}")
+        wires = columns['wires']
+        return {view: [wires[start:stop] for start, stop in segments]
+                for view, segments in meta['segments'].items()}
+
+    def write_wire_cache(self, cache_dir, wire_configs):
+        """Store wire tables in the cache as one contiguous record column."""
+        path, key = self.wire_cache_file(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        segments, start = {}, 0
+        for view, quads in wire_configs.items():
+            segments[view] = []
+            for wires in quads:
+                segments[view].append([start, start + len(wires)])
+                start += len(wires)
+        wires = np.concatenate([w for quads in wire_configs.values() for w in quads])
+
+        _, params = wire_cache_key(self.params)
+        write_columns(path, {'wires': wires},
+                      meta={'key': key, 'params': params, 'segments': segments})
+
+    def bucket_wires(self, tol):
+        """Group U/V wires of all quadrants into length buckets of width tol (cm).
+
+        Each bucket is represented by its shortest wire, so a shared wire never
+        sticks out of the plane; wires are shortened by less than tol.
+        """
+        lengths = np.concatenate([w['len'] for view in ('U', 'V')
+                                  for w in self.wire_configs[view]])
+        keys, inverse = np.unique(np.floor(lengths / tol), return_inverse=True)
+        self.wire_bucket_lengths = np.full(len(keys), np.inf)
+        np.minimum.at(self.wire_bucket_lengths, inverse, lengths)
+
+        self.wire_buckets, start = {}, 0
+        for view in ('U', 'V'):
+            self.wire_buckets[view] = []
+            for wires in self.wire_configs[view]:
+                self.wire_buckets[view].append(inverse[start:start + len(wires)])
+                start += len(wires)
+        self.wire_bucket_volumes = {}
+
+        if self.print_construct:
+            print(f"Wire length buckets: {len(lengths)} U/V wires -> {len(keys)} volumes")
+
+    def shared_wire_volume(self, geom, bucket):
+        """Wire volume shared by all U/V wires in a length bucket."""
+        if bucket not in self.wire_bucket_volumes:
+            wlen = Q(float(self.wire_bucket_lengths[bucket]), 'cm')
+            wire_shape = geom.shapes.Tubs(
+                f"CRMWireL{bucket}",
+                rmax=self.params['padWidth']/2,
+                dz=wlen/2.,
+                sphi="0deg",
+                dphi="360deg")
+            self.wire_bucket_volumes[bucket] = geom.structure.Volume(
+                f"volTPCWireL{bucket}",
+                material="Copper_Beryllium_alloy25",
+                shape=wire_shape)
+        return self.wire_bucket_volumes[bucket]
+
     def construct_top_crp(self, geom):
         """Construct the Cold Readout Plane (CRP).
         Creates and processes wire configurations for U,V views.
@@ -411,57 +746,25 @@ class TPCBuilder(gegede.builder.Builder):
         if self.print_construct:
             print(f"Construct CRP dimensions: {CRP_x} x {CRP_y} x {CRP_z}")
 
-        # Generate wire configurations for first CRU
+        # Generate wire configurations, reusing the on-disk cache if enabled
         if self.params.get('wires_on', 1):  # Check if wires are enabled
-            # U wires
-            winfo_u1 = generate_wires(
-            self.params['lengthPCBActive'], 
-            self.params['widthPCBActive'],
-            self.params['nChans']['Ind1'],
-            self.params['wirePitch']['U'],
-            self.params['wireAngle']['U'].to('deg').magnitude,
-            self.params['padWidth'],
-            self.params['offsetUVwire'][0],
-            self.params['offsetUVwire'][1])
-
-            # V wires  
-            winfo_v1 = generate_wires(
-            self.params['lengthPCBActive'],
-            self.params['widthPCBActive'], 
-            self.params['nChans']['Ind2'],
-            self.params['wirePitch']['V'],
-            self.params['wireAngle']['V'].to('deg').magnitude,
-            self.params['padWidth'],
-            self.params['offsetUVwire'][0], 
-            self.params['offsetUVwire'][1])
-
-            # Generate flipped wires for second CRU
-            winfo_u2 = flip_wires(winfo_u1)
-            winfo_v2 = flip_wires(winfo_v1)
-
-            # Split wires for each quadrant
-            winfo_u1a, winfo_u1b = split_wires(winfo_u1, 
-                               self.params['widthPCBActive'],
-                               self.params['wireAngle']['U'].to('deg').magnitude)
-            winfo_v1a, winfo_v1b = split_wires(winfo_v1,
-                               self.params['widthPCBActive'],
-                               self.params['wireAngle']['V'].to('deg').magnitude)
-
-            winfo_u2a, winfo_u2b = split_wires(winfo_u2,
-                               self.params['widthPCBActive'],
-                               self.params['wireAngle']['U'].to('deg').magnitude)  
-            winfo_v2a, winfo_v2b = split_wires(winfo_v2,
-                               self.params['widthPCBActive'],
-                               self.params['wireAngle']['V'].to('deg').magnitude)
-
-            # Store wire configurations for CRM construction
-            self.wire_configs = {
-                'U': [winfo_u1a, winfo_u1b, winfo_u2a, winfo_u2b],
-                'V': [winfo_v1a, winfo_v1b, winfo_v2a, winfo_v2b]
-            }
-
-        # Construct CRM volumes with wire configurations
-        for quad in range(4):
+            cache_dir = self.params.get('wire_cache_dir')
+            wire_configs = self.read_wire_cache(cache_dir) if cache_dir else None
+            if wire_configs is None:
+                wire_configs = self.generate_wire_configs()
+                if cache_dir:
+                    self.write_wire_cache(cache_dir, wire_configs)
+            self.wire_configs = wire_configs
+
+            # Optionally share one wire solid/volume per length bucket
+            tol = self.params.get('wire_length_tolerance')
+            if tol is not None:
+                self.bucket_wires(tol.to('cm').magnitude)
+
+        # Construct CRM volumes with wire configurations; the symmetric mode
+        # only needs quadrants 0 and 1, place_tpcs() rotates them into 2 and 3
+        nquad = 2 if self.params.get('crm_symmetry', False) else 4
+        for quad in range(nquad):
             self.add_volume(self.construct_crm(geom, quad))
 
 
@@ -489,85 +792,42 @@ class TPCBuilder(gegede.builder.Builder):
                0.5*(params['driftTPCActive'] + params['ReadoutPlane'])
         posXBot = posX - params['driftTPCActive'] - params['heightCathode'] - params['ReadoutPlane']
 
-        CRP_y = params['widthCRP'] 
-        CRP_z = params['lengthCRP']
-        
-        # Start from front of detector
-        posZ = -0.5*argon_dim[2] + params['zLArBuffer'] + 0.5*CRP_z
-
-        # Loop over CRM rows and columns
-        idx = 0
-        for ii in range(params['nCRM_z']):
-            # Increment Z position every 2 rows
-            if ii % 2 == 0 and ii > 0:
-                posZ += CRP_z
-                
-            # Start from left side
-            posY = -0.5*argon_dim[1] + params['yLArBuffer'] + 0.5*CRP_y
-
-            for jj in range(params['nCRM_x']):
-                # Increment Y position every 2 columns  
-                if jj % 2 == 0 and jj > 0:
-                    posY += CRP_y
-                
-                # Calculate quadrant and offsets
-                if ii % 2 == 0:
-                    if jj % 2 == 0:
-                        quad = 0
-                        pcbOffsetY = params['borderCRP']/2
-                        pcbOffsetZ = params['borderCRP']/2 - params['gapCRU']/4
-                        myposTPCY = posY - CRP_y/4 + pcbOffsetY
-                        myposTPCZ = posZ - CRP_z/4 + pcbOffsetZ
-                    else:
-                        quad = 1
-                        pcbOffsetY = -params['borderCRP']/2
-                        pcbOffsetZ = params['borderCRP']/2 - params['gapCRU']/4
-                        myposTPCY = posY + CRP_y/4 + pcbOffsetY  
-                        myposTPCZ = posZ - CRP_z/4 + pcbOffsetZ
-                else:
-                    if jj % 2 == 0:
-                        quad = 2
-                        pcbOffsetY = params['borderCRP']/2
-                        pcbOffsetZ = -(params['borderCRP']/2 - params['gapCRU']/4)
-                        myposTPCY = posY - CRP_y/4 + pcbOffsetY
-                        myposTPCZ = posZ + CRP_z/4 + pcbOffsetZ
-                    else:
-                        quad = 3
-                        pcbOffsetY = -params['borderCRP']/2 
-                        pcbOffsetZ = -(params['borderCRP']/2 - params['gapCRU']/4)
-                        myposTPCY = posY + CRP_y/4 + pcbOffsetY
-                        myposTPCZ = posZ + CRP_z/4 + pcbOffsetZ
-
-                # Get TPC volume for this quadrant
-                tpc_vol = self.get_volume(f'volTPC_{quad}')
-
-                # Place top TPC
-                pos_top = geom.structure.Position(
-                    f"posTopTPC_{idx}",
-                    x=posX,
-                    y=myposTPCY, 
-                    z=myposTPCZ
-                )
-                place_top = geom.structure.Placement(
-                    f"placeTopTPC_{idx}",
-                    volume=tpc_vol,
-                    pos=pos_top
-                )
-                cryo_vol.placements.append(place_top.name)
-
-                # Place bottom TPC
-                pos_bot = geom.structure.Position(
-                    f"posBotTPC_{idx}",
-                    x=posXBot,
-                    y=myposTPCY,
-                    z=myposTPCZ 
-                )
-                place_bot = geom.structure.Placement(
-                    f"placeBotTPC_{idx}",
-                    volume=tpc_vol,
-                    pos=pos_bot,
-                    rot='rPlus180AboutY'  # Rotate bottom TPC
-                )
-                cryo_vol.placements.append(place_bot.name)
-
-                idx += 1
+        def cm(q):
+            return float(q.to('cm').magnitude)
+
+        # All CRM centres of the array in one pass
+        layout = crm_layout(params['nCRM_x'], params['nCRM_z'],
+                            cm(argon_dim[1]), cm(argon_dim[2]),
+                            cm(params['yLArBuffer']), cm(params['zLArBuffer']),
+                            cm(params['widthCRP']), cm(params['lengthCRP']),
+                            cm(params['borderCRP']), cm(params['gapCRU']))
+
+        # Volume and (top, bottom) rotations per quadrant; in symmetric mode
+        # quadrants 2 and 3 are quadrants 1 and 0 turned by 180 deg about x
+        symmetric = self.params.get('crm_symmetry', False)
+        copy_rots = (None, 'rPlus180AboutY')
+        quads = []
+        for quad in range(4):
+            vol_quad, rots = quad, copy_rots
+            if symmetric and quad >= 2:
+                vol_quad = 3 - quad
+                rots = ('rPlus180AboutX', 'rPlus180AboutXPlus180AboutY')
+            quads.append((self.get_volume(f'volTPC_{vol_quad}'), rots))
+
+        # Record (side, idx, crp, quad, four-copy rotation, placement) for the
+        # channel map
+        self.tpc_mother = cryo_vol.name
+        self.tpc_placements = []
+
+        sides = (('Top', posX), ('Bot', posXBot))
+        for idx, quad, crp, y, z in zip(layout['idx'].tolist(), layout['quad'].tolist(),
+                                        layout['crp'].tolist(), layout['y'].tolist(),
+                                        layout['z'].tolist()):
+            tpc_vol, rots = quads[quad]
+            y, z = Q(y, 'cm'), Q(z, 'cm')
+            for side, (label, x) in enumerate(sides):
+                pos = geom.structure.Position(f"pos{label}TPC_{idx}", x=x, y=y, z=z)
+                place = geom.structure.Placement(f"place{label}TPC_{idx}", volume=tpc_vol,
+                                                 pos=pos, rot=rots[side])
+                cryo_vol.placements.append(place.name)
+                self.tpc_placements.append((side, idx, crp, quad, copy_rots[side], place.name))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+'''
+Placement transforms for ProtoDUNE-VD geometry
+
+Helpers to turn GeGeDe positions and rotations into matrices and to walk
+the placement tree with composed global transforms. Rotations follow the
+GDML/Geant4 convention: the angles (x, y, z) define the frame rotation
+Rz*Ry*Rx, and a daughter point p is placed at R^-1 p + pos in its mother.
+All lengths are plain floats in cm.
+'''
+
+import math
+
+import numpy as np
+
+AXIS_INDEX = {'x': 0, 'y': 1, 'z': 2}
+
+
+def rotation_matrix(x=0.0, y=0.0, z=0.0):
+    """Active rotation matrix for GDML rotation angles given in degrees."""
+    ax, ay, az = [math.radians(a) for a in (x, y, z)]
+    cx, sx = math.cos(ax), math.sin(ax)
+    cy, sy = math.cos(ay), math.sin(ay)
+    cz, sz = math.cos(az), math.sin(az)
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    return (rz @ ry @ rx).T
+
+
+def rotation_of(store, rot):
+    """Active rotation matrix of a Rotation object or name (None is identity)."""
+    if rot is None:
+        return np.eye(3)
+    if isinstance(rot, str):
+        rot = store[rot]
+    return rotation_matrix(*[getattr(rot, a).to('deg').magnitude for a in 'xyz'])
+
+
+def position_of(store, pos):
+    """Position object or name as a vector in cm (None is the origin)."""
+    if pos is None:
+        return np.zeros(3)
+    if isinstance(pos, str):
+        pos = store[pos]
+    return np.array([getattr(pos, a).to('cm').magnitude for a in 'xyz'])
+
+
+def placement_transform(store, place):
+    """Return (R, t) mapping daughter coordinates into the mother frame."""
+    if isinstance(place, str):
+        place = store[place]
+    return rotation_of(store, place.rot), position_of(store, place.pos)
+
+
+def replica_offsets(place, replicas=None):
+    """Cell translations (cm) of a placement registered as a replica, or None.
+
+    replicas is the registry of the geometry, see gdmlext.replicas_of().
+    """
+    entry = (replicas or {}).get(place.name)
+    if not entry or entry[0] is not place:
+        return None
+    _, kind, axis, number, width, offset = entry
+    shifts = np.zeros((number, 3))
+    shifts[:, AXIS_INDEX[axis]] = (np.arange(number) - 0.5*(number - 1)) * width + offset
+    return shifts
+
+
+def walk(store, top, rot=None, pos=None, path=(), replicas=None):
+    """Iterate over all volumes below top with their global transforms.
+
+    Replicas registered in replicas are expanded into their individual cells.
+
+    Yields:
+        Tuple of (path, volume, R, t) where path is the tuple of placement
+        names leading to the volume and p_global = R p_local + t
+    """
+    if isinstance(top, str):
+        top = store[top]
+    rot = np.eye(3) if rot is None else rot
+    pos = np.zeros(3) if pos is None else pos
+    yield path, top, rot, pos
+
+    for placename in top.placements or []:
+        place = store[placename]
+        r, t = placement_transform(store, place)
+        daughter = store[place.volume]
+        shifts = replica_offsets(place, replicas)
+        if shifts is None:
+            yield from walk(store, daughter, rot @ r, rot @ t + pos, path + (placename,),
+                            replicas)
+            continue
+        for icell, shift in enumerate(shifts):
+            yield from walk(store, daughter, rot @ r, rot @ (t + shift) + pos,
+                            path + (f"{placename}[{icell}]",), replicas)
+
+
+def find_transform(store, top, name):
+    """Global transform of the first placement of volume name below top.
+
+    The tree is searched breadth first, so shallow volumes are found without
+    descending into large daughter hierarchies.
+
+    Returns:
+        Tuple of (R, t), or None if the volume is not placed below top
+    """
+    if isinstance(top, str):
+        top = store[top]
+    if top.name == name:
+        return np.eye(3), np.zeros(3)
+    level = [(top, np.eye(3), np.zeros(3))]
+    while level:
+        deeper = []
+        for vol, rot, pos in level:
+            for placename in vol.placements or []:
+                place = store[placename]
+                r, t = placement_transform(store, place)
+                r, t = rot @ r, rot @ t + pos
+                if place.volume == name:
+                    return r, t
+                deeper.append((store[place.volume], r, t))
+        level = deeper
+    return None
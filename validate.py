@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+'''
+Validation tools for ProtoDUNE-VD geometry
+
+Builds geometries in-process from the usual configuration files, with
+optional per-builder parameter overrides, and checks that alternative
+construction modes reproduce the reference geometry.
+
+    python validate.py crm-symmetry protodune_vd.cfg
+    python validate.py channel-map protodune_vd.cfg
+    python validate.py cathode-mesh protodune_vd.cfg
+    python validate.py effective-materials protodune_vd.cfg
+'''
+
+import argparse
+import re
+import sys
+import time
+
+import numpy as np
+import gegede.main
+
+from gdmlext import replicas_of
+from tpcs import PLANES
+from transforms import walk
+from world import eval_parameters
+
+
+def find_builder(builder, name):
+    """Find a builder by name in the tree below (and including) builder."""
+    if builder.name == name:
+        return builder
+    for sub in builder.builders.values():
+        found = find_builder(sub, name)
+        if found is not None:
+            return found
+    return None
+
+
+def build_geometry(config_files, overrides=None, world=None, world_params=None, timings=None):
+    """Configure and construct a geometry in-process.
+
+    Args:
+        config_files: Configuration file name(s)
+        overrides: Optional {builder name: {param: value}} applied to the
+            builder's params dictionary after configuration
+        world: Optional world builder name
+        world_params: Optional {parameter set: {param: value}} merged into
+            the world parameter dictionaries (e.g. 'tpc_parameters') before
+            configuration, so derived parameters follow the new values;
+            non-dictionary values replace plain world settings
+        timings: Optional dictionary filled with the wall time (s) of the
+            'configure' and 'construct' phases
+
+    Returns:
+        Tuple of (world builder, geometry)
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    cfg = gegede.main.parse_config(config_files)
+    if world_params:
+        section = cfg[world or next(iter(cfg))]
+        for key, params in world_params.items():
+            if isinstance(params, dict):
+                params = dict(eval_parameters(section[key]), **params)
+            section[key] = params
+    wbuilder = gegede.main.make_builder(cfg, world)
+    gegede.main.configure_builder(cfg, wbuilder)
+    for name, params in (overrides or {}).items():
+        builder = find_builder(wbuilder, name)
+        if builder is None:
+            raise ValueError(f"No builder named {name}")
+        builder.params.update(params)
+    timings['configure'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    geom = gegede.main.generate_geometry(wbuilder)
+    timings['construct'] = time.perf_counter() - start
+    return wbuilder, geom
+
+
+def wire_endpoints(geom, top=None):
+    """Global endpoints of all TPC wires below top (default: the world).
+
+    Returns:
+        (N, 6) array of wire end points in cm, each wire ordered so its
+        lexicographically smaller end comes first, rows sorted
+    """
+    store = geom.store.structure
+    ends = []
+    for path, vol, rot, pos in walk(store, top or geom.world, replicas=replicas_of(geom)):
+        if not vol.name.startswith('volTPCWire') or vol.placements:
+            continue
+        half = geom.store.shapes[vol.shape].dz.to('cm').magnitude
+        a = rot @ [0, 0, -half] + pos
+        b = rot @ [0, 0, half] + pos
+        ends.append(np.concatenate([a, b]) if tuple(a) <= tuple(b) else np.concatenate([b, a]))
+    if not ends:
+        return np.zeros((0, 6))
+    ends = np.array(ends)
+    keys = np.round(ends, 6) + 0.0
+    return ends[np.lexsort(keys.T[::-1])]
+
+
+def check_crm_symmetry(config_files, tol=1e-6):
+    """Compare global wire end points of the four-copy and symmetric CRM builds.
+
+    Returns:
+        True if every wire of one build matches a wire of the other within tol (cm)
+    """
+    results = {}
+    for symmetric in (False, True):
+        _, geom = build_geometry(config_files, {'tpcs': {'wires_on': True,
+                                                         'crm_symmetry': symmetric}})
+        ncrm = len([v for v in geom.store.structure.values()
+                    if type(v).__name__ == 'Volume' and v.name.startswith('volTPC_')])
+        results[symmetric] = wire_endpoints(geom)
+        print(f"crm_symmetry={symmetric}: {ncrm} CRM volumes, {len(results[symmetric])} placed wires")
+
+    full, sym = results[False], results[True]
+    if full.shape != sym.shape:
+        print(f"FAIL: wire count differs ({len(full)} vs {len(sym)})")
+        return False
+    dev = np.abs(full - sym).max() if len(full) else 0.0
+    ok = dev <= tol
+    print(f"{'OK' if ok else 'FAIL'}: max end point deviation {dev:.3g} cm")
+    return ok
+
+
+def check_cut_wires(table, tol=1e-6):
+    """Check that the wire segments sharing a readout channel form one wire.
+
+    A channel may only have two segments, in different CRMs, that meet at
+    a common end point within tol (cm), as the halves of a cut wire do.
+
+    Returns:
+        True if every channel passes
+    """
+    keys = np.stack([table[name] for name in ('side', 'cru', 'plane', 'channel')], axis=1)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    if counts.max() > 2:
+        print(f"FAIL: {np.sum(counts > 2)} channels with more than two wire segments")
+        return False
+
+    rows = np.flatnonzero(counts[inverse] == 2)
+    a, b = rows[np.argsort(inverse[rows], kind='stable')].reshape(-1, 2).T
+    ends = np.stack([np.stack([table[f'{axis}{k}'] for axis in 'xyz'], axis=1)
+                     for k in (1, 2)])
+    gap = np.min([np.linalg.norm(ends[i, a] - ends[j, b], axis=1)
+                  for i in (0, 1) for j in (0, 1)], axis=0)
+    ok = bool(np.all(table['crm'][a] != table['crm'][b]) and np.all(gap <= tol))
+    print(f"{'OK' if ok else 'FAIL'}: {len(counts)} channels, {len(a)} cut into two "
+          f"segments, max gap {gap.max() if len(gap) else 0.0:.3g} cm")
+    return ok
+
+
+def check_channel_map(config_files, tol=1e-6):
+    """Compare the channel maps of the four-copy and symmetric CRM builds.
+
+    Also checks that the Z wire numbers of the four-copy map are the ones
+    in the names of the placed Z wires, and that both halves of a cut wire
+    share one readout channel.
+
+    Returns:
+        True if both maps have the same rows, with end points within tol (cm)
+    """
+    maps = {}
+    for symmetric in (False, True):
+        wbuilder, geom = build_geometry(config_files, {'tpcs': {'wires_on': True,
+                                                                'crm_symmetry': symmetric}})
+        tpcs = find_builder(wbuilder, 'tpcs')
+        maps[symmetric] = tpcs.channel_map(geom, geom.world)
+        print(f"crm_symmetry={symmetric}: {len(maps[symmetric]['segment'])} wire segments")
+        if not symmetric:
+            placed = {(int(m.group(2)), int(m.group(1))) for m in
+                      map(re.compile(r'placeWireZ(\d+)_(\d+)$').match, geom.store.structure)
+                      if m}
+
+    full, sym = maps[False], maps[True]
+    ok = full.keys() == sym.keys() and len(full['segment']) == len(sym['segment'])
+    if not ok:
+        print("FAIL: channel map columns or rows differ")
+        return False
+    for name in full:
+        if full[name].dtype.kind == 'f':
+            dev = np.abs(full[name] - sym[name]).max() if len(full[name]) else 0.0
+            same = dev <= tol
+        else:
+            same = np.array_equal(full[name], sym[name])
+        if not same:
+            print(f"FAIL: column {name} differs")
+        ok &= same
+
+    zwires = full['plane'] == PLANES.index('Z')
+    mapped = set(zip(full['quad'][zwires].tolist(), full['wire'][zwires].tolist()))
+    same = mapped == placed
+    print(f"{'OK' if same else 'FAIL'}: {len(placed)} placed Z wire numbers, "
+          f"{len(mapped)} in the channel map")
+    ok &= same
+    ok &= check_cut_wires(full, tol)
+    if ok:
+        print("OK: channel maps agree")
+    return ok
+
+
+def check_cathode_mesh(config_files, npoints=200000, seed=1):
+    """Compare the G10 occupancy of the cathode mesh in all mesh modes.
+
+    Random points over the mesh extent are located in the union solid and
+    in the mesh mothers of the 'strips' and 'replica' modes.
+
+    Returns:
+        True if every point has the same material in all modes
+    """
+    from navigation import Navigator, bounding_box, inside
+
+    rng = np.random.default_rng(seed)
+    pts, reference, ok = None, None, True
+    for mode in ('union', 'strips', 'replica'):
+        wbuilder, geom = build_geometry(config_files, {'cathode': {'mesh_mode': mode}})
+        cathode = find_builder(wbuilder, 'cathode')
+        mesh = cathode.mesh_vol
+        offset = np.array([0.0, cathode.mesh_offset.to('cm').magnitude, 0.0])
+        if mode == 'union':
+            lo, hi = bounding_box(geom, mesh.shape)
+            pts = lo + (hi - lo) * rng.random((npoints, 3))
+            reference = inside(geom, mesh.shape, pts)
+            print(f"{mode:>8}: one solid, G10 fraction {reference.mean():.4f}")
+            continue
+        g10 = Navigator(geom).material(mesh, pts - offset) == 'G10'
+        same = np.array_equal(g10, reference)
+        ok &= same
+        print(f"{mode:>8}: {len(mesh.placements)} daughters, G10 fraction {g10.mean():.4f}, "
+              f"{'OK' if same else 'FAIL'}")
+    return ok
+
+
+def report_effective_materials(config_files):
+    """Print the mixtures that replace detailed parts and their mass errors
+    against the measured detailed parts.
+
+    Returns:
+        The world builder's dict of material -> (density, mass, mass error,
+        its standard error)
+    """
+    wbuilder, _ = build_geometry(config_files)
+    report = wbuilder.effective_mass_report
+    for name, (density, mass, error, sigma) in report.items():
+        print(f"{name}: density {density:.6f} g/cc, mass {mass:.3f} g, "
+              f"error {error:+.3f} +- {sigma:.3f} g ({error/(mass - error):+.2e})")
+    if not report:
+        print("No effective materials in this configuration")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('crm-symmetry', help='check the symmetric CRM mode against four copies')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--tol', type=float, default=1e-6, help='end point tolerance in cm')
+
+    p = sub.add_parser('channel-map', help='check the channel map of the symmetric CRM mode')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--tol', type=float, default=1e-6, help='end point tolerance in cm')
+
+    p = sub.add_parser('cathode-mesh', help='check the cathode mesh modes against the union solid')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+    p.add_argument('--points', type=int, default=200000, help='number of random points')
+
+    p = sub.add_parser('effective-materials', help='report the mass errors of mixture slabs')
+    p.add_argument('config', nargs='+', help='configuration file(s)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'crm-symmetry':
+        return 0 if check_crm_symmetry(args.config, args.tol) else 1
+    if args.command == 'channel-map':
+        return 0 if check_channel_map(args.config, args.tol) else 1
+    if args.command == 'cathode-mesh':
+        return 0 if check_cathode_mesh(args.config, args.points) else 1
+    if args.command == 'effective-materials':
+        report_effective_materials(args.config)
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+'''
+Semi-analytic photon visibility maps for ProtoDUNE-VD
+
+Computes, for the centre of every voxel of the liquid argon volume, the
+fraction of isotropically emitted photons reaching each photon detector
+aperture: its solid angle over 4 pi, optionally attenuated by Rayleigh
+scattering as exp(-d / lambda). The photon detectors come from the
+optical map of the built geometry (see opticalmap.py); apertures are
+split into triangles whose solid angles follow from the formula of Van
+Oosterom and Strackee. Voxel chunks are shared out over a process pool
+and the result is written as a memory-mappable float32 table of shape
+(voxels, detectors), voxels in C order over (x, y, z). Shadowing by other
+volumes and reflections are not modelled. All lengths are in cm.
+
+    python visibility.py protodune_vd.cfg --voxels 40 40 40 -o visibility.col
+    python visibility.py protodune_vd.cfg --voxels 20 20 20 --scaling
+'''
+
+import argparse
+import math
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from columnar import read_columns, write_columns
+from opticalmap import APERTURE_ELLIPSE, optical_channels
+from transforms import find_transform
+
+# Rayleigh scattering length of LAr at 128 nm
+RAYLEIGH_LAR = 99.9
+
+_DETECTORS = None
+
+
+def aperture_vertices(table, nedge=32):
+    """Outline vertices (N, K, 3) of every aperture, rectangles as four
+    corners and ellipses as nedge-gons, with their centres (N, 3)."""
+    centre = np.stack([table['ax'], table['ay'], table['az']], axis=1)
+    u = np.stack([table['ux'], table['uy'], table['uz']], axis=1)
+    v = np.stack([table['vx'], table['vy'], table['vz']], axis=1)
+    rect = np.array([[1, 1], [-1, 1], [-1, -1], [1, -1]], dtype=float)
+    phi = 2*math.pi*np.arange(nedge)/nedge
+    ellipse = np.stack([np.cos(phi), np.sin(phi)], axis=1)
+    outlines = []
+    for i, kind in enumerate(table['aperture']):
+        coef = ellipse if kind == APERTURE_ELLIPSE else rect
+        outlines.append(centre[i] + coef[:, :1]*u[i] + coef[:, 1:]*v[i])
+    return centre, outlines
+
+
+def solid_angle(points, centre, vertices):
+    """Solid angle of a planar polygon seen from (M, 3) points.
+
+    The polygon is fanned into triangles around its centre and each
+    triangle uses tan(omega/2) = R0.(R1 x R2) / (r0 r1 r2 + (R0.R1) r2 +
+    (R0.R2) r1 + (R1.R2) r0).
+    """
+    r0 = centre - points
+    r1 = vertices[None, :, :] - points[:, None, :]
+    r2 = np.roll(r1, -1, axis=1)
+    n0 = np.linalg.norm(r0, axis=1)[:, None]
+    n1 = np.linalg.norm(r1, axis=2)
+    n2 = np.roll(n1, -1, axis=1)
+    num = np.einsum('mi,mki->mk', r0, np.cross(r1, r2))
+    den = (n0*n1*n2 + np.einsum('mi,mki->mk', r0, r1)*n2
+           + np.einsum('mi,mki->mk', r0, r2)*n1 + np.einsum('mki,mki->mk', r1, r2)*n0)
+    return np.abs(2*np.arctan2(num, den).sum(axis=1))
+
+
+def visibility(points, detectors):
+    """Visibility (M, N) of N detectors from (M, 3) points, float32."""
+    centres, outlines, normals, faces, rayleigh = detectors
+    out = np.empty((len(points), len(outlines)), dtype=np.float32)
+    for i, vertices in enumerate(outlines):
+        vis = solid_angle(points, centres[i], vertices) / (4*math.pi)
+        d = points - centres[i]
+        if faces[i] < 2:
+            vis = np.where(d @ normals[i] > 0, vis, 0.0)
+        if rayleigh:
+            vis *= np.exp(-np.linalg.norm(d, axis=1) / rayleigh)
+        out[:, i] = vis
+    return out
+
+
+def _init_worker(detectors):
+    global _DETECTORS
+    _DETECTORS = detectors
+
+
+def _work(points):
+    return visibility(points, _DETECTORS)
+
+
+def voxel_centres(lo, hi, shape):
+    """Voxel centres (N, 3) of a box grid, in C order over (x, y, z)."""
+    axes = [lo[k] + (np.arange(shape[k]) + 0.5)*(hi[k] - lo[k])/shape[k] for k in range(3)]
+    return np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+
+
+def liquid_argon_box(world, geom):
+    """Global bounds (lo, hi) of the liquid argon below the gas layer."""
+    cryostat = world.get_builder('detenclosure').get_builder('cryostat')
+    cryo = cryostat.cryo
+    half = np.array([cryo[k].to('cm').magnitude/2 for k in ('Argon_x', 'Argon_y', 'Argon_z')])
+    lo, hi = -half, half.copy()
+    hi[0] -= cryo['HeightGaseousAr'].to('cm').magnitude
+    rot, pos = find_transform(geom.store.structure, geom.world, cryostat.name + '_volume')
+    corners = np.array([[a, b, c] for a in (lo[0], hi[0]) for b in (lo[1], hi[1])
+                        for c in (lo[2], hi[2])]) @ rot.T + pos
+    return corners.min(axis=0), corners.max(axis=0)
+
+
+def compute_map(points, detectors, workers=None, chunk=None):
+    """Visibility of all detectors from all points using a process pool.
+
+    By default the points are split into at least eight chunks per worker
+    (of at most 4096 points) to keep all workers busy.
+    """
+    workers = workers or os.cpu_count()
+    if chunk is None:
+        chunk = max(1, min(4096, -(-len(points) // (8*workers))))
+    out = np.empty((len(points), len(detectors[1])), dtype=np.float32)
+    chunks = [points[i:i + chunk] for i in range(0, len(points), chunk)]
+    if workers == 1:
+        parts = map(lambda p: visibility(p, detectors), chunks)
+        for i, part in enumerate(parts):
+            out[i*chunk:i*chunk + len(part)] = part
+        return out
+    with Pool(workers, initializer=_init_worker, initargs=(detectors,)) as pool:
+        for i, part in enumerate(pool.imap(_work, chunks)):
+            out[i*chunk:i*chunk + len(part)] = part
+    return out
+
+
+def build_detectors(config_files, rayleigh=None, nedge=32):
+    """Build the geometry and return (detectors, table, (lo, hi), world name)."""
+    from validate import build_geometry
+
+    world, geom = build_geometry(config_files)
+    table, _ = optical_channels(geom, geom.world)
+    centres, outlines = aperture_vertices(table, nedge)
+    normals = np.stack([table['nx'], table['ny'], table['nz']], axis=1)
+    detectors = (centres, outlines, normals, np.asarray(table['faces']), rayleigh)
+    return detectors, table, liquid_argon_box(world, geom), geom.world
+
+
+def write_visibility(path, vis, lo, hi, shape, meta=None):
+    meta = dict(meta or {})
+    meta.update({'units': 'cm', 'shape': list(shape), 'lo': [float(a) for a in lo],
+                 'hi': [float(a) for a in hi], 'nopdets': int(vis.shape[1])})
+    write_columns(path, {'visibility': vis}, meta=meta)
+
+
+def load_visibility(path):
+    """Memory-map a visibility table.
+
+    Returns:
+        Tuple of (vis, meta) with vis a read-only (nx, ny, nz, ndet) view
+    """
+    columns, meta = read_columns(path, mmap=True)
+    return columns['visibility'].reshape(tuple(meta['shape']) + (-1,)), meta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', nargs='+', help='configuration file(s)')
+    parser.add_argument('--voxels', nargs=3, type=int, default=[40, 40, 40], metavar=('NX', 'NY', 'NZ'),
+                        help='voxel grid of the liquid argon volume')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--rayleigh', type=float, nargs='?', const=RAYLEIGH_LAR, default=None,
+                        help=f'attenuate with this Rayleigh length in cm (default {RAYLEIGH_LAR})')
+    parser.add_argument('--edges', type=int, default=32, help='polygon edges of round apertures')
+    parser.add_argument('--scaling', action='store_true',
+                        help='time the map with 1, 2, 4, ... workers instead of writing it')
+    parser.add_argument('-o', '--output', default='visibility.col', help='output file')
+    args = parser.parse_args(argv)
+
+    detectors, table, (lo, hi), frame = build_detectors(args.config, args.rayleigh, args.edges)
+    points = voxel_centres(lo, hi, args.voxels)
+    print(f"{len(points)} voxels x {len(table['opdet'])} photon detectors")
+
+    if args.scaling:
+        counts = [1]
+        while counts[-1]*2 <= args.workers:
+            counts.append(counts[-1]*2)
+        if counts[-1] != args.workers:
+            counts.append(args.workers)
+        base = None
+        print(f"{'workers':>8} {'time s':>8} {'speedup':>8}")
+        for n in counts:
+            start = time.perf_counter()
+            compute_map(points, detectors, n)
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            print(f"{n:>8} {elapsed:>8.2f} {base/elapsed:>8.2f}")
+        return 0
+
+    start = time.perf_counter()
+    vis = compute_map(points, detectors, args.workers)
+    elapsed = time.perf_counter() - start
+    write_visibility(args.output, vis, lo, hi, args.voxels,
+                     meta={'frame': frame, 'rayleigh_cm': args.rayleigh, 'edges': args.edges})
+    print(f"Wrote {args.output} in {elapsed:.2f} s with {args.workers} workers")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+'''
+Nearest-wire lookup for ProtoDUNE-VD CRMs
+
+Wires of one plane are parallel with a constant pitch, so the nearest
+wire to a point follows from its coordinate along the pitch direction:
+no tree search is needed. A PlaneIndex maps that coordinate to a wire
+slot with one division and a table lookup, and checks the point lies
+within the wire's extent. A CRMWireIndex holds the U, V and Z planes of
+one CRM and is built from the wire tables or the global channel map.
+All lengths are plain floats in cm.
+'''
+
+import numpy as np
+
+from tpcs import PLANES
+
+
+class PlaneIndex(object):
+    '''
+    Analytic nearest-wire index for one plane of parallel wires in a 2D (y, z) frame.
+    '''
+
+    def __init__(self, wire, p1, p2, channel=None, tol=1e-6):
+        """Build the index from wire numbers and (N, 2) end points.
+
+        Args:
+            wire: Wire numbers
+            p1, p2: End points as (y, z) rows
+            channel: Optional channel numbers of the wires
+            tol: Slack (cm) on the wire extent check
+        """
+        wire = np.asarray(wire)
+        p1 = np.asarray(p1, dtype=float)
+        p2 = np.asarray(p2, dtype=float)
+        if len(wire) == 0:
+            raise ValueError("Cannot index an empty wire plane")
+
+        # Common wire direction; the pitch direction is its normal, oriented
+        # so that the pitch coordinate grows with the wire number
+        d = p2 - p1
+        d *= np.sign(d[:, :1] + (d[:, :1] == 0) * d[:, 1:])
+        d = d.sum(axis=0)
+        self.dirw = d / np.hypot(*d)
+        self.dirp = np.array([-self.dirw[1], self.dirw[0]])
+        s = (0.5*(p1 + p2)) @ self.dirp
+        if len(s) > 1 and np.corrcoef(wire, s)[0, 1] < 0:
+            self.dirp = -self.dirp
+            s = -s
+
+        order = np.argsort(s)
+        s = s[order]
+        steps = np.diff(s)
+        self.pitch = float(np.median(steps)) if len(steps) else 1.0
+        self.s0 = float(s[0])
+        self.s1 = float(s[-1])
+        slot = np.rint((s - self.s0) / self.pitch).astype(np.int64)
+        if len(slot) > 1 and np.any(np.diff(slot) < 1):
+            raise ValueError("Wires are not on a regular pitch")
+
+        # Slot -> row lookup, -1 for missing wires
+        self.lookup = np.full(slot[-1] + 1, -1, dtype=np.int64)
+        self.lookup[slot] = order
+
+        t1, t2 = p1 @ self.dirw, p2 @ self.dirw
+        self.tmin = np.minimum(t1, t2) - tol
+        self.tmax = np.maximum(t1, t2) + tol
+        self.wire = wire
+        self.channel = None if channel is None else np.asarray(channel)
+        self.s = np.empty(len(wire))
+        self.s[order] = s
+        self.neighbours = (0, -1, 1)
+
+    def query(self, y, z):
+        """Nearest wire and signed distance for arrays of points.
+
+        Returns:
+            Tuple of (row, dist): row indexes the wires passed to the
+            constructor (-1 if the point is outside the plane), dist is the
+            signed distance along the pitch direction (NaN outside)
+        """
+        pts = np.stack([np.asarray(y, dtype=float), np.asarray(z, dtype=float)], axis=-1)
+        s = pts @ self.dirp
+        t = pts @ self.dirw
+        slot = np.rint((s - self.s0) / self.pitch).astype(np.int64)
+
+        # Points more than half a pitch beyond the outer wires are outside
+        within = (s >= self.s0 - 0.5*self.pitch) & (s <= self.s1 + 0.5*self.pitch)
+
+        # The slot wire is the nearest one unless the point is past its end
+        # (plane corners, the CRU split line); then try the neighbours
+        best = np.full(len(slot), -1, dtype=np.int64)
+        best_dist = np.full(len(slot), np.inf)
+        for shift in self.neighbours:
+            cand = slot + shift
+            valid = within & (cand >= 0) & (cand < len(self.lookup))
+            row = np.where(valid, self.lookup[np.clip(cand, 0, len(self.lookup) - 1)], -1)
+            safe = np.maximum(row, 0)
+            dist = s - self.s[safe]
+            inside = (row >= 0) & (t >= self.tmin[safe]) & (t <= self.tmax[safe])
+            better = inside & (np.abs(dist) < np.abs(best_dist))
+            best = np.where(better, row, best)
+            best_dist = np.where(better, dist, best_dist)
+        return best, np.where(best >= 0, best_dist, np.nan)
+
+
+class CRMWireIndex(object):
+    '''
+    Nearest-wire index for the U, V and Z planes of one CRM.
+    '''
+
+    def __init__(self, planes):
+        """planes: dict of view name -> PlaneIndex"""
+        self.planes = planes
+
+    @classmethod
+    def from_channel_map(cls, columns, side, crm):
+        """Build the index of one placed CRM from a global channel map.
+
+        Points are then given as global (y, z) coordinates.
+        """
+        sel = (columns['side'] == side) & (columns['crm'] == crm)
+        if not np.any(sel):
+            raise ValueError(f"No CRM {crm} on side {side} in the channel map")
+        planes = {}
+        for iplane, view in enumerate(PLANES):
+            m = sel & (columns['plane'] == iplane)
+            planes[view] = PlaneIndex(
+                columns['wire'][m],
+                np.stack([columns['y1'][m], columns['z1'][m]], axis=1),
+                np.stack([columns['y2'][m], columns['z2'][m]], axis=1),
+                channel=columns['channel'][m])
+        return cls(planes)
+
+    @classmethod
+    def from_wire_tables(cls, builder, quad):
+        """Build the index of one CRM volume from a TPCBuilder's wire tables.
+
+        Points are given in the volTPC frame, as local (y, z) coordinates.
+        """
+        plane, wire, channel, p1, p2 = builder.crm_wire_geometry(quad)
+        planes = {}
+        for iplane, view in enumerate(PLANES):
+            m = plane == iplane
+            planes[view] = PlaneIndex(wire[m], p1[m][:, 1:], p2[m][:, 1:], channel=channel[m])
+        return cls(planes)
+
+    def query(self, y, z):
+        """Nearest wire in each view for arrays of (y, z) points.
+
+        Returns:
+            dict of view -> (wire, dist); wire is -1 for points outside the plane
+        """
+        result = {}
+        for view, index in self.planes.items():
+            row, dist = index.query(y, z)
+            result[view] = (np.where(row >= 0, index.wire[row], -1), dist)
+        return result
+
+    def query_channels(self, y, z):
+        """Like query() but returning the readout channels of the wires in their CRU."""
+        result = {}
+        for view, index in self.planes.items():
+            if index.channel is None:
+                raise ValueError("Index was built without channel numbers")
+            row, dist = index.query(y, z)
+            result[view] = (np.where(row >= 0, index.channel[row], -1), dist)
+        return result
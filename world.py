@@ -3,11 +3,26 @@
 World builder for ProtoDUNE-VD
 '''
 
+import math
+
 import gegede.builder
 from gegede import Quantity as Q
 
+import gdmlext
+from opticalmap import export_optical_map
 from protodune import ProtoDUNEVDBuilder
 
+
+def eval_parameters(value):
+    '''
+    Evaluate a parameter dictionary given as a configuration string.
+    An already evaluated dictionary (in-process builds) is copied as is.
+    '''
+    if isinstance(value, str):
+        return eval(value, {'Q': Q})
+    return dict(value)
+
+
 class WorldBuilder(gegede.builder.Builder):
     '''
     Build the world volume which will contain the full detector
@@ -40,6 +55,7 @@ class WorldBuilder(gegede.builder.Builder):
                  FoamPadding=None, AirThickness=None, DP_CRT_switch=None, 
                  HD_CRT_switch=None,  # Add this line
                  cathode_switch=True, fieldcage_switch=True, arapucamesh_switch=True,  # Add these lines
+                 optical_map_file=None,
                  print_config=False,  
                  print_construct=False,  # Add this line
                  **kwds):
@@ -59,12 +75,12 @@ class WorldBuilder(gegede.builder.Builder):
         self.cathode_switch = cathode_switch  # Add this line
         self.fieldcage_switch = fieldcage_switch  # Add this line
         self.arapucamesh_switch = arapucamesh_switch  # Add this line
+        self.optical_map_file = optical_map_file
 
         # Process TPC parameters
         if tpc_parameters:
             # Create a dictionary from the string with proper Quantity objects
-            eval_globals = {'Q': Q}
-            self.tpc = eval(tpc_parameters, eval_globals)
+            self.tpc = eval_parameters(tpc_parameters)
             
             # Calculate derived TPC parameters
             self.tpc['widthCRP'] = self.tpc['widthPCBActive'] + 2 * self.tpc['borderCRP']
@@ -81,8 +97,7 @@ class WorldBuilder(gegede.builder.Builder):
 
         # Process Cryostat parameters
         if cryostat_parameters:
-            eval_globals = {'Q': Q}
-            self.cryo = eval(cryostat_parameters, eval_globals)
+            self.cryo = eval_parameters(cryostat_parameters)
             
             # Calculate derived parameters
             self.cryo['xLArBuffer'] = (self.cryo['Argon_x'] - 
@@ -111,8 +126,7 @@ class WorldBuilder(gegede.builder.Builder):
 
          # Process Steel Support parameters
         if steel_parameters:
-            eval_globals = {'Q': Q}
-            self.steel = eval(steel_parameters, eval_globals)
+            self.steel = eval_parameters(steel_parameters)
 
             # Calculate detector enclosure dimensions
             self.DetEncX = (self.cryo['Cryostat_x'] + 
@@ -189,31 +203,25 @@ class WorldBuilder(gegede.builder.Builder):
 
         # Process beam parameters
         if beam_parameters:
-            eval_globals = {'Q': Q}
-            self.beam = eval(beam_parameters, eval_globals)
+            self.beam = eval_parameters(beam_parameters)
 
         # Process CRT parameters
         if crt_parameters:
-            eval_globals = {'Q': Q}
-            self.crt = eval(crt_parameters, eval_globals)
+            self.crt = eval_parameters(crt_parameters)
 
         if cathode_parameters:
-            eval_globals = {'Q': Q}
-            self.cathode = eval(cathode_parameters, eval_globals)
+            self.cathode = eval_parameters(cathode_parameters)
 
         if xarapuca_parameters:  # Add this block
-            eval_globals = {'Q': Q}
-            self.xarapuca = eval(xarapuca_parameters, eval_globals)
+            self.xarapuca = eval_parameters(xarapuca_parameters)
             # Calculate derived parameters
             self.xarapuca['FCToArapucaSpaceLat'] = Q('65cm') + self.xarapuca['ArapucaOut_y']
 
         if fieldcage_parameters:  # Add this block
-            eval_globals = {'Q': Q}
-            self.fieldcage = eval(fieldcage_parameters, eval_globals)
+            self.fieldcage = eval_parameters(fieldcage_parameters)
 
         if pmt_parameters:  # Add this block
-            eval_globals = {'Q': Q}
-            self.pmt = eval(pmt_parameters, eval_globals)
+            self.pmt = eval_parameters(pmt_parameters)
 
         self.print_construct = print_construct
         # Mark as configured
@@ -407,6 +415,58 @@ class WorldBuilder(gegede.builder.Builder):
                                                 ("Nitrogen", 4),
                                                 ("Oxygen", 15)))
 
+        # Mixtures of homogenized sub-detector parts, after all base materials
+        self.effective_mass_report = self.construct_effective_materials(geom)
+
+    def construct_effective_materials(self, geom):
+        """Define the mixtures requested by builders in effective_materials.
+
+        A builder replacing a detailed part by a homogeneous volume publishes
+        {material: spec} where spec holds the volume (cm^3) of the slab, the
+        'fill' material around the parts and the (material, volume) lists of
+        the 'components' used for the mixture and of the 'detailed' parts, as
+        measured on the detailed build, with their standard errors in the
+        optional 'detailed_error'. The mixture keeps the mass of the
+        components and fill; the mass error of the slab against the detailed
+        parts is printed with print_construct.
+
+        Returns:
+            dict of material -> (density in g/cc, mass in g, mass error in g,
+            standard error of the mass error in g)
+        """
+        def density(name):
+            return float(geom.store.matter[name].density.to('g/cc').magnitude)
+
+        def mass(spec, parts):
+            solid = sum(vol for _, vol in parts)
+            return ([(mat, density(mat)*vol) for mat, vol in parts] +
+                    [(spec['fill'], density(spec['fill'])*(spec['volume'] - solid))])
+
+        report = {}
+        builders = list(self.builders.values())
+        while builders:
+            builder = builders.pop(0)
+            builders.extend(builder.builders.values())
+            for name, spec in getattr(builder, 'effective_materials', {}).items():
+                if name in geom.store.matter:
+                    continue
+                masses = mass(spec, spec['components'])
+                total = sum(m for _, m in masses)
+                fractions = {}
+                for mat, m in masses:
+                    fractions[mat] = fractions.get(mat, 0.0) + m/total
+                geom.matter.Mixture(name, density=Q(total/spec['volume'], 'g/cc'),
+                                    components=tuple(fractions.items()))
+                detailed = sum(m for _, m in mass(spec, spec['detailed']))
+                # A part measured too large displaces as much fill
+                sigma = math.sqrt(sum(((density(mat) - density(spec['fill']))*err)**2
+                                      for mat, err in spec.get('detailed_error', [])))
+                report[name] = (total/spec['volume'], total, total - detailed, sigma)
+                if self.print_construct:
+                    print(f"Effective material {name}: density {total/spec['volume']:.6f} g/cc, "
+                          f"mass {total:.3f} g, error {total - detailed:+.3f} +- {sigma:.3f} g "
+                          f"({(total - detailed)/detailed:+.2e})")
+        return report
 
     def construct_rotations(self, geom):
         """Define standard rotations used throughout the geometry"""
@@ -445,6 +505,14 @@ class WorldBuilder(gegede.builder.Builder):
                 'rMinus90AboutYMinus90AboutX',
                 x='270deg', y='270deg', z='0deg'
             ),
+            'rPlus180AboutYPlus90AboutX': geom.structure.Rotation(
+                'rPlus180AboutYPlus90AboutX',
+                x='90deg', y='180deg', z='0deg'
+            ),
+            'rMinus90AboutYPlus90AboutX': geom.structure.Rotation(
+                'rMinus90AboutYPlus90AboutX',
+                x='90deg', y='270deg', z='0deg'
+            ),
             
             # 180 degree rotations
             'rPlus180AboutX': geom.structure.Rotation(
@@ -564,4 +632,23 @@ class WorldBuilder(gegede.builder.Builder):
         # Add the cryostat placement to the detector enclosure volume
         volume.placements.append(pd_place.name)
 
-
+        # Let the GDML exporter write the registered replicas of this geometry
+        if gdmlext.replicas_of(geom):
+            gdmlext.install(geom)
+
+        # Export the global channel map once the full placement tree exists
+        if self.tpc.get('channel_map_file'):
+            tpc_builder = pd_builder.get_builder('cryostat').get_builder('tpcs')
+            tpc_builder.export_channel_map(geom, volume, self.tpc['channel_map_file'])
+
+        # Export which cathode voids host X-ARAPUCAs
+        if self.cathode and self.cathode.get('void_occupancy_file'):
+            cathode_builder = pd_builder.get_builder('cryostat').get_builder('cathode')
+            cathode_builder.export_void_occupancy(geom, volume, self.cathode['void_occupancy_file'])
+
+        # Export the photon detector positions, normals and areas
+        if self.optical_map_file:
+            table = export_optical_map(geom, volume, self.optical_map_file)
+            if self.print_construct:
+                print(f"Wrote optical map with {len(table['opdet'])} photon detectors "
+                      f"to {self.optical_map_file}")
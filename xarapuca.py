@@ -3,8 +3,71 @@
 xarapuca builder for ProtoDUNE-VD geometry
 '''
 
+import math
+
 import gegede.builder
+import gegede.construct
 from gegede import Quantity as Q
+import numpy as np
+
+from gdmlext import register_replica
+from navigation import placed_volumes
+from pdlayout import evaluate, flatten_parameters
+
+# Double-sided X-ARAPUCAs of one cathode module, relative to the module
+# centre; in the second module row the last one moves next to the third
+CATHODE_XARAPUCA_LAYOUT = [
+    {'slot': 0, 'type': 'double', 'rot': 'rPlus90AboutXPlus90AboutZ',
+     'x': {'module_x': 1},
+     'y': {'module_y': 1, 'widthCathodeVoid': -2, 'CathodeBorder': -2, 'GapPD': 1, 'ArapucaOut_x': 0.5},
+     'z': {'module_z': 1, 'lengthCathodeVoid': 0.5, 'CathodeBorder': 1}},
+    {'slot': 1, 'type': 'double', 'rot': 'rPlus90AboutXPlus90AboutZ',
+     'x': {'module_x': 1},
+     'y': {'module_y': 1, 'CathodeBorder': -1, 'GapPD': -1, 'ArapucaOut_x': -0.5},
+     'z': {'module_z': 1, 'lengthCathodeVoid': -1.5, 'CathodeBorder': -2}},
+    {'slot': 2, 'type': 'double', 'rot': 'rPlus90AboutXPlus90AboutZ',
+     'x': {'module_x': 1},
+     'y': {'module_y': 1, 'CathodeBorder': 1, 'GapPD': 1, 'ArapucaOut_x': 0.5},
+     'z': {'module_z': 1, 'lengthCathodeVoid': 1.5, 'CathodeBorder': 2}},
+    {'slot': 3, 'type': 'double', 'rot': 'rPlus90AboutXPlus90AboutZ',
+     'x': {'module_x': 1},
+     'y': {'module_y': 1, 'widthCathodeVoid': 2, 'CathodeBorder': 2, 'GapPD': -1, 'ArapucaOut_x': -0.5},
+     'z': {'module_z': 1, 'lengthCathodeVoid': -0.5, 'CathodeBorder': -1}},
+    {'slot': 3, 'type': 'double', 'rot': 'rPlus90AboutXPlus90AboutZ', 'when': {'module_iy': 1},
+     'x': {'module_x': 1},
+     'y': {'module_y': 1, 'CathodeBorder': 1, 'GapPD': 1, 'ArapucaOut_x': 0.5},
+     'z': {'module_z': 1, 'lengthCathodeVoid': -0.5, 'CathodeBorder': -1}},
+]
+
+# Single-sided X-ARAPUCAs on the lateral walls, relative to the frame
+# centre; neighbours along x are 1 cm further apart to avoid overlaps.
+# 'facing' is the direction along y of the window side
+LATERAL_XARAPUCA_LAYOUT = [
+    {'slot': i + 4*side, 'type': 'single', 'rot': rot, 'facing': 1 - 2*side,
+     'x': dict(x, frame_x=1),
+     'y': {'frame_y': 1} if side == 0 else
+          {'frame_y': 1, 'widthCathode': 2, 'CathodeFrameToFC': 2, 'FCToArapucaSpaceLat': 2, 'ArapucaOut_y': -1},
+     'z': {'frame_z': 1}}
+    for side, rot in enumerate(('rIdentity', 'rPlus180AboutX'))
+    for i, x in enumerate(({'Upper_FirstFrameVertDist': 1},
+                           {'Upper_FirstFrameVertDist': 1, 'VerticalPDdist': -1, 'cm': -1.0},
+                           {'Lower_FirstFrameVertDist': -1},
+                           {'Lower_FirstFrameVertDist': -1, 'VerticalPDdist': 1, 'cm': 1.0}))
+]
+
+# Shared rotations, by (x, y, z) angles in degrees, of the membrane mesh
+# frame parts
+MEMBRANE_MESH_ROTATIONS = {
+    (0, 0, 0): 'rIdentity',
+    (90, 0, 0): 'rPlus90AboutX',
+    (0, 90, 0): 'rot90AboutY',
+    (90, 90, 0): 'rPlus90AboutY',
+    (90, 180, 0): 'rPlus180AboutYPlus90AboutX',
+    (90, 270, 0): 'rMinus90AboutYPlus90AboutX',
+}
+
+# Mesh rotation in front of a lateral X-ARAPUCA with the given rotation
+LATERAL_MESH_ROTATION = {'rIdentity': 'rot90AboutY', 'rPlus180AboutX': 'rot05'}
 
 class XARAPUCABuilder(gegede.builder.Builder):
     '''
@@ -93,7 +156,78 @@ class XARAPUCABuilder(gegede.builder.Builder):
 
         self._configured = True
 
-    def construct_cathode_mesh(self, geom):
+    def construct_mesh_slab(self, geom, name, shape, material, components, construct_detailed):
+        """Mesh module as one homogeneous volume of a steel/LAr mixture.
+
+        Args:
+            name: Name of the module volume
+            shape: Box shape of the module
+            material: Name of the mixture
+            components: List of (material, volume) of the mesh parts
+            construct_detailed: Callable building the detailed module in a
+                given geometry; its parts are measured in a scratch geometry
+        """
+        def cm3(q):
+            return float(q.to('cm**3').magnitude)
+
+        scratch = gegede.construct.Geometry()
+        measured = placed_volumes(scratch, construct_detailed(scratch))
+        measured = [(mat, vol, err) for mat, (vol, err) in measured.items() if mat != 'LAr']
+        self.effective_materials[material] = {
+            'volume': cm3(8*shape.dx*shape.dy*shape.dz),
+            'fill': 'LAr',
+            'components': [(mat, cm3(vol)) for mat, vol in components],
+            'detailed': [(mat, vol) for mat, vol, _ in measured],
+            'detailed_error': [(mat, err) for mat, _, err in measured],
+        }
+        return geom.structure.Volume(name, material=material, shape=shape)
+
+    def place_cathode_mesh_replica(self, geom, mesh_vol, label, rod_vol, rot, axis, number, side):
+        """Place one rod orientation of the cathode mesh as a replica.
+
+        The rods sit in LAr cells of one rod separation along axis, starting
+        at the module edge; the cells fill a grid volume on one side
+        (side = -1 or 1 along x) of the module mid-plane.
+        """
+        radius = self.params['CathodeArapucaMeshRodRadius']
+        sep = self.params['CathodeArapucaMeshRodSeparation']
+        offset = self.params[f'CathodeArapucaMesh_{label}Offset']
+        half = {'y': self.cathode['widthCathodeVoid']/2, 'z': self.cathode['lengthCathodeVoid']/2}
+        if number*sep > 2*half[axis] or offset < radius or offset > sep - radius:
+            raise ValueError(f"Cathode X-ARAPUCA {label} mesh rods do not fit a replica")
+
+        def box(name, extent):
+            dims = dict(half)
+            dims[axis] = extent/2
+            return geom.shapes.Box(name, dx=radius, dy=dims['y'], dz=dims['z'])
+
+        def shift(value):
+            pos = {'x': Q('0cm'), 'y': Q('0cm'), 'z': Q('0cm')}
+            pos[axis] = value
+            return pos
+
+        cell_vol = geom.structure.Volume(
+            f"volCathodeArapucaMeshCell_{label}", material="LAr",
+            shape=box(f"CathodeArapucaMeshCell_{label}", sep))
+        cell_vol.placements.append(geom.structure.Placement(
+            f"placeCathodeMeshRod_{label}", volume=rod_vol, rot=rot,
+            pos=geom.structure.Position(f"posCathodeMeshRod_{label}",
+                                        **shift(offset - sep/2))).name)
+
+        grid_vol = geom.structure.Volume(
+            f"volCathodeArapucaMeshGrid_{label}", material="LAr",
+            shape=box(f"CathodeArapucaMeshGrid_{label}", number*sep))
+        cell_place = geom.structure.Placement(f"placeCathodeMeshCell_{label}", volume=cell_vol)
+        grid_vol.placements.append(cell_place.name)
+        register_replica(geom, cell_place, 'replica', axis, number, sep.to('cm').magnitude)
+
+        grid_pos = shift(number*sep/2 - half[axis])
+        grid_pos['x'] = side*radius
+        mesh_vol.placements.append(geom.structure.Placement(
+            f"placeCathodeMeshGrid_{label}", volume=grid_vol,
+            pos=geom.structure.Position(f"posCathodeMeshGrid_{label}", **grid_pos)).name)
+
+    def construct_cathode_mesh(self, geom, mesh_mode=None):
         """Construct mesh for double-sided cathode X-ARAPUCAs"""
         
 
@@ -105,6 +239,18 @@ class XARAPUCABuilder(gegede.builder.Builder):
             dz=self.cathode['lengthCathodeVoid']/2.
         )
 
+        if (mesh_mode or self.params.get('mesh_mode', 'detailed')) == 'homogeneous':
+            # Steel volume from the rod count, cross section and length
+            r = self.params['CathodeArapucaMeshRodRadius']
+            section = math.pi * r**2
+            steel = section * (
+                self.params['CathodeArapucaMeshNumberOfBars_vertical']*self.cathode['widthCathodeVoid'] +
+                self.params['CathodeArapucaMeshNumberOfBars_horizontal']*self.cathode['lengthCathodeVoid'])
+            return self.construct_mesh_slab(
+                geom, "volCathodeArapucaMesh", module_shape, "CathodeArapucaMeshMixture",
+                [("STEEL_STAINLESS_Fe7Cr2Ni", steel)],
+                lambda scratch: self.construct_cathode_mesh(scratch, 'detailed'))
+
         # Create vertical rod shape
         vert_rod = geom.shapes.Tubs(
             "CathodeArapucaMeshRod_vertical",
@@ -128,18 +274,32 @@ class XARAPUCABuilder(gegede.builder.Builder):
             shape=module_shape
         )
 
-        # print(int(self.params['CathodeArapucaMeshNumberOfBars_vertical']),int(self.params['CathodeArapucaMeshNumberOfBars_horizontal']))
+        # One logical volume per rod orientation, shared by all rods
+        vert_rod_vol = geom.structure.Volume(
+            "volCathodeArapucaMeshRod_vertical",
+            material="STEEL_STAINLESS_Fe7Cr2Ni",
+            shape=vert_rod
+        )
+        horiz_rod_vol = geom.structure.Volume(
+            "volCathodeArapucaMeshRod_horizontal",
+            material="STEEL_STAINLESS_Fe7Cr2Ni",
+            shape=horiz_rod
+        )
 
-        # Add vertical rods
         n_vert = int(self.params['CathodeArapucaMeshNumberOfBars_vertical'])
+        n_horiz = int(self.params['CathodeArapucaMeshNumberOfBars_horizontal'])
+        rod_mode = self.params.get('cathode_mesh_rod_mode', 'shared')
+        if rod_mode == 'replica':
+            self.place_cathode_mesh_replica(geom, mesh_vol, 'vertical', vert_rod_vol, 'rPlus90AboutX',
+                                            'z', n_vert, -1)
+            self.place_cathode_mesh_replica(geom, mesh_vol, 'horizontal', horiz_rod_vol, None,
+                                            'y', n_horiz, 1)
+            return mesh_vol
+        if rod_mode != 'shared':
+            raise ValueError(f"Unknown cathode_mesh_rod_mode: {rod_mode}")
+
+        # Add vertical rods
         for i in range(n_vert):
-            # Create volume for vertical rod
-            vert_rod_vol = geom.structure.Volume(
-                f"volCathodeArapucaMeshRod_vertical_{i}",
-                material="STEEL_STAINLESS_Fe7Cr2Ni",
-                shape=vert_rod
-            )
-            
             # Place vertical rod in module
             pos = geom.structure.Position(
                 f"posCathodeMeshRod_vertical{i}",
@@ -159,15 +319,7 @@ class XARAPUCABuilder(gegede.builder.Builder):
             mesh_vol.placements.append(place.name)
 
         # Add horizontal rods  
-        n_horiz = int(self.params['CathodeArapucaMeshNumberOfBars_horizontal'])
         for i in range(n_horiz):
-            # Create volume for horizontal rod
-            horiz_rod_vol = geom.structure.Volume(
-                f"volCathodeArapucaMeshRod_horizontal_{i}",
-                material="STEEL_STAINLESS_Fe7Cr2Ni", 
-                shape=horiz_rod
-            )
-
             # Place horizontal rod in module
             pos = geom.structure.Position(
                 f"posCathodeMeshRod_horizontal{i}",
@@ -185,10 +337,50 @@ class XARAPUCABuilder(gegede.builder.Builder):
             )
             mesh_vol.placements.append(place.name)
 
-        self.add_volume(mesh_vol)
         return mesh_vol
 
-    def construct_membrane_mesh(self, geom):
+    def construct_membrane_mesh_parts(self, geom, mesh_vol, first, mesh_params, frame_x, assembly=False):
+        """Membrane mesh frame as separate tube and corner volumes.
+
+        The parts of the union solid are placed directly in the mesh
+        volume, or in a "volMeshunion" assembly with assembly=True, using
+        the shared rotations of MEMBRANE_MESH_ROTATIONS.
+        """
+        part_vols = {}
+
+        def part_vol(shape):
+            if shape.name not in part_vols:
+                part_vols[shape.name] = geom.structure.Volume(
+                    "vol" + shape.name, material="STEEL_STAINLESS_Fe7Cr2Ni", shape=shape)
+            return part_vols[shape.name]
+
+        parts = [(first, (Q('0cm'), Q('0cm'), Q('0cm')), {'x': '0deg', 'y': '0deg', 'z': '0deg'})]
+        parts += [(p['second'], p['pos'], p['rot']) for p in mesh_params]
+
+        if assembly:
+            mother = geom.structure.Volume("volMeshunion", material=None, shape=None)
+            shift = Q('0cm')
+        else:
+            mother, shift = mesh_vol, frame_x
+        for i, (shape, (x, y, z), rot) in enumerate(parts):
+            angles = tuple(int(Q(rot[a]).to('deg').magnitude) for a in 'xyz')
+            place = geom.structure.Placement(
+                f"meshframe_part{i}_place",
+                volume=part_vol(shape),
+                pos=geom.structure.Position(f"meshframe_part{i}_pos", x=x + shift, y=y, z=z),
+                rot=MEMBRANE_MESH_ROTATIONS[angles])
+            mother.placements.append(place.name)
+
+        if assembly:
+            mesh_vol.placements.append(
+                geom.structure.Placement(
+                    "meshframe_place",
+                    volume=mother,
+                    pos=geom.structure.Position("meshframe_pos", x=frame_x, y=Q('0cm'), z=Q('0cm'))
+                ).name
+            )
+
+    def construct_membrane_mesh(self, geom, mesh_mode=None):
         """Construct mesh for membrane X-ARAPUCAs following PERL implementation"""
         
         # Create module box
@@ -203,6 +395,20 @@ class XARAPUCABuilder(gegede.builder.Builder):
             ))/2 
         )
 
+        if (mesh_mode or self.params.get('mesh_mode', 'detailed')) == 'homogeneous':
+            # Steel volume of the frame (four tubes and four quarter tori)
+            # and of the inner rods
+            frame = math.pi * self.params['MeshOuterRadius']**2 * (
+                2*self.params['MeshTubeLength_vertical'] + 2*self.params['MeshTubeLength_horizontal'] +
+                2*math.pi*self.params['MeshTorRad'])
+            rods = math.pi * self.params['MeshRodOuterRadius']**2 * (
+                self.params['MeshInnerStructureNumberOfBars_vertical']*self.params['MeshInnerStructureLength_vertical'] +
+                self.params['MeshInnerStructureNumberOfBars_horizontal']*self.params['MeshInnerStructureLength_horizontal'])
+            return self.construct_mesh_slab(
+                geom, "volArapucaMesh", module, "ArapucaMeshMixture",
+                [("STEEL_STAINLESS_Fe7Cr2Ni", frame + rods)],
+                lambda scratch: self.construct_membrane_mesh(scratch, 'detailed'))
+
         # Create main mesh volume
         mesh_vol = geom.structure.Volume(
             "volArapucaMesh",
@@ -291,54 +497,62 @@ class XARAPUCABuilder(gegede.builder.Builder):
             }
         ]
 
-        # Build frame through loop
-        mesh_shape = tube_vert  # Start with vertical tube
-        for i, params in enumerate(mesh_params, 1):
-            pos = geom.structure.Position(
-                f"Mesh{params['name']}", 
-                x=params['pos'][0], 
-                y=params['pos'][1], 
-                z=params['pos'][2]
-            )
-            
-            rot = geom.structure.Rotation(
-                f"Meshrot{i}", 
-                x=params['rot']['x'], 
-                y=params['rot']['y'], 
-                z=params['rot']['z']
-            )
-            
-            mesh_shape = geom.shapes.Boolean(
-                f"Meshunion{i}",
-                type='union',
-                first=mesh_shape,
-                second=params['second'],
-                pos=pos,
-                rot=rot
-            )
+        frame_x = self.params['MeshTubeLength_horizontal']/2 + self.params['MeshTorRad']
+        frame_mode = self.params.get('membrane_mesh_mode', 'union')
+        if frame_mode in ('daughters', 'assembly'):
+            self.construct_membrane_mesh_parts(geom, mesh_vol, tube_vert, mesh_params, frame_x,
+                                               frame_mode == 'assembly')
+        elif frame_mode == 'union':
+            # Build frame through loop
+            mesh_shape = tube_vert  # Start with vertical tube
+            for i, params in enumerate(mesh_params, 1):
+                pos = geom.structure.Position(
+                    f"Mesh{params['name']}", 
+                    x=params['pos'][0], 
+                    y=params['pos'][1], 
+                    z=params['pos'][2]
+                )
+                
+                rot = geom.structure.Rotation(
+                    f"Meshrot{i}", 
+                    x=params['rot']['x'], 
+                    y=params['rot']['y'], 
+                    z=params['rot']['z']
+                )
+                
+                mesh_shape = geom.shapes.Boolean(
+                    f"Meshunion{i}",
+                    type='union',
+                    first=mesh_shape,
+                    second=params['second'],
+                    pos=pos,
+                    rot=rot
+                )
 
-        mesh_final = mesh_shape  # Final result
+            mesh_final = mesh_shape  # Final result
 
-        # Add frame
-        mesh_frame = geom.structure.Volume(
-            "volMeshunion",
-            material="STEEL_STAINLESS_Fe7Cr2Ni",
-            shape=mesh_final
-        )
+            # Add frame
+            mesh_frame = geom.structure.Volume(
+                "volMeshunion",
+                material="STEEL_STAINLESS_Fe7Cr2Ni",
+                shape=mesh_final
+            )
 
-        # Place frame in mesh volume
-        mesh_vol.placements.append(
-            geom.structure.Placement(
-            "meshframe_place",
-            volume=mesh_frame,
-            pos=geom.structure.Position(
-            "meshframe_pos",
-            x=self.params['MeshTubeLength_horizontal']/2 + self.params['MeshTorRad'],
-            y=Q('0cm'),
-            z=Q('0cm')
+            # Place frame in mesh volume
+            mesh_vol.placements.append(
+                geom.structure.Placement(
+                "meshframe_place",
+                volume=mesh_frame,
+                pos=geom.structure.Position(
+                "meshframe_pos",
+                x=frame_x,
+                y=Q('0cm'),
+                z=Q('0cm')
+                )
+                ).name
             )
-            ).name
-        )
+        else:
+            raise ValueError(f"Unknown membrane_mesh_mode: {frame_mode}")
 
 
 
@@ -398,7 +612,6 @@ class XARAPUCABuilder(gegede.builder.Builder):
             ).name
             )
 
-        self.add_volume(mesh_vol)
         return mesh_vol
 
 
@@ -489,113 +702,71 @@ class XARAPUCABuilder(gegede.builder.Builder):
         self.add_volume(double_wall_vol)
         self.add_volume(double_window_vol)
 
-        self.construct_cathode_mesh(geom)
-        self.construct_membrane_mesh(geom)
+        # Meshes in full detail, or as homogeneous slabs whose mixtures the
+        # world builder defines from self.effective_materials
+        self.effective_materials = {}
+        self.add_volume(self.construct_cathode_mesh(geom))
+        self.add_volume(self.construct_membrane_mesh(geom))
         
 
-    def calculate_cathode_positions(self, idx, cathode_center_x, cathode_center_y, cathode_center_z):
-        '''Calculate positions of X-ARAPUCAs over the cathode'''
-        positions = []
-        
-        for i in range(4):
-            # Calculate x,y,z position for each ARAPUCA
-            # Use the existing position calculations from PERL
-            x = cathode_center_x  
-            if i == 0:
-                y = -2*self.cathode['widthCathodeVoid'] - 2.0*self.cathode['CathodeBorder'] + self.params['GapPD'] + 0.5*self.params['ArapucaOut_x'] + cathode_center_y
-                z = 0.5*self.cathode['lengthCathodeVoid'] + self.cathode['CathodeBorder'] + cathode_center_z
-            elif i == 1:
-                y = -self.cathode['CathodeBorder'] - self.params['GapPD'] - 0.5*self.params['ArapucaOut_x'] + cathode_center_y
-                z = -1.5*self.cathode['lengthCathodeVoid'] - 2.0*self.cathode['CathodeBorder'] + cathode_center_z
-            elif i == 2:
-                y = -(-self.cathode['CathodeBorder'] - self.params['GapPD'] - 0.5*self.params['ArapucaOut_x']) + cathode_center_y
-                z = -(-1.5*self.cathode['lengthCathodeVoid'] - 2.0*self.cathode['CathodeBorder']) + cathode_center_z
-            else:
-                y = -(-2*self.cathode['widthCathodeVoid'] - 2.0*self.cathode['CathodeBorder'] + self.params['GapPD'] + 0.5*self.params['ArapucaOut_x']) + cathode_center_y # Mirror of position 0
-                z = -(0.5*self.cathode['lengthCathodeVoid'] + self.cathode['CathodeBorder']) + cathode_center_z # Mirror of position 0
-                
-            if (idx == 1 and i == 3):
-                y = -(-self.cathode['CathodeBorder'] - self.params['GapPD'] - 0.5*self.params['ArapucaOut_x']) + cathode_center_y
+    def layout_parameters(self, **extra):
+        """Named X-ARAPUCA and cathode parameters for the layout tables."""
+        params = flatten_parameters(self.cathode)
+        params.update(flatten_parameters(self.params))
+        params.update(extra)
+        return params
 
-            positions.append((x,y,z))
-            
-        return positions
-
-    def calculate_lateral_positions(self, frame_center_x, frame_center_y, frame_center_z):
-        '''Calculate positions of X-ARAPUCAs on lateral walls
-        
-        Returns:
-            List of tuples (x, y, y_sens, z, rotation) containing:
-            - x,y,z: Main ARAPUCA position
-            - y_sens: Sensor Y position with offset
-            - rotation: Rotation reference name
-        '''
-        positions = []
+    def cathode_layout(self, n_y, n_z, cathode_x, base_y, base_z):
+        """X-ARAPUCAs of all cathode modules, from xarapuca_parameters
+        'cathode_layout' (default CATHODE_XARAPUCA_LAYOUT).
 
-        # print(self.params['VerticalPDdist'])
-
-        # Calculate positions for 8 ARAPUCAs    
-        x = frame_center_x
+        Args:
+            n_y, n_z: Number of cathode modules along y and z
+            cathode_x, base_y, base_z: Centre of the first module
 
-        # print(frame_center_x, self.params['Upper_FirstFrameVertDist'], self.params['VerticalPDdist'], self.params['Lower_FirstFrameVertDist'])
+        Returns:
+            Structured array of pdlayout.PD_DTYPE with module-major copies
+            (copy = iy*n_z + iz)
+        """
+        iy, iz = np.divmod(np.arange(n_y*n_z), n_z)
+        params = self.layout_parameters(
+            module_iy=iy, module_iz=iz,
+            module_x=np.full(n_y*n_z, cathode_x.to('cm').magnitude),
+            module_y=base_y.to('cm').magnitude + iy*self.cathode['widthCathode'].to('cm').magnitude,
+            module_z=base_z.to('cm').magnitude + iz*self.cathode['lengthCathode'].to('cm').magnitude)
+        return evaluate(self.params.get('cathode_layout', CATHODE_XARAPUCA_LAYOUT), params)
+
+    def lateral_layout(self, frame_center_x, frame_center_y, frame_center_z):
+        """X-ARAPUCAs on the lateral walls, from xarapuca_parameters
+        'lateral_layout' (default LATERAL_XARAPUCA_LAYOUT).
 
-        for i in range(8):
-            
-            y = frame_center_y
-            z = frame_center_z
-            
-            # Handle Y positions and rotations
-            if i < 4:
-                # Left side
-                y_sens = (y + 0.5*self.params['ArapucaOut_y'] - 
-                        0.5*self.params['ArapucaAcceptanceWindow_y'] - 
-                        Q('0.01cm'))
-                rotation = 'rIdentity'
-            else:
-                # Right side - adjust Y position
-                y = (y + 2*self.cathode['widthCathode'] + 
-                    2*(self.params['CathodeFrameToFC'] + 
-                        self.params['FCToArapucaSpaceLat'] - 
-                        self.params['ArapucaOut_y']/2))
-                y_sens = (y - 0.5*self.params['ArapucaOut_y'] + 
-                        0.5*self.params['ArapucaAcceptanceWindow_y'] + 
-                        Q('0.01cm'))
-                rotation = 'rPlus180AboutX'
-
-            # Handle X positions
-            if i == 0 or i == 4:
-                # First tile position from top anode
-                x = frame_center_x + self.params['Upper_FirstFrameVertDist']
-            elif i == 1 or i == 5:
-                # Second tile position 
-                x -= self.params['VerticalPDdist'] + Q('1cm') # need to add 1cm to avoid overlapping
-            elif i == 2 or i == 6:
-                # First tile position from bottom anode
-                x = frame_center_x - self.params['Lower_FirstFrameVertDist']
-            elif i == 3 or i == 7:
-                # Last tile position
-                x += self.params['VerticalPDdist'] + Q('1cm') # need to add 1cm to avoid overlapping
-
-            # Store all position information
-            positions.append({
-                'index': i,
-                'x': x,
-                'y': y, 
-                'y_sens': y_sens,
-                'z': z,
-                'rotation': rotation
-            })
-
-        return positions
-    
-    def place_lateral_xarapucas(self, geom, volume, frame_center_x, frame_center_y, frame_center_z):
-        '''Place the lateral ARAPUCAs in the given volume'''
+        Returns:
+            Tuple of the pdlayout.PD_DTYPE array and the facing (+1 or -1
+            along y) of each X-ARAPUCA
+        """
+        rows = self.params.get('lateral_layout', LATERAL_XARAPUCA_LAYOUT)
+        params = self.layout_parameters(frame_x=frame_center_x, frame_y=frame_center_y,
+                                        frame_z=frame_center_z)
+        pds = evaluate(rows, params)
+        return pds, np.array([rows[r].get('facing', 1) for r in pds['row']])
+
+    def place_lateral_xarapucas(self, geom, volume, frame_center_x, frame_center_y, frame_center_z,
+                                gas=None):
+        '''Place the lateral ARAPUCAs in the given volume
+
+        gas, if given, is (gas volume, its x position in volume, slots): the
+        X-ARAPUCAs of these slots are placed in the gas volume instead.
+        '''
         
-        positions = self.calculate_lateral_positions(
-            frame_center_x,
-            frame_center_y, 
-            frame_center_z
-        )
+        pds, facing = self.lateral_layout(frame_center_x, frame_center_y, frame_center_z)
+        gas_vol, gas_x, gas_slots = gas or (None, Q('0cm'), ())
+        gas_x = gas_x.to('cm').magnitude
+
+        # Window and mesh are shifted from the X-ARAPUCA centre towards
+        # the side it faces
+        window_shift = (0.5*self.params['ArapucaOut_y'] - 0.5*self.params['ArapucaAcceptanceWindow_y'] -
+                        Q('0.01cm')).to('cm').magnitude
+        mesh_shift = self.params['Distance_Mesh_Window'].to('cm').magnitude
 
         lat_z = 0
 
@@ -603,53 +774,51 @@ class XARAPUCABuilder(gegede.builder.Builder):
         window_vol = self.get_volume('volXARAPUCAWindow')
         mesh_vol = self.get_volume('volArapucaMesh')
 
-        for pos in positions:
-            i = pos['index']
+        for pd, side in zip(pds, facing):
+            i = int(pd['slot'])
+            mother, dx = (gas_vol, gas_x) if i in gas_slots else (volume, 0)
+            x = Q(float(pd['x'] - dx), 'cm')
+            y, z = (Q(float(pd[a]), 'cm') for a in 'yz')
 
-            # print(pos['x'], pos['y'], pos['z'])
-            
             # Place main ARAPUCA volume
             main_pos = geom.structure.Position(
                 f"posArapuca{i}-Lat-{lat_z}",
-                x=pos['x'],
-                y=pos['y'],
-                z=pos['z'])
+                x=x,
+                y=y,
+                z=z)
                 
             main_place = geom.structure.Placement(
                 f"placeArapuca{i}-Lat-{lat_z}",
                 volume=wall_vol,
                 pos=main_pos,
-                rot=pos['rotation'])
+                rot=str(pd['rot']))
             
-            volume.placements.append(main_place.name)
+            mother.placements.append(main_place.name)
 
             # Place sensitive volume 
             sens_pos = geom.structure.Position(
                 f"posOpArapuca{i}-Lat-{lat_z}",
-                x=pos['x'],
-                y=pos['y_sens'],
-                z=pos['z'])
+                x=x,
+                y=Q(float(pd['y'] + side*window_shift), 'cm'),
+                z=z)
                 
             sens_place = geom.structure.Placement(
                 f"placeOpArapuca{i}-Lat-{lat_z}",
                 volume=window_vol,
                 pos=sens_pos)
                 
-            volume.placements.append(sens_place.name)
+            mother.placements.append(sens_place.name)
 
             if hasattr(self, 'arapucamesh_switch') and self.arapucamesh_switch:
-                mesh_y = pos['y'] + self.params['Distance_Mesh_Window'] if i<4 else \
-                        pos['y'] - self.params['Distance_Mesh_Window']
-                        
                 mesh_place = geom.structure.Placement(
                     f"lateral_arapuca_mesh_place_{i}",
                     volume=mesh_vol,
                     pos=geom.structure.Position(
                         f"lateral_arapuca_mesh_pos_{i}",
-                        x=pos['x'], y=mesh_y, z=pos['z']
+                        x=x, y=Q(float(pd['y'] + side*mesh_shift), 'cm'), z=z
                     ),
-                    rot='rot90AboutY' if i<4 else 'rot05'
+                    rot=LATERAL_MESH_ROTATION[str(pd['rot'])]
                 )
-                volume.placements.append(mesh_place.name)
+                mother.placements.append(mesh_place.name)
 
        
\ No newline at end of file